@@ -1,22 +1,55 @@
-from flask import Flask, jsonify, request, send_from_directory, send_file
+from flask import Flask, jsonify, request, send_from_directory, send_file, Response
 from flask_cors import CORS
+import io
 import os
 import json
 import webbrowser
 import threading
 import time
 
-from generator.template_loader import load_templates
+from generator.template_catalog import (
+    list_templates, get_template_entry, refresh_catalog, invalidate_catalog, catalog_stats
+)
 from generator.layout_loader import load_layout
+from generator.compiled_layout import invalidate_compiled_layout
 from generator.path_utils import get_template_folder
-from generator.generate import generate_single, generate_bulk
+from generator.generate import (
+    generate_single_bytes, generate_single_pdf, generate_bulk, iter_encode_bulk,
+    iter_overlay_bulk
+)
+from generator.jobs import (
+    submit_job, get_job, get_job_results, get_job_errors, get_job_file, get_job_archive,
+    cancel_job, is_finished, resume_job, resume_interrupted_jobs
+)
+from generator.archive import stream_archive, check_filename_pattern, ARCHIVE_FORMATS
+from generator.pdf_output import stream_pdf, PDF_MIMETYPE
+from generator.pdf_render import stream_vector_pdf
+from generator.render import load_template_image
+from generator.encoder import (
+    resolve_profile, profile_extension, profile_mimetype, encode_to_bytes
+)
+from generator.config_loader import get_setting
 from generator.remote_template import download_template
 from generator.importer_utils import import_from_zip, import_from_image
+from generator.datasets import create_dataset, get_dataset, delete_dataset
+from generator.template_cache import template_cache_stats
+from generator.font_cache import font_cache_stats
+from generator.text_cache import text_cache_stats
+from generator.render_cache import render_cache_stats
+from generator.preview_session import create_session, open_session, close_session
+from generator.template_pyramid import (
+    ensure_pyramid, get_level, pick_level, level_mimetype, pyramid_version
+)
+from generator.http_cache import apply_cache_policy, versioned_policy, cached_json, level_etag
 
 
 app = Flask(__name__)
 CORS(app)
 
+# Nothing else runs at import time: bulk pool workers (forkserver/spawn)
+# import this module again as __mp_main__ when it is the main script.
+# The template catalog builds itself on first use (serve.py warms it).
+
 # Base directory of backend/
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -27,7 +60,7 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 @app.route("/")
 def serve_frontend():
     frontend_path = os.path.abspath(os.path.join(BASE_DIR, "..", "frontend"))
-    return send_from_directory(frontend_path, "index.html")
+    return apply_cache_policy(send_from_directory(frontend_path, "index.html"), "revalidate")
 
 
 # ---------------------------------------------------------
@@ -36,7 +69,7 @@ def serve_frontend():
 @app.route("/<path:path>")
 def serve_static_files(path):
     frontend_path = os.path.abspath(os.path.join(BASE_DIR, "..", "frontend"))
-    return send_from_directory(frontend_path, path)
+    return apply_cache_policy(send_from_directory(frontend_path, path), "revalidate")
 
 
 # ---------------------------------------------------------
@@ -44,8 +77,19 @@ def serve_static_files(path):
 # ---------------------------------------------------------
 @app.route("/templates", methods=["GET"])
 def api_list_templates():
-    templates = load_templates()
-    return jsonify({"templates": templates})
+    templates = list_templates()
+    return cached_json({"templates": templates})
+
+
+# ---------------------------------------------------------
+# TEMPLATE INFO
+# ---------------------------------------------------------
+@app.route("/templates/<template_id>/info", methods=["GET"])
+def api_template_info(template_id):
+    template = get_template_entry(template_id)
+    if not template:
+        return jsonify({"error": "Template not found"}), 404
+    return cached_json(template)
 
 
 # ---------------------------------------------------------
@@ -54,7 +98,7 @@ def api_list_templates():
 @app.route("/templates/<template_id>/layout", methods=["GET"])
 def api_get_layout(template_id):
     layout = load_layout(template_id)
-    return jsonify({"layout": layout})
+    return cached_json({"layout": layout})
 
 
 # ---------------------------------------------------------
@@ -73,9 +117,72 @@ def api_save_layout(template_id):
     with open(layout_path, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4)
 
+    invalidate_compiled_layout(template_id)
+    invalidate_catalog(template_id)
     return jsonify({"status": "saved"})
 
 
+# ---------------------------------------------------------
+# DATASETS (uploaded CSV/TSV/XLSX, reusable by bulk jobs)
+# ---------------------------------------------------------
+@app.route("/datasets", methods=["POST"])
+def api_upload_dataset():
+    if "file" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = request.files["file"]
+    if file.filename == "":
+        return jsonify({"error": "Empty filename"}), 400
+
+    try:
+        manifest = create_dataset(file.stream, file.filename)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Could not read dataset: {e}"}), 400
+
+    return jsonify({
+        "dataset_id": manifest["id"],
+        "columns": manifest["columns"],
+        "rows": manifest["rows"]
+    }), 201
+
+
+@app.route("/datasets/<dataset_id>", methods=["GET"])
+def api_get_dataset(dataset_id):
+    dataset = get_dataset(dataset_id)
+    if not dataset:
+        return jsonify({"error": "Dataset not found"}), 404
+
+    return jsonify({**dataset.manifest, "preview": dataset.preview()})
+
+
+@app.route("/datasets/<dataset_id>", methods=["DELETE"])
+def api_delete_dataset(dataset_id):
+    if not delete_dataset(dataset_id):
+        return jsonify({"error": "Dataset not found"}), 404
+
+    return jsonify({"status": "deleted"})
+
+
+def _bulk_rows(payload):
+    """
+    Rows for a bulk request: "rows" (JSON list), or "dataset_id" of an
+    uploaded dataset, optionally with "mapping" ({field: column}).
+    Returns (rows, None) or (None, error response).
+    """
+    dataset_id = payload.get("dataset_id")
+    if not dataset_id:
+        return payload.get("rows"), None
+
+    dataset = get_dataset(dataset_id)
+    if not dataset:
+        return None, (jsonify({"error": "Dataset not found"}), 404)
+
+    mapping = payload.get("mapping")
+    return (dataset.mapped(mapping) if mapping else dataset), None
+
+
 # ---------------------------------------------------------
 # GENERATE SINGLE CERTIFICATE
 # ---------------------------------------------------------
@@ -89,20 +196,119 @@ def api_generate_single():
     if not template_id or not data:
         return jsonify({"error": "template_id and data are required"}), 400
 
-    result = generate_single(template_id, data)
+    # Vector engine: real text over the shared background, as a PDF page
+    if payload.get("format") == "pdf":
+        result = generate_single_pdf(template_id, data)
+
+        if isinstance(result, dict) and "errors" in result:
+            return jsonify(result), 400
+
+        return send_file(io.BytesIO(result), mimetype=PDF_MIMETYPE,
+                         download_name="certificate.pdf")
+
+    # Previews default to a fast encoder ("preview_profile" in config.json)
+    try:
+        profile = resolve_profile(
+            payload.get("profile") or get_setting("preview_profile", "png_fast")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Optional downscaled preview, e.g. {"max_width": 800}, drawn on
+    # the smallest template pyramid level that fits. Encoded in memory
+    # (no shared file between users); {"cache": true} also uses the
+    # render cache (for final certificates, not editor previews).
+    result = generate_single_bytes(
+        template_id, data, profile, payload.get("max_width"), payload.get("max_height"),
+        use_cache=bool(payload.get("cache"))
+    )
 
     if isinstance(result, dict) and "errors" in result:
         return jsonify(result), 400
 
-    img = result
+    buffer = io.BytesIO(result)
 
-    output_dir = os.path.join(BASE_DIR, "output")
-    os.makedirs(output_dir, exist_ok=True)
+    return send_file(
+        buffer,
+        mimetype=profile_mimetype(profile),
+        download_name=f"certificate.{profile_extension(profile)}"
+    )
 
-    output_path = os.path.join(output_dir, "single_preview.png")
-    img.save(output_path)
 
-    return send_file(output_path, mimetype="image/png")
+# ---------------------------------------------------------
+# INCREMENTAL EDITOR PREVIEW
+# ---------------------------------------------------------
+@app.route("/preview/sessions", methods=["POST"])
+def api_create_preview():
+    payload = request.json or {}
+
+    template_id = payload.get("template_id")
+    if not template_id or not get_template_folder(template_id):
+        return jsonify({"error": "Template not found"}), 404
+
+    layout = payload.get("layout") or load_layout(template_id)
+    session_id, session = create_session(template_id, layout, payload.get("data"))
+
+    width, height = session.size
+    return jsonify({
+        "session_id": session_id,
+        "width": width,
+        "height": height,
+        "image": f"/preview/sessions/{session_id}/image"
+    }), 201
+
+
+@app.route("/preview/sessions/<session_id>", methods=["POST"])
+def api_update_preview(session_id):
+    """
+    Applies {"layout", "data"} (either optional) and returns:
+    - response="tile" (default): only the changed region as an image,
+      with its position in X-Dirty-Box: "x0,y0,x1,y1"; 204 if unchanged
+    - response="full": the whole updated image
+    """
+    payload = request.json or {}
+    profile = resolve_profile(get_setting("preview_profile", "png_fast"))
+
+    with open_session(session_id) as session:
+        if not session:
+            return jsonify({"error": "Preview session not found"}), 404
+
+        box = session.update(payload.get("layout"), payload.get("data"))
+
+        if payload.get("response", "tile") == "full":
+            data = encode_to_bytes(session.image, profile)
+            headers = {}
+        elif box is None:
+            return "", 204
+        else:
+            data = encode_to_bytes(session.tile(box), profile)
+            headers = {"X-Dirty-Box": ",".join(str(v) for v in box)}
+
+    response = send_file(io.BytesIO(data), mimetype=profile_mimetype(profile))
+    response.headers.update(headers)
+    response.headers["Access-Control-Expose-Headers"] = "X-Dirty-Box"
+    return response
+
+
+@app.route("/preview/sessions/<session_id>/image", methods=["GET"])
+def api_preview_image(session_id):
+    profile = resolve_profile(get_setting("preview_profile", "png_fast"))
+
+    with open_session(session_id) as session:
+        if not session:
+            return jsonify({"error": "Preview session not found"}), 404
+
+        data = encode_to_bytes(session.image, profile)
+
+    return send_file(io.BytesIO(data), mimetype=profile_mimetype(profile))
+
+
+@app.route("/preview/sessions/<session_id>", methods=["DELETE"])
+def api_close_preview(session_id):
+    if not close_session(session_id):
+        return jsonify({"error": "Preview session not found"}), 404
+
+    return jsonify({"status": "closed"})
 
 
 # ---------------------------------------------------------
@@ -113,16 +319,235 @@ def api_generate_bulk():
     payload = request.json
 
     template_id = payload.get("template_id")
-    rows = payload.get("rows")
+    rows, error = _bulk_rows(payload)
+    if error:
+        return error
 
     if not template_id or not rows:
-        return jsonify({"error": "template_id and rows are required"}), 400
+        return jsonify({"error": "template_id and rows (or dataset_id) are required"}), 400
 
-    results = generate_bulk(template_id, rows)
+    try:
+        results = generate_bulk(template_id, rows, profile=payload.get("profile"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     return jsonify({"status": "ok", "results": results})
 
 
+# ---------------------------------------------------------
+# GENERATE BULK CERTIFICATES AS A STREAMED ARCHIVE
+# ---------------------------------------------------------
+@app.route("/generate/bulk/archive", methods=["POST"])
+def api_generate_bulk_archive():
+    payload = request.json
+
+    template_id = payload.get("template_id")
+    rows, error = _bulk_rows(payload)
+    if error:
+        return error
+    fmt = payload.get("format", "zip")
+
+    if not template_id or not rows:
+        return jsonify({"error": "template_id and rows (or dataset_id) are required"}), 400
+
+    if fmt not in ARCHIVE_FORMATS:
+        return jsonify({"error": f"Unsupported archive format '{fmt}'"}), 400
+
+    # Checked before the response starts: once it streams, errors can
+    # only truncate the archive
+    if not get_template_folder(template_id):
+        return jsonify({"error": "Template not found"}), 404
+
+    try:
+        profile = resolve_profile(payload.get("profile"))
+        check_filename_pattern(payload.get("filename_pattern"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = iter_encode_bulk(
+        template_id, rows, workers=payload.get("workers"), profile=profile
+    )
+    chunks = stream_archive(
+        results, rows, payload.get("filename_pattern"), fmt, profile_extension(profile)
+    )
+
+    # No Content-Length → chunked transfer; entries go out as they render
+    filename = "certificates" + ARCHIVE_FORMATS[fmt]["extension"]
+    return Response(
+        chunks,
+        mimetype=ARCHIVE_FORMATS[fmt]["mimetype"],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+# ---------------------------------------------------------
+# GENERATE BULK CERTIFICATES AS ONE MULTI-PAGE PDF
+# ---------------------------------------------------------
+@app.route("/generate/bulk/pdf", methods=["POST"])
+def api_generate_bulk_pdf():
+    payload = request.json
+
+    template_id = payload.get("template_id")
+    rows, error = _bulk_rows(payload)
+    if error:
+        return error
+
+    if not template_id or not rows:
+        return jsonify({"error": "template_id and rows (or dataset_id) are required"}), 400
+
+    if not get_template_folder(template_id):
+        return jsonify({"error": "Template not found"}), 404
+
+    # "vector": real text in embedded font subsets (pdf_render)
+    # "raster": text rendered by Pillow as an image overlay (pdf_output)
+    if payload.get("engine") == "vector":
+        chunks = stream_vector_pdf(template_id, rows, payload.get("dpi"))
+    else:
+        background = load_template_image(template_id)
+        results = iter_overlay_bulk(template_id, rows, workers=payload.get("workers"))
+        chunks = stream_pdf(results, background, payload.get("dpi"))
+
+    # Pages are streamed as they render (chunked transfer)
+    return Response(
+        chunks,
+        mimetype=PDF_MIMETYPE,
+        headers={"Content-Disposition": "attachment; filename=certificates.pdf"}
+    )
+
+
+# ---------------------------------------------------------
+# BULK JOBS (background generation with progress)
+# ---------------------------------------------------------
+@app.route("/jobs", methods=["POST"])
+def api_submit_job():
+    payload = request.json
+
+    template_id = payload.get("template_id")
+    rows, error = _bulk_rows(payload)
+    if error:
+        return error
+
+    if not template_id or not rows:
+        return jsonify({"error": "template_id and rows (or dataset_id) are required"}), 400
+
+    try:
+        job_id = submit_job(
+            template_id,
+            rows,
+            workers=payload.get("workers"),
+            output=payload.get("output", "files"),
+            filename_pattern=payload.get("filename_pattern"),
+            profile=payload.get("profile")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "job_id": job_id,
+        "progress": f"/jobs/{job_id}",
+        "invalid": get_job(job_id)["invalid"],
+        "errors": f"/jobs/{job_id}/errors"
+    }), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def api_job_progress(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job)
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def api_job_events(job_id):
+    if not get_job(job_id):
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        # Server-Sent Events: one progress snapshot every 500ms until done
+        while True:
+            job = get_job(job_id)
+            yield f"data: {json.dumps(job)}\n\n"
+            if not job or is_finished(job_id):
+                break
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/jobs/<job_id>/results", methods=["GET"])
+def api_job_results(job_id):
+    since = request.args.get("since", 0, type=int)
+
+    results = get_job_results(job_id, since)
+    if results is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify({"since": since, "next": since + len(results), "results": results})
+
+
+@app.route("/jobs/<job_id>/errors", methods=["GET"])
+def api_job_errors(job_id):
+    error_index = get_job_errors(job_id)
+    if error_index is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify({"invalid": len(error_index), "errors": error_index})
+
+
+@app.route("/jobs/<job_id>/files/<int:row>", methods=["GET"])
+def api_job_file(job_id, row):
+    path = get_job_file(job_id, row)
+    if not path or not os.path.exists(path):
+        return jsonify({"error": "File not available"}), 404
+
+    return send_file(path)
+
+
+@app.route("/jobs/<job_id>/archive", methods=["GET"])
+def api_job_archive(job_id):
+    path = get_job_archive(job_id)
+    if not path or not os.path.exists(path):
+        return jsonify({"error": "Archive not available"}), 404
+
+    return send_file(path, as_attachment=True)
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def api_cancel_job(job_id):
+    if not cancel_job(job_id):
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify({"status": "cancelling"})
+
+
+@app.route("/jobs/<job_id>/resume", methods=["POST"])
+def api_resume_job(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    if job["status"] != "interrupted" or not resume_job(job_id):
+        return jsonify({"error": f"Job is {job['status']}, not interrupted"}), 409
+
+    return jsonify({"status": "resumed", "progress": f"/jobs/{job_id}"}), 202
+
+
+def resume_jobs():
+    """
+    Picks up bulk jobs a previous server run left unfinished
+    ("resume_jobs_on_start" in config.json).
+    """
+    if not get_setting("resume_jobs_on_start", True):
+        return
+
+    resumed = resume_interrupted_jobs()
+    if resumed:
+        print(f"Resumed {len(resumed)} interrupted job(s): {', '.join(resumed)}")
+
+
 # ---------------------------------------------------------
 # IMPORT REMOTE TEMPLATE FROM URL
 # ---------------------------------------------------------
@@ -141,6 +566,7 @@ def api_import_template():
     if "error" in result:
         return jsonify(result), 400
 
+    invalidate_catalog(template_id)
     return jsonify(result)
 
 
@@ -158,6 +584,7 @@ def api_import_zip():
 
     try:
         template_id = import_from_zip(file, file.filename)
+        invalidate_catalog(template_id)
         return jsonify({"template_id": template_id})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -177,6 +604,7 @@ def api_import_image():
 
     try:
         template_id = import_from_image(file, file.filename)
+        invalidate_catalog(template_id)
         return jsonify({"template_id": template_id})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -187,15 +615,14 @@ def api_import_image():
 # ---------------------------------------------------------
 @app.route("/templates/<template_id>/preview", methods=["GET"])
 def api_template_preview(template_id):
-    folder = get_template_folder(template_id)
-    if not folder:
-        return jsonify({"error": "Template not found"}), 404
-
-    path = os.path.join(folder, "template.png")
-    if not os.path.exists(path):
-        return jsonify({"error": "template.png missing"}), 404
-
-    return send_file(path, mimetype="image/png")
+    """
+    The editor-sized "preview" level by default. ?max_width / ?max_height
+    pick the smallest level that fits; ?level=print gives template.png.
+    X-Template-Size always carries the full resolution ("WxH").
+    With the listing's ?v=<version> the response is cached for good;
+    without it, browsers revalidate (304 while unchanged).
+    """
+    return _send_template_level(template_id, "preview")
 
 
 # ---------------------------------------------------------
@@ -203,15 +630,38 @@ def api_template_preview(template_id):
 # ---------------------------------------------------------
 @app.route("/templates/<template_id>/thumb", methods=["GET"])
 def api_template_thumb(template_id):
+    return _send_template_level(template_id, "thumb")
+
+
+def _send_template_level(template_id, default_level):
     folder = get_template_folder(template_id)
     if not folder:
         return jsonify({"error": "Template not found"}), 404
 
-    path = os.path.join(folder, "thumb.jpg")
-    if not os.path.exists(path):
-        return jsonify({"error": "thumb.jpg missing"}), 404
+    manifest = ensure_pyramid(folder)
+    if not manifest:
+        return jsonify({"error": "template.png missing"}), 404
+
+    max_width = request.args.get("max_width", type=int)
+    max_height = request.args.get("max_height", type=int)
+
+    if request.args.get("level"):
+        level = get_level(manifest, request.args["level"])
+    elif max_width or max_height:
+        level = pick_level(manifest, max_width, max_height)
+    else:
+        level = get_level(manifest, default_level)
 
-    return send_file(path, mimetype="image/jpeg")
+    response = send_file(
+        os.path.join(folder, level["file"]),
+        mimetype=level_mimetype(level),
+        etag=level_etag(manifest, level)
+    )
+
+    full = manifest["levels"][0]
+    response.headers["X-Template-Size"] = f"{full['width']}x{full['height']}"
+    response.headers["Access-Control-Expose-Headers"] = "X-Template-Size"
+    return apply_cache_policy(response, versioned_policy(pyramid_version(manifest)))
 
 
 # ---------------------------------------------------------
@@ -219,10 +669,11 @@ def api_template_thumb(template_id):
 # ---------------------------------------------------------
 @app.route("/templates_store/<template_id>/<filename>")
 def serve_builtin_template(template_id, filename):
-    return send_from_directory(
+    response = send_from_directory(
         os.path.join(BASE_DIR, "templates_store", template_id),
         filename
     )
+    return apply_cache_policy(response, "revalidate")
 
 
 # ---------------------------------------------------------
@@ -230,10 +681,25 @@ def serve_builtin_template(template_id, filename):
 # ---------------------------------------------------------
 @app.route("/uploads/templates/<template_id>/<filename>")
 def serve_user_template(template_id, filename):
-    return send_from_directory(
+    response = send_from_directory(
         os.path.join(BASE_DIR, "uploads", "templates", template_id),
         filename
     )
+    return apply_cache_policy(response, "revalidate")
+
+
+# ---------------------------------------------------------
+# CACHE STATISTICS (this server process)
+# ---------------------------------------------------------
+@app.route("/stats/cache", methods=["GET"])
+def api_cache_stats():
+    return jsonify({
+        "templates": template_cache_stats(),
+        "fonts": font_cache_stats(),
+        "text": text_cache_stats(),
+        "renders": render_cache_stats(),
+        "catalog": catalog_stats()
+    })
 
 
 # ---------------------------------------------------------
@@ -244,20 +710,13 @@ def open_browser():
     webbrowser.open("http://localhost:5000/")
 
 if __name__ == "__main__":
-    # Only open browser in the reloader's main process
+    # Build the template catalog once at startup
+    refresh_catalog()
+
+    # Only open browser (and resume jobs) in the reloader's main process
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
         threading.Thread(target=open_browser).start()
+        resume_jobs()
 
     app.run(debug=True)
 
-
-# ---------------------------------------------------------
-# template info endpoint
-# ---------------------------------------------------------
-@app.route("/templates/<template_id>/info", methods=["GET"])
-def api_template_info(template_id):
-    templates = load_templates()
-    for t in templates:
-        if t["id"] == template_id:
-            return jsonify(t)
-    return jsonify({"error": "Template not found"}), 404
@@ -0,0 +1,129 @@
+"""
+Bulk generation throughput benchmark.
+
+Renders the same synthetic dataset with an increasing number of
+worker processes and prints certificates/sec for each run. Every run
+gets its own names, so the render cache never serves them.
+--edited N then re-runs the last dataset with N rows changed, which
+the render cache answers except for those N rows.
+
+Usage (from backend/):
+    python benchmarks/bench_bulk.py --rows 400 --workers 1 2 4 8
+    python benchmarks/bench_bulk.py --rows 10000 --workers 4 --edited 50
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import uuid
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator.path_utils import BACKEND_DIR, get_template_folder
+from generator.generate import generate_bulk
+
+
+BENCH_TEMPLATE_ID = "_bench_template"
+
+# Sized for the bundled 1200x800 templates
+BENCH_LAYOUT = {
+    "fields": {
+        "name": {"x": 600, "y": 360, "size": 64, "font": "Roboto-Bold.ttf",
+                 "color": "#1a3c6e", "align": "center", "max_width": 700},
+        "course": {"x": 600, "y": 460, "size": 28, "font": "Roboto-Regular.ttf",
+                   "color": "#444444", "align": "center", "max_width": 500, "wrap": True},
+        "date": {"x": 300, "y": 620, "size": 22, "font": "Roboto-Regular.ttf",
+                 "color": "#444444", "align": "left"},
+        "arabic_name": {"x": 900, "y": 620, "size": 30, "font": "NotoSansArabic-Regular.ttf",
+                        "color": "#aa0000", "align": "right", "max_width": 300}
+    }
+}
+
+
+def create_bench_template(source_id):
+    """
+    Copies an existing template image into uploads/templates/_bench_template
+    with a layout that exercises scaling, wrapping and Arabic shaping.
+    """
+    source = get_template_folder(source_id)
+    if not source:
+        raise SystemExit(f"Template '{source_id}' not found")
+
+    folder = os.path.join(BACKEND_DIR, "uploads", "templates", BENCH_TEMPLATE_ID)
+    os.makedirs(folder, exist_ok=True)
+    shutil.copy(os.path.join(source, "template.png"), os.path.join(folder, "template.png"))
+
+    with open(os.path.join(folder, "default_layout.json"), "w", encoding="utf-8") as f:
+        json.dump(BENCH_LAYOUT, f, indent=4)
+
+    return folder
+
+
+def make_rows(count, tag=""):
+    """
+    `count` synthetic rows; a `tag` makes the names unique to one run.
+    """
+    return [
+        {
+            "name": f"Attendee Number {i}{tag} With A Fairly Long Name",
+            "course": "Advanced Certificate Rendering and Performance Engineering Workshop",
+            "date": "2026-10-18",
+            "arabic_name": "محمد عبد الله"
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--template", default="classic")
+    parser.add_argument("--edited", type=int, default=0,
+                        help="re-run the last dataset with this many rows changed")
+    args = parser.parse_args()
+
+    folder = create_bench_template(args.template)
+
+    try:
+        baseline = None
+        print(f"{'workers':>8} {'seconds':>9} {'certs/sec':>10} {'speedup':>8}")
+
+        for workers in args.workers:
+            rows = make_rows(args.rows, tag=f" {uuid.uuid4().hex[:6]}")
+            elapsed, results = timed_run(rows, workers)
+
+            failed = sum(1 for r in results if "errors" in r)
+            rate = len(rows) / elapsed
+            baseline = baseline or rate
+            note = f"  ({failed} failed)" if failed else ""
+            print(f"{workers:>8} {elapsed:>9.2f} {rate:>10.1f} {rate / baseline:>7.2f}x{note}")
+
+        if args.edited:
+            step = max(1, len(rows) // args.edited)
+            for row in rows[::step][:args.edited]:
+                row["name"] += " Jr."
+
+            elapsed, results = timed_run(rows, args.workers[-1])
+            cached = sum(1 for r in results if r.get("cached"))
+            print(f"\nre-run with {args.edited} edited rows: {elapsed:.2f}s, "
+                  f"{cached}/{len(rows)} from the render cache")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def timed_run(rows, workers):
+    output_dir = tempfile.mkdtemp(prefix="certiforge_bench_")
+    try:
+        start = time.perf_counter()
+        results = generate_bulk(BENCH_TEMPLATE_ID, rows, output_dir=output_dir, workers=workers)
+        return time.perf_counter() - start, results
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
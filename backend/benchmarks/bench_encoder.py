@@ -0,0 +1,50 @@
+"""
+Output encoder benchmark.
+
+Renders one certificate and encodes it with every output profile,
+printing file size and encode time per profile.
+
+Usage (from backend/):
+    python benchmarks/bench_encoder.py --repeat 10
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator.generate import generate_single
+from generator.encoder import OUTPUT_PROFILES, resolve_profile, encode_to_bytes
+from bench_bulk import BENCH_TEMPLATE_ID, create_bench_template, make_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--template", default="classic")
+    args = parser.parse_args()
+
+    folder = create_bench_template(args.template)
+
+    try:
+        image = generate_single(BENCH_TEMPLATE_ID, make_rows(1)[0])
+        print(f"certificate: {image.size[0]}x{image.size[1]} {image.mode}\n")
+        print(f"{'profile':<15} {'bytes':>10} {'ms/encode':>10}")
+
+        for name in OUTPUT_PROFILES:
+            profile = resolve_profile(name)
+
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                data = encode_to_bytes(image, profile)
+            elapsed = (time.perf_counter() - start) / args.repeat
+
+            print(f"{name:<15} {len(data):>10} {elapsed * 1000:>10.1f}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
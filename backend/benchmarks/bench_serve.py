@@ -0,0 +1,174 @@
+"""
+HTTP load test for /generate/single.
+
+Starts the app under the debug server (what `python app.py` runs,
+minus the browser) and under the production server (serve.py), fires
+the same concurrent requests at each and prints requests/sec and
+latency percentiles.
+
+Usage (from backend/):
+    python benchmarks/bench_serve.py --requests 400 --concurrency 16
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import subprocess
+import http.client
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator.path_utils import BACKEND_DIR
+from bench_bulk import BENCH_TEMPLATE_ID, create_bench_template, make_rows
+
+
+HOST = "127.0.0.1"
+
+DEBUG_SERVER = (
+    "from app import app; "
+    "app.run(host='{host}', port={port}, debug=True, use_reloader=False)"
+)
+
+
+def start_server(mode, port, workers, threads):
+    if mode == "debug":
+        command = [sys.executable, "-c", DEBUG_SERVER.format(host=HOST, port=port)]
+    else:
+        command = [sys.executable, "serve.py", "--host", HOST, "--port", str(port)]
+        if workers:
+            command += ["--workers", str(workers)]
+        if threads:
+            command += ["--threads", str(threads)]
+
+    process = subprocess.Popen(
+        command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    # Wait until it answers
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=2)
+            conn.request("GET", "/templates")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+
+    process.kill()
+    raise SystemExit(f"{mode} server did not start on port {port}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_load(port, total, concurrency):
+    """
+    `concurrency` client threads, each on its own keep-alive
+    connection, share `total` requests. Returns (seconds, latencies, errors).
+    Every request has a different name, so none is served from the
+    render cache.
+    """
+    tag = uuid.uuid4().hex[:6]
+    latencies = []
+    errors = []
+    remaining = [total]
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(HOST, port, timeout=120)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+                n = remaining[0]
+
+            row = make_rows(1, tag=f" {tag}-{n}")[0]
+            body = json.dumps({"template_id": BENCH_TEMPLATE_ID, "data": row})
+
+            start = time.perf_counter()
+            try:
+                conn.request("POST", "/generate/single", body,
+                             {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException) as e:
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection(HOST, port, timeout=120)
+                response = e
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors.append(getattr(response, "status", str(response)))
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return time.perf_counter() - start, latencies, errors
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--servers", nargs="+", default=["debug", "production"],
+                        choices=["debug", "production"])
+    parser.add_argument("--workers", type=int, help="production workers (default: config.json)")
+    parser.add_argument("--threads", type=int, help="production threads (default: config.json)")
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--template", default="classic")
+    args = parser.parse_args()
+
+    folder = create_bench_template(args.template)
+
+    try:
+        baseline = None
+        print(f"{'server':>11} {'req/sec':>8} {'p50 ms':>7} {'p95 ms':>7} {'speedup':>8}")
+
+        for n, mode in enumerate(args.servers):
+            port = args.port + n
+            process = start_server(mode, port, args.workers, args.threads)
+            try:
+                # Warm-up round (fonts, templates, text caches)
+                run_load(port, args.concurrency * 2, args.concurrency)
+                seconds, latencies, errors = run_load(port, args.requests, args.concurrency)
+            finally:
+                stop_server(process)
+
+            rate = len(latencies) / seconds
+            baseline = baseline or rate
+            note = f"  ({len(errors)} failed)" if errors else ""
+            print(
+                f"{mode:>11} {rate:>8.1f} {percentile(latencies, 0.5) * 1000:>7.0f} "
+                f"{percentile(latencies, 0.95) * 1000:>7.0f} {rate / baseline:>7.2f}x{note}"
+            )
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
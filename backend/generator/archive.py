@@ -0,0 +1,193 @@
+import io
+import re
+import json
+import time
+import tarfile
+import zipfile
+
+
+ARCHIVE_FORMATS = {
+    "zip": {"mimetype": "application/zip", "extension": ".zip"},
+    "tar": {"mimetype": "application/x-tar", "extension": ".tar"}
+}
+
+DEFAULT_FILENAME_PATTERN = "certificate_{row}"
+
+_UNSAFE_CHARS = re.compile(r"[^\w\-. ]+", re.UNICODE)
+
+# What str.format_map raises for a malformed pattern ("{", "{0}",
+# "{name.x}", "{name[0]}", "{row:x}" on a string, ...)
+_PATTERN_ERRORS = (ValueError, IndexError, KeyError, AttributeError, TypeError)
+
+
+# ---------------------------------------------------------
+# ENTRY NAMES
+# ---------------------------------------------------------
+class _BlankMissing(dict):
+    def __missing__(self, key):
+        return ""
+
+
+class _SampleValues(dict):
+    def __missing__(self, key):
+        return "sample"
+
+
+def check_filename_pattern(pattern):
+    """
+    Raises ValueError if `pattern` cannot build entry names, so a bad
+    pattern is rejected when the request comes in, not halfway through
+    an archive. None / "" means DEFAULT_FILENAME_PATTERN.
+    """
+    if not pattern:
+        return
+    if not isinstance(pattern, str):
+        raise ValueError("filename_pattern must be a string")
+
+    # Every field as a non-empty string, like a typical row value
+    try:
+        pattern.format_map(_SampleValues(row=1))
+    except _PATTERN_ERRORS as e:
+        raise ValueError(f"Invalid filename_pattern '{pattern}': {e}")
+
+
+def certificate_filename(pattern, i, row, extension="png", used=None):
+    """
+    Builds an archive entry name from a row-field pattern, e.g.
+    "{name}_{row}" → "Jane_Doe_12.png".
+    - {row} is the 1-based row number
+    - unknown fields become empty strings
+    - unsafe characters are replaced by "_"
+    If `used` (a set) is given, duplicate names get "_<row>" appended.
+    A pattern that fails for this row (see check_filename_pattern)
+    falls back to DEFAULT_FILENAME_PATTERN.
+    """
+    values = _BlankMissing({k: str(v).strip() for k, v in row.items()})
+    values["row"] = i
+
+    try:
+        name = (pattern or DEFAULT_FILENAME_PATTERN).format_map(values)
+    except _PATTERN_ERRORS:
+        name = DEFAULT_FILENAME_PATTERN.format(row=i)
+
+    name = _UNSAFE_CHARS.sub("_", name).strip(" ._") or f"certificate_{i}"
+    filename = f"{name}.{extension}"
+
+    if used is not None:
+        if filename in used:
+            filename = f"{name}_{i}.{extension}"
+        used.add(filename)
+
+    return filename
+
+
+# ---------------------------------------------------------
+# ARCHIVE WRITER (zip / tar over any writable file object)
+# ---------------------------------------------------------
+class ArchiveWriter:
+    """
+    Appends entries to a ZIP or TAR archive one at a time.
+    Works on non-seekable outputs (sockets, pipes, chunk buffers):
+    ZIP entries use data descriptors, TAR uses stream mode.
+    PNG/JPEG data is already compressed, so ZIP entries are stored.
+    """
+
+    def __init__(self, fileobj, fmt="zip"):
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format '{fmt}'")
+
+        self.format = fmt
+        if fmt == "zip":
+            self._archive = zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_STORED)
+        else:
+            self._archive = tarfile.open(fileobj=fileobj, mode="w|")
+
+    def add(self, name, data):
+        if self.format == "zip":
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            self._archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self._archive.close()
+
+
+class ChunkBuffer:
+    """
+    Write-only file object whose contents are drained after each write.
+    Lets sequential writers (zipfile, tarfile, PdfWriter) feed a
+    streaming HTTP response.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# ---------------------------------------------------------
+# STREAMING
+# ---------------------------------------------------------
+def write_results(writer, results, rows, pattern=None, extension="png"):
+    """
+    Adds encoded row results ({"row", "data"} / {"row", "errors"})
+    to an ArchiveWriter as they arrive. `rows` supplies the field
+    values for the filename pattern; it is iterated alongside the
+    results (which come in row order), so it may be a stored dataset.
+    Yields a small summary per row: {"row", "file"} (plus "cached" for
+    render cache hits) or {"row", "errors"}.
+    Failed rows are collected into errors.json at the end.
+    """
+    used = set()
+    failed = []
+    row_values = iter(rows)
+
+    for result in results:
+        row = next(row_values)
+        if "errors" in result:
+            failed.append(result)
+            yield result
+            continue
+
+        name = certificate_filename(pattern, result["row"], row, extension, used)
+        writer.add(name, result["data"])
+        summary = {"row": result["row"], "file": name}
+        if result.get("cached"):
+            summary["cached"] = True
+        yield summary
+
+    if failed:
+        writer.add("errors.json", json.dumps(failed, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def stream_archive(results, rows, pattern=None, fmt="zip", extension="png"):
+    """
+    Generator of archive bytes, suitable for a chunked HTTP response.
+    Each certificate is written out as soon as it is produced;
+    nothing is staged on disk.
+    """
+    buffer = ChunkBuffer()
+    writer = ArchiveWriter(buffer, fmt)
+
+    for _ in write_results(writer, results, rows, pattern, extension):
+        chunk = buffer.drain()
+        if chunk:
+            yield chunk
+
+    writer.close()
+    yield buffer.drain()
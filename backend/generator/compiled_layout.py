@@ -0,0 +1,201 @@
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Sized
+
+from generator.layout_loader import load_layout, REMOTE_TEMPLATES_FILE
+from generator.validator import validate_layout, validate_data_row, validate_data_rows
+from generator.font_loader import get_font_path
+from generator.font_registry import font_registry_version
+from generator.path_utils import get_template_folder
+
+
+# Compiled layouts kept in memory (one per template)
+MAX_COMPILED_LAYOUTS = 64
+
+
+# ---------------------------------------------------------
+# COMPILED LAYOUT OBJECTS
+# ---------------------------------------------------------
+class CompiledField:
+    """
+    One layout field with defaults filled in and its font file resolved.
+    """
+    __slots__ = (
+        "name", "font", "font_path", "variation", "size", "color", "align",
+        "x", "y", "max_width", "auto_scale", "wrap", "scale"
+    )
+
+    def __init__(self, name, field):
+        self.name = name
+        self.font = field.get("font", "DejaVuSans.ttf")
+        self.font_path = get_font_path(self.font)
+        self.variation = field.get("variation")
+        self.size = field.get("size", 48)
+        self.color = field.get("color", "#000000")
+        self.align = field.get("align", "left")
+        self.x = field.get("x", 0)
+        self.y = field.get("y", 0)
+        self.max_width = field.get("max_width", None)
+        self.auto_scale = field.get("auto_scale", True)
+        self.wrap = field.get("wrap", False)
+        self.scale = 1.0
+
+    def scaled(self, factor):
+        """
+        A copy drawn `factor` times smaller or larger, for rendering on
+        a pyramid level (see render.layout_field).
+        """
+        field = CompiledField.__new__(CompiledField)
+        for name in CompiledField.__slots__:
+            setattr(field, name, getattr(self, name))
+
+        field.scale = self.scale * factor
+        return field
+
+
+class CompiledLayout:
+    """
+    A layout parsed and validated once.
+    `errors` holds the layout validation result; per row only the
+    data needs checking (see validate_row).
+    """
+    __slots__ = ("source", "fields", "errors")
+
+    def __init__(self, layout):
+        self.source = layout
+        self.errors = validate_layout(layout)
+
+        fields = layout.get("fields") if isinstance(layout, dict) else None
+        if not isinstance(fields, dict):
+            fields = {}
+
+        self.fields = tuple(
+            CompiledField(name, field)
+            for name, field in fields.items()
+            if isinstance(field, dict)
+        )
+
+    def subset(self, names):
+        """
+        A copy keeping only the fields in `names` (same errors and
+        source), e.g. to draw part of a layout.
+        """
+        part = CompiledLayout.__new__(CompiledLayout)
+        part.source = self.source
+        part.errors = self.errors
+        part.fields = tuple(f for f in self.fields if f.name in names)
+        return part
+
+    def scaled(self, factor):
+        """
+        A copy with every field scaled (see CompiledField.scaled).
+        """
+        part = CompiledLayout.__new__(CompiledLayout)
+        part.source = self.source
+        part.errors = self.errors
+        part.fields = tuple(f.scaled(factor) for f in self.fields)
+        return part
+
+    def validate_row(self, data):
+        """
+        Same result as validator.validate_before_render, without
+        re-validating the layout.
+        """
+        return self.errors + validate_data_row(data, self.source)
+
+    def validate_rows(self, rows):
+        """
+        Validates a whole dataset up front.
+        Returns {row_number: [errors]} for the invalid rows only
+        (every row when the layout itself is invalid).
+        """
+        index = validate_data_rows(rows, self.source)
+        if self.errors:
+            return {i: self.errors + index.get(i, []) for i in range(1, len(rows) + 1)}
+        return index
+
+    def check_rows(self, rows, error_index=None):
+        """
+        Yields (row_number, row, errors or None) for every row.
+        Lists and stored datasets are validated as a whole before the
+        first row comes out (or `error_index` is used); one-shot
+        iterables, e.g. the streaming data_loader readers, are validated
+        row by row as they arrive.
+        """
+        if error_index is None and isinstance(rows, Sized):
+            error_index = self.validate_rows(rows)
+
+        for i, row in enumerate(rows, start=1):
+            if error_index is not None:
+                errors = error_index.get(i)
+            else:
+                errors = self.validate_row(row)
+            yield i, row, errors or None
+
+
+def compile_layout(layout):
+    """
+    Compiles a layout dict. Already compiled layouts are returned as is.
+    """
+    if isinstance(layout, CompiledLayout):
+        return layout
+    return CompiledLayout(layout)
+
+
+# ---------------------------------------------------------
+# PER-TEMPLATE CACHE
+# ---------------------------------------------------------
+# template_id -> (signature, CompiledLayout)
+_compiled = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_compiled_layout(template_id):
+    """
+    Returns the compiled layout for a template.
+    Recompiled when default_layout.json (or remote_templates.json for
+    remote templates) or the installed fonts change, or after
+    invalidate_compiled_layout.
+    """
+    signature = _layout_signature(template_id)
+
+    with _lock:
+        entry = _compiled.get(template_id)
+        if entry and entry[0] == signature:
+            _compiled.move_to_end(template_id)
+            return entry[1]
+
+    compiled = CompiledLayout(load_layout(template_id))
+
+    with _lock:
+        # load_layout may have created the file, so sign it afterwards
+        _compiled[template_id] = (_layout_signature(template_id), compiled)
+        _compiled.move_to_end(template_id)
+        while len(_compiled) > MAX_COMPILED_LAYOUTS:
+            _compiled.popitem(last=False)
+
+    return compiled
+
+
+def invalidate_compiled_layout(template_id=None):
+    """
+    Drops one template's compiled layout, or all of them
+    (e.g. after fonts change).
+    """
+    with _lock:
+        if template_id is None:
+            _compiled.clear()
+        else:
+            _compiled.pop(template_id, None)
+
+
+def _layout_signature(template_id):
+    folder = get_template_folder(template_id)
+    path = os.path.join(folder, "default_layout.json") if folder else REMOTE_TEMPLATES_FILE
+    fonts = font_registry_version()
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (path, None, fonts)
+    return (path, st.st_mtime_ns, st.st_size, fonts)
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import threading
+from generator.path_utils import BACKEND_DIR
+
+
+CONFIG_FILE = os.path.join(BACKEND_DIR, "config.json")
+
+DEFAULT_CONFIG = {
+    "default_font": "DejaVuSans.ttf",
+    "allow_user_fonts": True,
+    "allow_remote_templates": True,
+    "bulk_workers": 0,          # 0 = one worker per CPU core
+    "bulk_chunk_size": 8,
+    "template_cache_mb": 256,
+    "font_cache_size": 256,
+    "pdf_dpi": 150,
+    "output_profile": "png",
+    "preview_profile": "png_fast",
+    "catalog_check_interval": 1.0,  # seconds between template folder checks
+    "shape_cache_size": 4096,
+    "measure_cache_size": 16384,
+    "region_render_megapixels": 16,  # bigger templates render region by region (0 = off)
+    "render_cache_mb": 1024,        # on-disk cache of encoded certificates (0 = off)
+    "server_host": "127.0.0.1",     # serve.py (production server) settings
+    "server_port": 5000,
+    "server_workers": 0,            # 0 = one process per CPU core
+    "server_threads": 4,
+    "server_timeout": 120,
+    "server_preload": True,
+    "resume_jobs_on_start": True    # continue bulk jobs a stopped server left unfinished
+}
+
+
+# Seconds between config.json checks; edits are picked up within this
+CONFIG_CHECK_INTERVAL = 1.0
+
+# Parsed config, re-read only when config.json's (mtime_ns, size) changes
+_cached = {"signature": None, "config": None, "checked_at": 0.0}
+_lock = threading.Lock()
+
+
+def load_config():
+    """
+    Loads config.json merged over DEFAULT_CONFIG.
+    Missing or corrupted config falls back to the defaults.
+    """
+    return dict(_current_config())
+
+
+def get_setting(key, default=None):
+    """
+    Returns a single config value.
+    Served from memory: settings are read on hot paths (font and text
+    caches, every render), so config.json is only stat'ed once per
+    CONFIG_CHECK_INTERVAL and parsed again when it changed.
+    """
+    return _current_config().get(key, default)
+
+
+def _current_config():
+    now = time.monotonic()
+    config = _cached["config"]
+    if config is not None and now - _cached["checked_at"] < CONFIG_CHECK_INTERVAL:
+        return config
+
+    with _lock:
+        signature = _config_signature()
+        if _cached["config"] is None or signature != _cached["signature"]:
+            _cached["config"] = _read_config()
+            _cached["signature"] = signature
+        _cached["checked_at"] = now
+        return _cached["config"]
+
+
+def _config_signature():
+    try:
+        st = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_config():
+    config = DEFAULT_CONFIG.copy()
+
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                config.update(json.load(f))
+        except Exception:
+            pass
+
+    return config
@@ -1,9 +1,16 @@
 # certapp/generator/data_loader.py
 
+import io
+import os
 import csv
+import itertools
 import openpyxl
 
 
+# Bytes read to detect the CSV delimiter
+SNIFF_SIZE = 2048
+
+
 def normalize_header(h):
     """
     Normalizes header names:
@@ -14,49 +21,93 @@ def normalize_header(h):
     return h.strip().lower().replace(" ", "_")
 
 
+def iter_csv(source):
+    """
+    Yields CSV or TSV rows one at a time (normalized headers,
+    empty rows skipped). Automatically detects delimiter.
+    `source` is a path or a text file object; only one row is
+    held in memory at a time.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "r", encoding="utf-8-sig") as f:
+            yield from _iter_csv_file(f)
+    else:
+        yield from _iter_csv_file(source)
+
+
+def _iter_csv_file(f):
+    # Sniff the first chunk, then keep reading where it stopped
+    # (completing its last line), so the stream never has to seek
+    sample = f.read(SNIFF_SIZE)
+    dialect = csv.Sniffer().sniff(sample, delimiters=[",", "\t", ";"])
+
+    lines = itertools.chain(io.StringIO(sample + f.readline()), f)
+    reader = csv.DictReader(lines, dialect=dialect)
+
+    for row in reader:
+        clean = {normalize_header(k): (v or "").strip() for k, v in row.items() if k}
+        if any(clean.values()):
+            yield clean
+
+
 def load_csv(path):
     """
     Loads CSV or TSV data.
     Automatically detects delimiter.
     """
-    with open(path, "r", encoding="utf-8-sig") as f:
-        sample = f.read(2048)
-        f.seek(0)
+    return list(iter_csv(path))
 
-        # Detect delimiter
-        dialect = csv.Sniffer().sniff(sample, delimiters=[",", "\t", ";"])
-        reader = csv.DictReader(f, dialect=dialect)
 
-        rows = []
-        for row in reader:
-            clean = {normalize_header(k): v.strip() for k, v in row.items() if k}
-            if any(clean.values()):
-                rows.append(clean)
+def iter_xlsx(source):
+    """
+    Yields XLSX rows one at a time (first sheet, first row = headers,
+    empty rows skipped).
+    Uses openpyxl's read-only mode, which streams the sheet instead of
+    building the whole workbook in memory.
+    `source` is a path or a binary file object.
+    """
+    wb = openpyxl.load_workbook(source, read_only=True)
+    try:
+        sheet = wb.active
+        rows = sheet.iter_rows(values_only=True)
+
+        header_row = next(rows, None)
+        if header_row is None:
+            return
+
+        headers = [normalize_header(str(h)) if h is not None else None for h in header_row]
+
+        for row in rows:
+            if not any(row):
+                continue
+
+            clean = {}
+            for header, value in zip(headers, row):
+                if header:
+                    clean[header] = str(value).strip() if value is not None else ""
 
-        return rows
+            yield clean
+    finally:
+        wb.close()
 
 
 def load_xlsx(path):
     """
     Loads XLSX data using openpyxl.
     """
-    wb = openpyxl.load_workbook(path)
-    sheet = wb.active
+    return list(iter_xlsx(path))
 
-    headers = [normalize_header(c.value) for c in sheet[1]]
-    rows = []
 
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        if not any(row):
-            continue
-
-        clean = {}
-        for i, value in enumerate(row):
-            clean[headers[i]] = str(value).strip() if value is not None else ""
-
-        rows.append(clean)
-
-    return rows
+def iter_rows(source, filename=None):
+    """
+    Picks the streaming loader from the file extension
+    (.xlsx → iter_xlsx, anything else → iter_csv).
+    `filename` is used for the extension when `source` is a file object.
+    """
+    name = filename or (source if isinstance(source, (str, os.PathLike)) else "")
+    if os.path.splitext(str(name))[1].lower() == ".xlsx":
+        return iter_xlsx(source)
+    return iter_csv(source)
 
 
 def load_manual(data_dict):
@@ -0,0 +1,217 @@
+import io
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import itertools
+from contextlib import ExitStack
+
+from generator.data_loader import iter_rows
+from generator.path_utils import BACKEND_DIR
+
+
+DATASETS_DIR = os.path.join(BACKEND_DIR, "uploads", "datasets")
+
+DATASET_EXTENSIONS = {".csv", ".tsv", ".txt", ".xlsx"}
+
+# Rows shown by GET /datasets/<id>
+PREVIEW_ROWS = 5
+
+_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+# ---------------------------------------------------------
+# ON-DISK FORMAT
+# ---------------------------------------------------------
+# uploads/datasets/<dataset_id>/
+#   manifest.json   {"id", "filename", "columns": [...], "rows", "created_at"}
+#   col_<n>.jsonl   one JSON-encoded value per line for column n
+# One file per column: jobs only read the columns their layout uses,
+# and validation gets whole columns without building row dicts.
+def _column_file(folder, index):
+    return os.path.join(folder, f"col_{index}.jsonl")
+
+
+def create_dataset(fileobj, filename):
+    """
+    Parses an uploaded CSV/TSV/XLSX file (streamed, see data_loader)
+    and stores it in columnar form.
+    `fileobj` is a binary file object.
+    Returns the manifest. Raises ValueError for unsupported or empty files.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in DATASET_EXTENSIONS:
+        raise ValueError(f"Unsupported dataset file type '{extension}'")
+
+    if extension != ".xlsx":
+        fileobj = io.TextIOWrapper(fileobj, encoding="utf-8-sig")
+
+    dataset_id = uuid.uuid4().hex
+    folder = os.path.join(DATASETS_DIR, dataset_id)
+    partial = folder + ".partial"
+    os.makedirs(partial)
+
+    try:
+        columns, count = _write_columns(partial, iter_rows(fileobj, filename))
+        if not count:
+            raise ValueError("Dataset has no rows")
+
+        manifest = {
+            "id": dataset_id,
+            "filename": os.path.basename(filename),
+            "columns": columns,
+            "rows": count,
+            "created_at": time.time()
+        }
+        with open(os.path.join(partial, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+
+        os.rename(partial, folder)
+    except Exception:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+
+    return manifest
+
+
+def _write_columns(folder, rows):
+    """
+    Appends every row to the column files, one value per line.
+    Columns come from the first row (the loaders give every row
+    the same keys).
+    """
+    columns = None
+    count = 0
+
+    with ExitStack() as stack:
+        files = []
+        for row in rows:
+            if columns is None:
+                columns = list(row)
+                files = [
+                    stack.enter_context(open(_column_file(folder, n), "w", encoding="utf-8"))
+                    for n in range(len(columns))
+                ]
+
+            for name, f in zip(columns, files):
+                f.write(json.dumps(row.get(name, ""), ensure_ascii=False))
+                f.write("\n")
+            count += 1
+
+    return columns or [], count
+
+
+def get_dataset(dataset_id):
+    """
+    Returns a Dataset, or None if the id is unknown.
+    """
+    if not dataset_id or not _ID_PATTERN.fullmatch(dataset_id):
+        return None
+
+    folder = os.path.join(DATASETS_DIR, dataset_id)
+    try:
+        with open(os.path.join(folder, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    return Dataset(folder, manifest)
+
+
+def delete_dataset(dataset_id):
+    dataset = get_dataset(dataset_id)
+    if not dataset:
+        return False
+
+    shutil.rmtree(dataset.folder, ignore_errors=True)
+    return True
+
+
+# ---------------------------------------------------------
+# DATASET
+# ---------------------------------------------------------
+class Dataset:
+    """
+    A stored dataset. Iterating yields row dicts, read from the column
+    files in lockstep, so rows are never all in memory.
+    Can be iterated any number of times (e.g. validated, then rendered).
+
+    With a `mapping` ({layout field: dataset column}), rows are renamed
+    to the layout fields; a field mapped to "" is left empty.
+    """
+
+    def __init__(self, folder, manifest, mapping=None):
+        self.folder = folder
+        self.manifest = manifest
+        self.mapping = mapping
+
+    @property
+    def id(self):
+        return self.manifest["id"]
+
+    @property
+    def columns(self):
+        return list(self.mapping) if self.mapping is not None else self.manifest["columns"]
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def mapped(self, mapping):
+        return Dataset(self.folder, self.manifest, dict(mapping))
+
+    def __iter__(self):
+        sources = self._sources(self.columns)
+
+        with ExitStack() as stack:
+            readers = []
+            for name, source in sources.items():
+                if source is None:
+                    readers.append((name, None))
+                else:
+                    f = stack.enter_context(open(source, "r", encoding="utf-8"))
+                    readers.append((name, f))
+
+            for _ in range(len(self)):
+                yield {
+                    name: json.loads(f.readline()) if f else ""
+                    for name, f in readers
+                }
+
+    def load_columns(self, names):
+        """
+        Returns {name: [value per row]} for the requested names that
+        exist (absent names count as missing columns in validation).
+        Used by validator.validate_data_rows instead of building rows.
+        """
+        columns = {}
+        for name, source in self._sources(names).items():
+            if source is None:
+                columns[name] = [""] * len(self)
+                continue
+
+            with open(source, "r", encoding="utf-8") as f:
+                columns[name] = [json.loads(line) for line in f]
+
+        return columns
+
+    def preview(self, count=PREVIEW_ROWS):
+        return list(itertools.islice(self, count))
+
+    def _sources(self, names):
+        """
+        Maps each requested name that can be served to its column file
+        (None = an ignored field in the mapping: always "").
+        """
+        index = {name: n for n, name in enumerate(self.manifest["columns"])}
+        sources = {}
+
+        for name in names:
+            column = self.mapping.get(name) if self.mapping is not None else name
+            if self.mapping is not None and name in self.mapping and not column:
+                sources[name] = None
+            elif column in index:
+                sources[name] = _column_file(self.folder, index[column])
+
+        return sources
@@ -0,0 +1,241 @@
+import io
+import zlib
+import struct
+from PIL import Image, ImageChops
+
+from generator.config_loader import get_setting
+
+
+# Uncompressed bytes per strip in the streaming PNG writer
+PNG_STRIP_BYTES = 4 * 1024 * 1024
+
+
+# ---------------------------------------------------------
+# OUTPUT PROFILES
+# ---------------------------------------------------------
+# format:          PNG / JPEG / WEBP
+# compress_level:  PNG zlib level (0-9, lower = faster, bigger)
+# quality:         JPEG / lossy WebP quality
+# lossless:        WebP lossless mode
+# method:          WebP effort (0-6, lower = faster)
+# quantize:        reduce to a palette of N colours (PNG only)
+# flatten:         drop alpha when the image is fully opaque
+OUTPUT_PROFILES = {
+    "png": {"format": "PNG", "compress_level": 6},
+    "png_fast": {"format": "PNG", "compress_level": 1},
+    "png_small": {"format": "PNG", "compress_level": 9, "quantize": 256},
+    "jpeg": {"format": "JPEG", "quality": 90},
+    "jpeg_fast": {"format": "JPEG", "quality": 80},
+    "webp": {"format": "WEBP", "quality": 85, "method": 2},
+    "webp_lossless": {"format": "WEBP", "lossless": True, "quality": 20, "method": 0}
+}
+
+FORMAT_INFO = {
+    "PNG": {"extension": "png", "mimetype": "image/png"},
+    "JPEG": {"extension": "jpg", "mimetype": "image/jpeg"},
+    "WEBP": {"extension": "webp", "mimetype": "image/webp"}
+}
+
+
+def resolve_profile(profile=None):
+    """
+    Returns a complete profile dict from:
+    - None         → "output_profile" from config.json (default "png")
+    - a name       → one of OUTPUT_PROFILES
+    - a dict       → custom settings, optionally {"base": "<name>", ...}
+    Raises ValueError for unknown names or formats.
+    """
+    if profile is None:
+        profile = get_setting("output_profile", "png")
+
+    if isinstance(profile, str):
+        if profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Unknown output profile '{profile}'")
+        resolved = {"name": profile, "flatten": True, **OUTPUT_PROFILES[profile]}
+    elif isinstance(profile, dict):
+        base = profile.get("base", "png")
+        if base not in OUTPUT_PROFILES:
+            raise ValueError(f"Unknown output profile '{base}'")
+        resolved = {"name": "custom", "flatten": True, **OUTPUT_PROFILES[base]}
+        resolved.update({k: v for k, v in profile.items() if k != "base"})
+    else:
+        raise ValueError("Output profile must be a name or an object")
+
+    resolved["format"] = str(resolved.get("format", "PNG")).upper()
+    if resolved["format"] not in FORMAT_INFO:
+        raise ValueError(f"Unsupported output format '{resolved['format']}'")
+
+    return resolved
+
+
+def profile_extension(profile):
+    return FORMAT_INFO[profile["format"]]["extension"]
+
+
+def profile_mimetype(profile):
+    return FORMAT_INFO[profile["format"]]["mimetype"]
+
+
+# ---------------------------------------------------------
+# PREVIEW SCALING
+# ---------------------------------------------------------
+def scale_preview(image, max_width=None, max_height=None, full_size=None):
+    """
+    Downscales a rendered certificate to fit max_width x max_height
+    (either may be None). Never upscales.
+    `full_size` is the template's real size when `image` was drawn on a
+    smaller pyramid level, so the result has the same size a full
+    render would.
+    reducing_gap lets Pillow shrink by whole factors first, which is
+    much cheaper than resampling the full-resolution image.
+    """
+    width, height = full_size or image.size
+    ratio = 1.0
+    if max_width:
+        ratio = min(ratio, max_width / width)
+    if max_height:
+        ratio = min(ratio, max_height / height)
+
+    size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    if size == image.size:
+        return image
+
+    return image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+# ---------------------------------------------------------
+# ENCODING
+# ---------------------------------------------------------
+def prepare_image(image, profile):
+    """
+    Converts a rendered certificate to what the format needs:
+    - JPEG has no alpha → composited over white if not opaque
+    - otherwise RGBA → RGB when fully opaque and flatten is on
+    - optional palette quantization (PNG)
+    """
+    fmt = profile["format"]
+
+    if image.mode == "RGBA":
+        opaque = image.getchannel("A").getextrema()[0] == 255
+
+        if fmt == "JPEG" and not opaque:
+            flat = Image.new("RGB", image.size, (255, 255, 255))
+            flat.paste(image, mask=image.getchannel("A"))
+            image = flat
+        elif opaque and (fmt == "JPEG" or profile.get("flatten", True)):
+            image = image.convert("RGB")
+
+    colors = profile.get("quantize")
+    if colors and fmt == "PNG":
+        image = image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+
+    return image
+
+
+def save_image(image, fp, profile):
+    """
+    Encodes `image` into a path or file object using a resolved profile.
+    """
+    image = prepare_image(image, profile)
+    fmt = profile["format"]
+
+    if fmt == "PNG":
+        image.save(fp, "PNG", compress_level=profile.get("compress_level", 6))
+    elif fmt == "JPEG":
+        image.save(fp, "JPEG", quality=profile.get("quality", 90), optimize=False)
+    else:
+        image.save(
+            fp, "WEBP",
+            lossless=profile.get("lossless", False),
+            quality=profile.get("quality", 85),
+            method=profile.get("method", 4)
+        )
+
+
+def encode_to_bytes(image, profile):
+    """
+    Encodes `image` and returns the bytes.
+    """
+    buffer = io.BytesIO()
+    save_image(image, buffer, profile)
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------
+# COMPOSITE OUTPUT (region rendering, see render.render_regions)
+# ---------------------------------------------------------
+def save_composite(base, patches, fp, profile):
+    """
+    Encodes `base` with `patches` ([(box, patch), ...]) pasted on it.
+    PNG is written strip by strip, so the full page never exists in
+    memory; other formats (and palette PNG) need the whole image and
+    composite onto a single copy of the base.
+    """
+    if profile["format"] == "PNG" and not profile.get("quantize") \
+            and base.mode in ("RGB", "RGBA"):
+        if isinstance(fp, (str, bytes)) or hasattr(fp, "__fspath__"):
+            with open(fp, "wb") as f:
+                _write_png_strips(f, base, patches, profile.get("compress_level", 6))
+        else:
+            _write_png_strips(fp, base, patches, profile.get("compress_level", 6))
+        return
+
+    image = base.copy()
+    for box, patch in patches:
+        image.paste(patch, box[:2])
+    save_image(image, fp, profile)
+
+
+def encode_composite_to_bytes(base, patches, profile):
+    buffer = io.BytesIO()
+    save_composite(base, patches, buffer, profile)
+    return buffer.getvalue()
+
+
+def _write_png_strips(fp, base, patches, level):
+    """
+    Minimal PNG writer over horizontal strips of the base.
+    Every scanline uses the "Up" filter, computed for a whole strip at
+    once with ImageChops.subtract_modulo against the strip shifted down
+    by one row (the first row of the image is compared to zeros).
+    """
+    width, height = base.size
+    mode = base.mode
+    row_bytes = width * len(base.getbands())
+    rows = max(1, PNG_STRIP_BYTES // row_bytes)
+
+    fp.write(b"\x89PNG\r\n\x1a\n")
+    color_type = 6 if mode == "RGBA" else 2
+    _png_chunk(fp, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+
+    compressor = zlib.compressobj(level)
+    previous = Image.new(mode, (width, 1))
+
+    for top in range(0, height, rows):
+        bottom = min(height, top + rows)
+        strip = base.crop((0, top, width, bottom))
+        for box, patch in patches:
+            if box[1] < bottom and box[3] > top:
+                strip.paste(patch, (box[0], box[1] - top))
+
+        above = Image.new(mode, strip.size)
+        above.paste(previous, (0, 0))
+        above.paste(strip, (0, 1))
+        previous = strip.crop((0, strip.height - 1, width, strip.height))
+
+        filtered = ImageChops.subtract_modulo(strip, above).tobytes()
+        data = compressor.compress(b"".join(
+            b"\x02" + filtered[i:i + row_bytes] for i in range(0, len(filtered), row_bytes)
+        ))
+        if data:
+            _png_chunk(fp, b"IDAT", data)
+
+    _png_chunk(fp, b"IDAT", compressor.flush())
+    _png_chunk(fp, b"IEND", b"")
+
+
+def _png_chunk(fp, kind, data):
+    fp.write(struct.pack(">I", len(data)))
+    fp.write(kind)
+    fp.write(data)
+    fp.write(struct.pack(">I", zlib.crc32(kind + data)))
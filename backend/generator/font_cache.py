@@ -0,0 +1,89 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import ImageFont
+
+from generator.config_loader import get_setting
+
+
+# (resolved path, size, variation) -> FreeTypeFont
+_cache = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def get_font(path, size, variation=None):
+    """
+    Returns a FreeTypeFont for (path, size, variation), parsing the
+    font file only on the first request.
+    `variation` selects an instance of a variable font:
+    - str  → named instance, e.g. "Bold"
+    - dict → axis values by axis name, e.g. {"Weight": 700, "Width": 90}
+    Font objects are shared: never call set_variation_* on them.
+    """
+    key = (os.path.realpath(path), size, variation_key(variation))
+
+    with _lock:
+        font = _cache.get(key)
+        if font is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return font
+
+    font = ImageFont.truetype(key[0], size)
+    if variation:
+        _apply_variation(font, variation)
+
+    # Identifies the font in text_cache measurement keys
+    font.cache_key = key
+
+    with _lock:
+        _stats["misses"] += 1
+        _cache[key] = font
+        limit = max(1, int(get_setting("font_cache_size", 256)))
+        while len(_cache) > limit:
+            _cache.popitem(last=False)
+            _stats["evictions"] += 1
+
+    return font
+
+
+def clear_font_cache():
+    with _lock:
+        _cache.clear()
+
+
+def font_cache_stats():
+    """
+    Returns hit/miss/eviction counters and the current entry count.
+    """
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_cache),
+            "max_entries": int(get_setting("font_cache_size", 256))
+        }
+
+
+def variation_key(variation):
+    """
+    Hashable form of a variation setting (for use in cache keys).
+    """
+    if not variation:
+        return None
+    if isinstance(variation, dict):
+        return tuple(sorted(variation.items()))
+    return str(variation)
+
+
+def _apply_variation(font, variation):
+    if isinstance(variation, dict):
+        values = []
+        for axis in font.get_variation_axes():
+            name = axis["name"]
+            if isinstance(name, bytes):
+                name = name.decode("utf-8", "replace")
+            values.append(variation.get(name, axis["default"]))
+        font.set_variation_by_axes(values)
+    else:
+        font.set_variation_by_name(variation)
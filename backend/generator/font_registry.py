@@ -0,0 +1,431 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from functools import lru_cache
+from fontTools.ttLib import TTFont
+
+from generator.path_utils import BACKEND_DIR
+from generator.text_cache import clear_text_cache
+
+
+# Absolute paths inside backend/
+BUILTIN_FONTS_DIR = os.path.join(BACKEND_DIR, "fonts")
+USER_FONTS_DIR = os.path.join(BACKEND_DIR, "uploads", "fonts")
+
+VALID_EXTENSIONS = {".ttf", ".otf"}
+
+# Font sources, in lookup order: a user font shadows a built-in one
+# with the same file name
+FONT_SOURCES = (
+    (USER_FONTS_DIR, "user"),
+    (BUILTIN_FONTS_DIR, "built_in")
+)
+
+# Parsed font metadata, kept between runs so fonts are only read again
+# when their file changes:
+#   {path: {"mtime_ns", "size", "family", "style", "weight", "width",
+#           "italic", "ranges": [[first, last], ...]}}
+FONT_INDEX_FILE = os.path.join(BACKEND_DIR, "cache", "font_index.json")
+
+# Seconds between font folder checks (a miss always checks)
+REGISTRY_CHECK_INTERVAL = 2.0
+
+RUN_CACHE_SIZE = 4096
+
+# The registry:
+#   "fonts":     file name -> entry (see _describe), in FONT_SOURCES order
+#   "by_path":   path -> entry
+#   "signature": (mtime_ns, size) of each source folder
+#   "version":   hash of every font file's name + signature (stable
+#                across processes, see font_registry_version)
+#   "generation" changes on every rebuild (part of the run cache key)
+_registry = {
+    "fonts": {}, "by_path": {}, "signature": None, "version": None,
+    "generation": 0, "checked_at": 0.0
+}
+_lock = threading.Lock()
+
+
+# ---------------------------------------------------------
+# LOOKUP
+# ---------------------------------------------------------
+def find_font(name):
+    """
+    Path of the font file called `name` (user fonts first), or None.
+    Answered from memory; an unknown name re-checks the font folders
+    first, so a font added a moment ago is found.
+    """
+    _refresh_if_due()
+    entry = _registry["fonts"].get(name)
+    if entry is None and _folders_changed():
+        refresh_font_registry()
+        entry = _registry["fonts"].get(name)
+    return entry["path"] if entry else None
+
+
+def list_registered_fonts():
+    """
+    Every font with its family, style, weight (100-900), width class
+    (1-9) and italic flag, user fonts first.
+    A font shadowed by a user font of the same name is not listed.
+    """
+    _refresh_if_due()
+    return [
+        {k: v for k, v in entry.items() if k not in ("coverage", "ranges", "mtime_ns", "size")}
+        for entry in _registry["fonts"].values()
+    ]
+
+
+def font_info(path):
+    """
+    The registry entry for a font path, or None for fonts outside the
+    font folders.
+    """
+    _refresh_if_due()
+    return _registry["by_path"].get(path)
+
+
+def font_registry_version():
+    """
+    Changes whenever a font is added, removed or replaced. Part of the
+    keys of anything that depends on which fonts exist (compiled
+    layouts, cached renders).
+    """
+    _refresh_if_due()
+    return _registry["version"]
+
+
+def default_font_path(preferred=None):
+    """
+    The font used when a layout's font is missing: `preferred` (a
+    file name) if installed, else the first upright regular font that
+    covers the Latin alphabet.
+    """
+    if preferred:
+        path = find_font(preferred)
+        if path:
+            return path
+
+    latin = _text_mask("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789")
+    fonts = sorted(
+        _registry["fonts"].values(),
+        key=lambda e: (e["italic"], abs(e["weight"] - 400), abs(e["width"] - 5), e["name"])
+    )
+    for entry in fonts:
+        if latin & ~entry["coverage"] == 0:
+            return entry["path"]
+    return fonts[0]["path"] if fonts else None
+
+
+# ---------------------------------------------------------
+# COVERAGE + FALLBACK RUNS
+# ---------------------------------------------------------
+def covers(path, text):
+    """
+    True if the font at `path` has a glyph for every character of
+    `text` (fonts outside the registry are assumed to).
+    """
+    entry = font_info(path)
+    return entry is None or _text_mask(text) & ~entry["coverage"] == 0
+
+
+def split_runs(path, text):
+    """
+    Splits `text` into runs drawn with one font each:
+    ((text, path or None), ...) where None is the font at `path`.
+    Characters that font lacks go to a fallback font covering the
+    whole run where possible (same family, weight, width and slant
+    preferred); spaces between two fallback characters stay in the
+    fallback run. Characters no font covers stay in `path`.
+    Text the font covers entirely is a single (text, None) run.
+    """
+    _refresh_if_due()
+    return _split_runs(_registry["generation"], path, text)
+
+
+@lru_cache(maxsize=RUN_CACHE_SIZE)
+def _split_runs(generation, path, text):
+    entry = _registry["by_path"].get(path)
+    if entry is None:
+        return ((text, None),)
+
+    coverage = entry["coverage"]
+    if _text_mask(text) & ~coverage == 0:
+        return ((text, None),)
+
+    # Mark characters the primary font lacks; whitespace between two
+    # of them joins them, so "عبد الله" stays one run
+    missing = [not _has(coverage, ord(c)) for c in text]
+    for i, c in enumerate(text):
+        if c.isspace() and not missing[i]:
+            missing[i] = (_nearest_missing(text, missing, range(i - 1, -1, -1))
+                          and _nearest_missing(text, missing, range(i + 1, len(text))))
+
+    # Group consecutive characters with the same status into segments,
+    # then pick a font per fallback segment
+    fonts = []
+    start = 0
+    for i in range(1, len(text) + 1):
+        if i == len(text) or missing[i] != missing[start]:
+            segment = text[start:i]
+            if missing[start]:
+                fonts += _fallback_fonts(path, segment)
+            else:
+                fonts += [None] * len(segment)
+            start = i
+
+    runs = []
+    for char, font in zip(text, fonts):
+        if runs and runs[-1][1] == font:
+            runs[-1][0].append(char)
+        else:
+            runs.append(([char], font))
+    return tuple(("".join(chars), font) for chars, font in runs)
+
+
+def _nearest_missing(text, missing, indices):
+    """
+    Whether the first non-space character at `indices` is missing.
+    """
+    return next((missing[j] for j in indices if not text[j].isspace()), False)
+
+
+def _fallback_fonts(path, segment):
+    """
+    One font per character of `segment`: the first candidate covering
+    the whole segment, else per character the first candidate that has
+    it (None when no font does).
+    """
+    mask = _text_mask(segment)
+    candidates = _candidates(_registry["generation"], path)
+
+    for entry in candidates:
+        if mask & ~entry["coverage"] == 0:
+            return [entry["path"]] * len(segment)
+
+    fonts = []
+    for char in segment:
+        cp = ord(char)
+        fonts.append(next((e["path"] for e in candidates if _has(e["coverage"], cp)), None))
+
+    # Whitespace rides along with the run before it
+    for i, char in enumerate(segment):
+        if fonts[i] is None and char.isspace() and i:
+            fonts[i] = fonts[i - 1]
+    return fonts
+
+
+@lru_cache(maxsize=256)
+def _candidates(generation, path):
+    """
+    Fallback order for the font at `path`: same family first, then
+    matching slant, closest weight and width; user fonts before
+    built-in ones on a tie.
+    """
+    primary = _registry["by_path"][path]
+    order = {name: n for n, name in enumerate(_registry["fonts"])}
+
+    def score(entry):
+        return (
+            entry["family"] != primary["family"],
+            entry["italic"] != primary["italic"],
+            abs(entry["weight"] - primary["weight"]),
+            abs(entry["width"] - primary["width"]),
+            order[entry["name"]]
+        )
+
+    return tuple(sorted(
+        (e for e in _registry["by_path"].values() if e["path"] != path), key=score
+    ))
+
+
+# ---------------------------------------------------------
+# BUILDING
+# ---------------------------------------------------------
+def refresh_font_registry(force=False):
+    """
+    Re-reads the font folders. Fonts whose file is unchanged keep their
+    indexed metadata (from memory or FONT_INDEX_FILE); new or changed
+    files are parsed. Call after adding or replacing a font file.
+    force=True parses every font again.
+    """
+    with _lock:
+        index = {} if force else _load_index()
+        for entry in _registry["by_path"].values():
+            index.setdefault(entry["path"], entry)
+
+        fonts = {}
+        by_path = {}
+        changed = False
+        for folder, source in FONT_SOURCES:
+            for name in sorted(_list_folder(folder)):
+                # Resolved like font_cache does, so FreeTypeFont.path
+                # finds the entry
+                path = os.path.realpath(os.path.join(folder, name))
+                entry = _load_entry(index.get(path), path, name, source)
+                if entry is None:
+                    continue
+                changed |= entry is not index.get(path)
+                by_path[path] = entry
+                fonts.setdefault(name, entry)
+
+        if changed or set(by_path) != set(index):
+            _save_index(by_path)
+
+        version = hashlib.sha1(json.dumps(sorted(
+            (e["name"], e["source"], e["mtime_ns"], e["size"]) for e in by_path.values()
+        )).encode("utf-8")).hexdigest()
+
+        # Cached measurements of text set in fallback fonts may be stale
+        if _registry["version"] not in (None, version):
+            clear_text_cache()
+
+        _registry["fonts"] = fonts
+        _registry["by_path"] = by_path
+        _registry["signature"] = _folder_signature()
+        _registry["version"] = version
+        _registry["generation"] += 1
+        _registry["checked_at"] = time.monotonic()
+
+
+def _refresh_if_due():
+    if time.monotonic() - _registry["checked_at"] < REGISTRY_CHECK_INTERVAL:
+        return
+    if _registry["signature"] is None or _folders_changed():
+        refresh_font_registry()
+    else:
+        _registry["checked_at"] = time.monotonic()
+
+
+def _folders_changed():
+    return _folder_signature() != _registry["signature"]
+
+
+def _folder_signature():
+    signature = []
+    for folder, _ in FONT_SOURCES:
+        try:
+            st = os.stat(folder)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _list_folder(folder):
+    try:
+        return [
+            f for f in os.listdir(folder)
+            if os.path.splitext(f)[1].lower() in VALID_EXTENSIONS
+        ]
+    except OSError:
+        return []
+
+
+def _load_entry(cached, path, name, source):
+    """
+    The registry entry for one font file: `cached` if the file is
+    unchanged, else parsed again. None for unreadable files.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    if cached and cached["mtime_ns"] == st.st_mtime_ns and cached["size"] == st.st_size:
+        entry = dict(cached, name=name, source=source)
+    else:
+        try:
+            entry = _describe(path)
+        except Exception as e:
+            print(f"[WARN] Could not index font {path}: {e}")
+            return None
+        entry.update(mtime_ns=st.st_mtime_ns, size=st.st_size, name=name, source=source)
+
+    if "coverage" not in entry:
+        entry["coverage"] = _ranges_mask(entry["ranges"])
+    return entry
+
+
+def _describe(path):
+    """
+    Reads family, style, weight, width, slant and cmap coverage.
+    """
+    font = TTFont(path, lazy=True)
+    try:
+        names = font["name"]
+        os2 = font["OS/2"] if "OS/2" in font else None
+        codepoints = sorted(font.getBestCmap() or {})
+
+        return {
+            "path": path,
+            "family": names.getDebugName(16) or names.getDebugName(1) or "",
+            "style": names.getDebugName(17) or names.getDebugName(2) or "Regular",
+            "weight": os2.usWeightClass if os2 else 400,
+            "width": os2.usWidthClass if os2 else 5,
+            "italic": bool(os2.fsSelection & 1) if os2 else False,
+            "ranges": _ranges(codepoints)
+        }
+    finally:
+        font.close()
+
+
+def _load_index():
+    try:
+        with open(FONT_INDEX_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(by_path):
+    index = {
+        path: {k: v for k, v in entry.items() if k not in ("coverage", "name", "source")}
+        for path, entry in by_path.items()
+    }
+    # Per-process temp file: pool workers may build the index together
+    tmp_path = f"{FONT_INDEX_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(FONT_INDEX_FILE), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, FONT_INDEX_FILE)
+    except OSError as e:
+        print(f"[WARN] Could not save font index: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+# ---------------------------------------------------------
+# BITSETS (one bit per codepoint, in a Python int)
+# ---------------------------------------------------------
+def _ranges(codepoints):
+    ranges = []
+    for cp in codepoints:
+        if ranges and ranges[-1][1] == cp - 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return ranges
+
+
+def _ranges_mask(ranges):
+    mask = 0
+    for first, last in ranges:
+        mask |= ((1 << (last - first + 1)) - 1) << first
+    return mask
+
+
+def _text_mask(text):
+    mask = 0
+    for char in set(text):
+        mask |= 1 << ord(char)
+    return mask
+
+
+def _has(mask, cp):
+    return (mask >> cp) & 1
@@ -1,10 +1,43 @@
 import os
-from generator.layout_loader import load_layout
-from generator.render import render_certificate
-from generator.validator import validate_before_render
+import multiprocessing
+from functools import lru_cache
+from collections import deque
+from collections.abc import Sized
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw
+
+from generator.compiled_layout import get_compiled_layout
+from generator.render import (
+    render_certificate, load_template_image, render_regions, use_region_rendering,
+    field_texts, layout_field, field_box, boxes_intersect
+)
+from generator.template_cache import template_size, get_template_base
+from generator.template_pyramid import get_template_pyramid, pick_level
+from generator.config_loader import get_setting
+from generator.validator import rows_to_columns
+from generator.pdf_output import encode_overlay
+from generator.encoder import (
+    resolve_profile, profile_extension, save_image, encode_to_bytes, scale_preview,
+    save_composite, encode_composite_to_bytes
+)
+from generator.pdf_render import render_certificate_pdf
+from generator.render_cache import (
+    render_fingerprint, row_cache_key, cache_read, cache_copy, cache_store
+)
 from generator.path_utils import BACKEND_DIR
 
 
+# Chunks queued per pool worker; bounds how far ahead of the consumer
+# rows are read and rendered
+POOL_CHUNKS_PER_WORKER = 4
+
+# Pool workers are not plain fork()s of the server: pools are started
+# from job and request threads, and a fork taken while another thread
+# holds one of the cache locks would deadlock in the child. Workers
+# come from a single-threaded fork server with this module imported.
+POOL_START_METHODS = ("forkserver", "spawn")
+
+
 def generate_single(template_id, data):
     """
     Generates a single certificate image object.
@@ -12,9 +45,9 @@ def generate_single(template_id, data):
       - PIL.Image object on success
       - {"errors": [...]} on validation failure
     """
-    layout = load_layout(template_id)
+    layout = get_compiled_layout(template_id)
 
-    errors = validate_before_render(template_id, layout, data)
+    errors = layout.validate_row(data)
     if errors:
         return {"errors": errors}
 
@@ -23,32 +56,568 @@ def generate_single(template_id, data):
     return img
 
 
-def generate_bulk(template_id, rows, output_dir=None):
+def generate_preview(template_id, data, max_width=None, max_height=None):
+    """
+    generate_single scaled to fit max_width x max_height.
+    Draws on the smallest pyramid level that still covers the requested
+    size (with the layout scaled to match) instead of rendering at full
+    resolution and shrinking the result.
+    Returns a PIL.Image or {"errors": [...]}.
+    """
+    layout = get_compiled_layout(template_id)
+
+    errors = layout.validate_row(data)
+    if errors:
+        return {"errors": errors}
+
+    return _render_preview(template_id, layout, data, max_width, max_height)
+
+
+def _render_preview(template_id, layout, data, max_width, max_height):
+    manifest = get_template_pyramid(template_id) if (max_width or max_height) else None
+    level = pick_level(manifest, max_width, max_height) if manifest else None
+
+    if level is None or level["name"] == "print":
+        img = render_certificate(template_id, layout, data)
+        return scale_preview(img, max_width, max_height)
+
+    full = manifest["levels"][0]
+    base = get_template_base(template_id, level["name"])
+    img = render_certificate(template_id, layout.scaled(level["width"] / full["width"]), data,
+                             base=base)
+    return scale_preview(img, max_width, max_height, (full["width"], full["height"]))
+
+
+def generate_single_bytes(template_id, data, profile, max_width=None, max_height=None,
+                          use_cache=False):
+    """
+    generate_preview encoded with `profile` (a resolved profile).
+    Returns the encoded bytes or {"errors": [...]}.
+    use_cache=True reads and fills the render cache. Off by default:
+    editor previews are throwaway renders that would cost a disk write
+    each and push real bulk output out of the cache.
+    """
+    layout = get_compiled_layout(template_id)
+
+    errors = layout.validate_row(data)
+    if errors:
+        return {"errors": errors}
+
+    cache = None
+    if use_cache:
+        cache = render_fingerprint(template_id, layout, profile,
+                                   max_width=max_width, max_height=max_height)
+    key = row_cache_key(cache, data) if cache else None
+    if key:
+        cached = cache_read(key, cache["extension"])
+        if cached is not None:
+            return cached
+
+    img = _render_preview(template_id, layout, data, max_width, max_height)
+    encoded = encode_to_bytes(img, profile)
+    if key:
+        cache_store(key, cache["extension"], data=encoded)
+    return encoded
+
+
+def generate_single_pdf(template_id, data):
+    """
+    Vector counterpart of generate_single.
+    Returns:
+      - PDF bytes (one page, real text over the template) on success
+      - {"errors": [...]} on validation failure
+    """
+    layout = get_compiled_layout(template_id)
+
+    errors = layout.validate_row(data)
+    if errors:
+        return {"errors": errors}
+
+    return render_certificate_pdf(template_id, layout, data)
+
+
+def validate_bulk(template_id, rows):
+    """
+    Validates every row of a bulk job before anything is rendered.
+    Returns {row_number: [errors]} for the invalid rows only.
+    """
+    return get_compiled_layout(template_id).validate_rows(rows)
+
+
+def generate_bulk(template_id, rows, output_dir=None, workers=None, profile=None):
     """
-    Generates multiple certificates from a list of data rows.
-    Saves each certificate as a PNG file.
-    Returns a list of:
+    Generates multiple certificates from a list of data rows
+    (or a stored dataset, or any iterable of rows, e.g. data_loader.iter_csv).
+    Saves each certificate as an image file encoded with `profile`
+    (see encoder.OUTPUT_PROFILES; default "output_profile" from config.json).
+    Rows are spread across a process pool of `workers` processes
+    (default: "bulk_workers" from config.json, 0 = one per CPU core).
+    Rows rendered before with the same template, layout, fonts and
+    profile are copied from the render cache (render_cache.py) and
+    marked "cached": true.
+    Pool workers are started with forkserver/spawn, which import the
+    main script again: a script calling this must keep its own work
+    under `if __name__ == "__main__":`.
+    Returns a list, in row order, of:
       { "row": i, "file": "..."} or { "row": i, "errors": [...] }
     """
+    return list(iter_generate_bulk(template_id, rows, output_dir, workers, profile))
+
+
+def iter_generate_bulk(template_id, rows, output_dir=None, workers=None, profile=None,
+                       error_index=None, skip_rows=None):
+    """
+    Same as generate_bulk, but yields each row result as soon as it
+    (and every row before it) is done.
+    Closing the iterator early cancels rows that have not started yet.
+    `error_index` is a validate_bulk result, if the caller already has one.
+    Row numbers in `skip_rows` (e.g. finished before a restart) are
+    left out entirely: no result is yielded for them.
+    As with generate_bulk, a calling script needs an
+    `if __name__ == "__main__":` guard when more than one worker runs.
+    """
     if output_dir is None:
         output_dir = os.path.join(BACKEND_DIR, "output")
 
     os.makedirs(output_dir, exist_ok=True)
 
-    results = []
+    yield from _iter_bulk(template_id, rows, workers, "file", output_dir, profile, error_index,
+                          skip_rows)
+
+
+def iter_encode_bulk(template_id, rows, workers=None, profile=None, error_index=None):
+    """
+    Like iter_generate_bulk, but nothing is written to disk.
+    Yields, in row order:
+      { "row": i, "data": b"<encoded image>" } or { "row": i, "errors": [...] }
+    """
+    yield from _iter_bulk(template_id, rows, workers, "bytes", None, profile, error_index)
+
+
+def iter_overlay_bulk(template_id, rows, workers=None, error_index=None, skip_rows=None):
+    """
+    Renders only the text of each row, onto a transparent layer the
+    size of the template, and yields it cropped and compressed for
+    the PDF writer:
+      { "row": i, "overlay": {...} } or { "row": i, "errors": [...] }
+    See pdf_output.encode_overlay for the overlay format.
+    `skip_rows` as in iter_generate_bulk.
+    """
+    yield from _iter_bulk(template_id, rows, workers, "overlay", None, None, error_index,
+                          skip_rows)
+
+
+def _iter_bulk(template_id, rows, workers, mode, output_dir, profile=None, error_index=None,
+               skip_rows=None):
+    layout = get_compiled_layout(template_id)
+
+    # Datasets of known size are validated and scanned for constant
+    # fields up front; streamed rows are checked as they arrive
+    constant = {}
+    row_count = None
+    if isinstance(rows, Sized):
+        row_count = len(rows)
+        if error_index is None:
+            error_index = layout.validate_rows(rows)
+        constant = find_constant_fields(layout, rows, error_index)
+
+    # Very large templates are rendered region by region (None = whole page)
+    size = template_size(template_id)
+    region_size = size if use_region_rendering(size) else None
+    if region_size:
+        # Every field, constant ones included, is drawn into the region
+        # patches: a job base with the constant fields pre-drawn would be
+        # a full-size copy of the template in every worker
+        constant = {}
+
+    # Invalid rows never reach the renderer or the pool
+    checked = layout.check_rows(rows, error_index)
+    if skip_rows:
+        checked = (entry for entry in checked if entry[0] not in skip_rows)
+        if row_count is not None:
+            row_count -= len(skip_rows)
+
+    workers = resolve_worker_count(workers, row_count)
+
+    # Resolved once here so every worker encodes the same way
+    profile = resolve_profile(profile) if mode in ("file", "bytes") else None
+
+    # Encoded rows are looked up in the render cache first. Constant
+    # fields drawn on the job base give the same pixels as a full
+    # render (see _stacking_guard), so they are not part of the key.
+    cache = None
+    if profile is not None:
+        cache = render_fingerprint(template_id, layout, profile, regions=bool(region_size))
+
+    # Small jobs are not worth the cost of starting a pool
+    if workers <= 1:
+        base = None
+        guard = None
+        row_layout = _variable_layout(layout, constant)
+        for i, row, errors in checked:
+            if errors:
+                yield {"row": i, "errors": errors}
+                continue
+            if base is None:
+                base = _job_base(template_id, layout, mode, constant, region_size)
+                guard = _stacking_guard(layout, base, constant)
+            yield _render_row(template_id, row_layout, base, i, row, mode, output_dir, profile,
+                              region_size, cache, guard)
+        return
+
+    chunk_size = max(1, int(get_setting("bulk_chunk_size", 8)))
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=_pool_context(),
+        initializer=_init_worker,
+        initargs=(template_id, mode, output_dir, profile, constant, region_size, cache)
+    )
+    try:
+        yield from _iter_pool(pool, checked, chunk_size, workers * POOL_CHUNKS_PER_WORKER)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+@lru_cache(maxsize=1)
+def _pool_context():
+    available = multiprocessing.get_all_start_methods()
+    method = next(m for m in POOL_START_METHODS if m in available)
+    context = multiprocessing.get_context(method)
+    if method == "forkserver":
+        context.set_forkserver_preload(["generator.generate"])
+    return context
+
+
+def _iter_pool(pool, checked, chunk_size, window):
+    """
+    Sends valid rows to the pool in chunks and yields results in row order.
+    Unlike Executor.map, rows are read from `checked` only as results
+    are consumed: at most `window` chunks are queued at any time, so a
+    streamed dataset is never fully in memory.
+    """
+    # In row order: Future (rendered chunk) or list (validation errors)
+    pending = deque()
+    chunk = []
+
+    def flush():
+        if chunk:
+            pending.append(pool.submit(_worker_render_rows, list(chunk)))
+            chunk.clear()
+
+    for i, row, errors in checked:
+        if errors:
+            # Close the current chunk first so results stay in order
+            flush()
+            pending.append([{"row": i, "errors": errors}])
+        else:
+            chunk.append((i, row))
+            if len(chunk) >= chunk_size:
+                flush()
+
+        while len(pending) > window:
+            yield from _chunk_results(pending.popleft())
+
+    flush()
+    while pending:
+        yield from _chunk_results(pending.popleft())
+
+
+def _chunk_results(entry):
+    return entry if isinstance(entry, list) else entry.result()
 
-    for i, row in enumerate(rows, start=1):
-        result = generate_single(template_id, row)
 
-        # Validation error
-        if isinstance(result, dict) and "errors" in result:
-            results.append({"row": i, "errors": result["errors"]})
+def find_constant_fields(layout, rows, error_index):
+    """
+    Returns {field_name: text} for layout fields that have the same
+    text in every valid row (e.g. course title, date, issuer).
+    These are drawn once onto the job base instead of on every row.
+    Needs at least two valid rows; otherwise returns {}.
+    """
+    if len(rows) - len(error_index) < 2:
+        return {}
+
+    names = [field.name for field in layout.fields]
+    if hasattr(rows, "load_columns"):
+        columns = rows.load_columns(names)
+    else:
+        columns = rows_to_columns(rows, names)
+
+    constant = {}
+    for name in names:
+        column = columns.get(name)
+        if column is None:
             continue
 
-        # Save certificate
-        filename = os.path.join(output_dir, f"certificate_{i}.png")
-        result.save(filename)
+        # Compare what gets drawn (see render.field_texts)
+        values = set()
+        for i, value in enumerate(column, start=1):
+            if i in error_index:
+                continue
+            values.add(str(value).strip())
+            if len(values) > 1:
+                break
+
+        if len(values) == 1:
+            constant[name] = values.pop()
+
+    return constant
+
+
+def resolve_worker_count(workers, row_count=None):
+    """
+    Resolves the number of worker processes for a bulk job.
+    Never starts more workers than there are rows (when the row count
+    is known; streamed rows have none).
+    """
+    if workers is None:
+        workers = get_setting("bulk_workers", 0)
+
+    workers = int(workers or 0)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+
+    if row_count is not None:
+        workers = min(workers, row_count)
+
+    return max(1, workers)
+
+
+# ---------------------------------------------------------
+# ROW RENDERING (shared by serial + pool paths)
+# ---------------------------------------------------------
+def _load_base(template_id, mode):
+    """
+    Image each row is drawn on:
+    - the template itself for "file" / "bytes"
+    - a transparent layer of the same size for "overlay"
+    """
+    base = load_template_image(template_id)
+    if mode == "overlay":
+        return Image.new("RGBA", base.size, (0, 0, 0, 0))
+    return base
+
+
+def _job_base(template_id, layout, mode, constant, region_size=None):
+    """
+    The image rows are drawn on, with the constant fields already
+    drawn (see find_constant_fields). Built once per job and process.
+    Constant fields end up below every variable field; rows where that
+    differs from a full render are caught by _stacking_guard.
+    Region-rendered jobs have no constant fields, so the base is the
+    shared template image (never copied); overlays need none (None).
+    """
+    if region_size and mode == "overlay":
+        return None
+
+    base = _load_base(template_id, mode)
+    if not constant:
+        return base
+    return render_certificate(template_id, layout.subset(constant), constant, base=base)
+
+
+def _stacking_guard(layout, base, constant):
+    """
+    A full render draws fields in layout order; on the job base the
+    constant fields come first. That only changes pixels where a
+    variable field listed before a constant field overlaps its ink.
+    Returns, for each such variable field, the (fixed) boxes of the
+    constant fields after it, for _overlaps_constant to check per row;
+    None when no variable field precedes a constant one.
+    """
+    if not constant:
+        return None
+
+    draw = ImageDraw.Draw(Image.new(base.mode, (1, 1)))
+
+    # Ink boxes of the constant fields, 1px wider for anti-aliasing at
+    # fractional positions
+    boxes = {}
+    for name, field, shaped in field_texts(layout.subset(constant), constant):
+        font, lines = layout_field(draw, field, shaped)
+        box = field_box(draw, font, lines)
+        if box:
+            boxes[name] = (box[0] - 1, box[1] - 1, box[2] + 1, box[3] + 1)
+
+    checks = {}
+    later = []
+    for field in reversed(layout.fields):
+        if field.name in constant:
+            if field.name in boxes:
+                later.append(boxes[field.name])
+        elif later:
+            checks[field.name] = list(later)
+
+    if not checks:
+        return None
+
+    return {
+        "draw": draw,
+        "fields": layout.subset(checks),
+        "boxes": checks,
+        "layout": layout
+    }
+
+
+def _overlaps_constant(guard, row):
+    """
+    True if one of the guarded variable fields of `row` overlaps a
+    constant field drawn after it, i.e. the row needs a full render.
+    Measurements come from the text cache, so this costs little more
+    than the layout the render does anyway.
+    """
+    draw = guard["draw"]
+    for name, field, shaped in field_texts(guard["fields"], row):
+        font, lines = layout_field(draw, field, shaped)
+        box = field_box(draw, font, lines)
+        if box and any(boxes_intersect(box, other) for other in guard["boxes"][name]):
+            return True
+    return False
+
+
+def _variable_layout(layout, constant):
+    """
+    The fields still drawn per row.
+    """
+    if not constant:
+        return layout
+    return layout.subset([f.name for f in layout.fields if f.name not in constant])
+
+
+def _render_row(template_id, layout, base, i, row, mode, output_dir, profile,
+                region_size=None, cache=None, guard=None):
+    """
+    Renders one (already validated) row, then depending on mode:
+    - "file"    → saves certificate_<i>.<ext> to output_dir
+    - "bytes"   → returns the encoded image bytes
+    - "overlay" → returns the compressed text layer (PDF output)
+    With a `region_size` (very large templates) see _render_row_regions.
+    With a `cache` fingerprint (render_cache.render_fingerprint) the
+    encoded output is taken from, or added to, the render cache.
+    With a `guard` (see _stacking_guard), rows whose fields would stack
+    differently on the job base are drawn in full instead.
+    """
+    key = row_cache_key(cache, row) if cache else None
+    if key:
+        result = _cached_row(key, cache["extension"], i, mode, output_dir, profile)
+        if result:
+            return result
+
+    if guard and _overlaps_constant(guard, row):
+        layout = guard["layout"]
+        base = _load_base(template_id, mode)
+
+    result = _draw_row(template_id, layout, base, i, row, mode, output_dir, profile, region_size)
+
+    if key:
+        if mode == "bytes":
+            cache_store(key, cache["extension"], data=result["data"])
+        else:
+            cache_store(key, cache["extension"], source=result["file"])
+    return result
+
+
+def _cached_row(key, extension, i, mode, output_dir, profile):
+    """
+    The _render_row result for a render cache hit, or None on a miss.
+    """
+    if mode == "bytes":
+        data = cache_read(key, extension)
+        return {"row": i, "data": data, "cached": True} if data is not None else None
+
+    filename = os.path.join(output_dir, f"certificate_{i}.{profile_extension(profile)}")
+    if cache_copy(key, extension, filename):
+        return {"row": i, "file": filename, "cached": True}
+    return None
+
+
+def _draw_row(template_id, layout, base, i, row, mode, output_dir, profile, region_size):
+    """
+    _render_row without the render cache.
+    """
+    if region_size:
+        return _render_row_regions(layout, base, i, row, mode, output_dir, profile, region_size)
+
+    img = render_certificate(template_id, layout, row, base=base)
+
+    if mode == "overlay":
+        return {"row": i, "overlay": encode_overlay(img)}
+
+    # In-memory output (archives, streaming)
+    if mode == "bytes":
+        return {"row": i, "data": encode_to_bytes(img, profile)}
+
+    # Save certificate
+    filename = os.path.join(output_dir, f"certificate_{i}.{profile_extension(profile)}")
+    save_image(img, filename, profile)
+
+    return {"row": i, "file": filename}
+
+
+def _render_row_regions(layout, base, i, row, mode, output_dir, profile, size):
+    """
+    _render_row for very large templates: only the field regions are
+    drawn (render.render_regions) and composited while encoding, so a
+    row never copies or converts the full-size base. PNG output is
+    streamed in strips; other formats composite onto one copy.
+    Overlays become one compressed patch per region.
+    """
+    if mode == "overlay":
+        overlays = [
+            encode_overlay(patch, box[:2])
+            for box, patch in render_regions(layout, row, size)
+        ]
+        return {"row": i, "overlay": [o for o in overlays if o] or None}
+
+    patches = render_regions(layout, row, size, base)
+
+    if mode == "bytes":
+        return {"row": i, "data": encode_composite_to_bytes(base, patches, profile)}
+
+    filename = os.path.join(output_dir, f"certificate_{i}.{profile_extension(profile)}")
+    save_composite(base, patches, filename, profile)
+
+    return {"row": i, "file": filename}
+
+
+# ---------------------------------------------------------
+# PROCESS POOL WORKERS
+# ---------------------------------------------------------
+# Per-process state, filled once by _init_worker
+_worker_state = {}
+
+
+def _init_worker(template_id, mode, output_dir, profile, constant, region_size, cache):
+    """
+    Runs once in each worker process.
+    Compiles the layout and builds the job base a single time.
+    """
+    layout = get_compiled_layout(template_id)
+    _worker_state["template_id"] = template_id
+    _worker_state["layout"] = _variable_layout(layout, constant)
+    _worker_state["base"] = _job_base(template_id, layout, mode, constant, region_size)
+    _worker_state["guard"] = _stacking_guard(layout, _worker_state["base"], constant)
+    _worker_state["mode"] = mode
+    _worker_state["output_dir"] = output_dir
+    _worker_state["profile"] = profile
+    _worker_state["region_size"] = region_size
+    _worker_state["cache"] = cache
 
-        results.append({"row": i, "file": filename})
 
-    return results
+def _worker_render_rows(chunk):
+    return [
+        _render_row(
+            _worker_state["template_id"],
+            _worker_state["layout"],
+            _worker_state["base"],
+            i,
+            row,
+            _worker_state["mode"],
+            _worker_state["output_dir"],
+            _worker_state["profile"],
+            _worker_state["region_size"],
+            _worker_state["cache"],
+            _worker_state["guard"]
+        )
+        for i, row in chunk
+    ]
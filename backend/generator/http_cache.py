@@ -0,0 +1,56 @@
+import hashlib
+
+from flask import request, jsonify
+
+
+# Cache-Control per kind of response
+#   revalidate: may be stored, but is checked (If-None-Match /
+#               If-Modified-Since) on every use; unchanged = 304, no body
+#   versioned:  the URL carries a content version (?v=...), so a new
+#               version is a new URL and this one never changes
+CACHE_POLICIES = {
+    "revalidate": "no-cache",
+    "versioned": "public, max-age=31536000, immutable"
+}
+
+
+def apply_cache_policy(response, policy):
+    """
+    Sets Cache-Control on a successful (200/206/304) response.
+    Errors keep Flask's defaults so they are never cached.
+    """
+    if response.status_code in (200, 206, 304):
+        response.headers["Cache-Control"] = CACHE_POLICIES[policy]
+    return response
+
+
+def versioned_policy(version):
+    """
+    "versioned" when the request asked for the current `version`
+    (?v=...), otherwise "revalidate".
+    A stale ?v= must not be cached for good under that URL, since it
+    is answered with the current content.
+    """
+    if version and request.args.get("v") == version:
+        return "versioned"
+    return "revalidate"
+
+
+def cached_json(payload, policy="revalidate"):
+    """
+    jsonify(payload) with a strong ETag from the body, answering
+    If-None-Match with 304 when the client already has it.
+    """
+    response = jsonify(payload)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response = response.make_conditional(request)
+    return apply_cache_policy(response, policy)
+
+
+def level_etag(manifest, level):
+    """
+    Strong ETag for one pyramid level: the template.png hash plus the
+    level, so it changes exactly when the template image does.
+    """
+    return f"{manifest['source']}-{level['name']}"
+
@@ -4,6 +4,8 @@ import zipfile
 from pathlib import Path
 from PIL import Image
 
+from generator.template_pyramid import build_pyramid
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 TEMPLATES_STORE = BASE_DIR / "templates_store"
 
@@ -40,11 +42,6 @@ def save_json(path: Path, data: dict):
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
-def generate_thumbnail(template_path: Path, thumb_path: Path, max_size=(400, 400)):
-    img = Image.open(template_path)
-    img.thumbnail(max_size)
-    img.save(thumb_path, "JPEG", quality=85)
-
 def import_from_zip(zip_file, original_filename: str) -> str:
     base_name = os.path.splitext(original_filename)[0]
     template_id = ensure_unique_id(base_name)
@@ -85,9 +82,7 @@ def import_from_zip(zip_file, original_filename: str) -> str:
         layout = generate_default_layout(width, height)
         save_json(layout_path, layout)
 
-    thumb_path = folder / "thumb.jpg"
-    if not thumb_path.exists():
-        generate_thumbnail(template_img, thumb_path)
+    build_pyramid(folder)
 
     return template_id
 
@@ -111,7 +106,6 @@ def import_from_image(image_file, original_filename: str) -> str:
     layout = generate_default_layout(width, height)
     save_json(folder / "default_layout.json", layout)
 
-    thumb_path = folder / "thumb.jpg"
-    generate_thumbnail(template_path, thumb_path)
+    build_pyramid(folder)
 
     return template_id
@@ -0,0 +1,678 @@
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+from generator.generate import (
+    iter_generate_bulk, iter_encode_bulk, iter_overlay_bulk, validate_bulk
+)
+from generator.archive import (
+    ArchiveWriter, ARCHIVE_FORMATS, write_results, check_filename_pattern
+)
+from generator.pdf_output import write_pdf, write_pdf_per_row
+from generator.pdf_render import write_vector_pdf
+from generator.render import load_template_image
+from generator.encoder import resolve_profile, profile_extension
+from generator.datasets import Dataset, get_dataset
+from generator.path_utils import BACKEND_DIR
+
+
+JOBS_OUTPUT_DIR = os.path.join(BACKEND_DIR, "output", "jobs")
+
+# Finished jobs kept in memory before the oldest are forgotten
+MAX_FINISHED_JOBS = 50
+
+FINISHED_STATES = {"completed", "cancelled", "failed"}
+
+# Every job is recorded in output/jobs/<job_id>/, so any server process
+# can answer for it (serve.py runs several; the job thread lives in one)
+# and a job cut off by a restart can be resumed (see resume_job):
+#   job.json       progress snapshot (get_job) + output paths
+#   request.json   what was submitted: template, output, profile, rows source
+#   rows.jsonl     the submitted rows, one per line (not for datasets)
+#   results.jsonl  one row result per line, appended in row order; the
+#                  only copy of the results (the checkpoint)
+#   errors.json    validation error index
+#   cancel         created by cancel_job in another process
+#   lock           held (flock) by the process running the job
+JOB_FILE = "job.json"
+REQUEST_FILE = "request.json"
+ROWS_FILE = "rows.jsonl"
+RESULTS_FILE = "results.jsonl"
+ERRORS_FILE = "errors.json"
+CANCEL_FILE = "cancel"
+LOCK_FILE = "lock"
+
+# Seconds between job.json progress writes (and cancel marker checks)
+SNAPSHOT_INTERVAL = 1.0
+
+_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+OUTPUT_MODES = {"files", "pdf", "pdf_vector", "pdf_per_row", *ARCHIVE_FORMATS}
+
+# Outputs written one file per row: a resumed job keeps finished rows.
+# Single-file outputs (archives, multi-page PDFs) start over, with
+# image rows mostly served by the render cache.
+PER_ROW_OUTPUTS = {"files", "pdf_per_row"}
+
+# job_id -> job record (see submit_job)
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+
+# ---------------------------------------------------------
+# SUBMIT
+# ---------------------------------------------------------
+def submit_job(template_id, rows, workers=None, output="files", filename_pattern=None,
+               profile=None):
+    """
+    Starts a background bulk job and returns its job_id.
+    Output goes to backend/output/jobs/<job_id>/:
+    - output="files"        → one certificate_<row>.png per row
+    - output="zip" / "tar"  → a single certificates.zip/.tar, written
+                              entry by entry as rows finish; entry names
+                              follow `filename_pattern` (see archive.py)
+    - output="pdf"          → one multi-page certificates.pdf
+    - output="pdf_vector"   → same, with real text instead of a text image
+    - output="pdf_per_row"  → one certificate_<row>.pdf per row
+    Image outputs ("files", "zip", "tar") are encoded with `profile`
+    (see encoder.OUTPUT_PROFILES).
+    All rows are validated here, before the job starts; invalid rows
+    are available right away from get_job_errors.
+    The request and rows are saved with the job, so it can be resumed
+    after a restart (see resume_job).
+    """
+    if output not in OUTPUT_MODES:
+        raise ValueError(f"Unsupported output '{output}'")
+
+    # Fail on a bad profile or filename pattern now, not in the
+    # background thread
+    profile = resolve_profile(profile)
+    check_filename_pattern(filename_pattern)
+
+    error_index = validate_bulk(template_id, rows)
+
+    job_id = uuid.uuid4().hex
+    output_dir = os.path.join(JOBS_OUTPUT_DIR, job_id)
+
+    archive_path = None
+    if output in ARCHIVE_FORMATS:
+        archive_path = os.path.join(
+            output_dir, "certificates" + ARCHIVE_FORMATS[output]["extension"]
+        )
+    elif output in ("pdf", "pdf_vector"):
+        archive_path = os.path.join(output_dir, "certificates.pdf")
+
+    request = {
+        "template_id": template_id,
+        "workers": workers,
+        "output": output,
+        "filename_pattern": filename_pattern,
+        "profile": profile
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    if isinstance(rows, Dataset):
+        request["dataset_id"] = rows.id
+        request["mapping"] = rows.mapping
+    else:
+        with open(os.path.join(output_dir, ROWS_FILE), "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    _write_json(output_dir, REQUEST_FILE, request)
+    _write_json(output_dir, ERRORS_FILE, error_index)
+
+    job = _new_job(job_id, request, len(rows), error_index, archive_path)
+    job["lock"] = _try_lock(job_id)
+    _write_snapshot(job)
+
+    _start_job(job, rows, workers, error_index)
+    return job_id
+
+
+def _new_job(job_id, request, total, error_index, archive_path):
+    return {
+        "id": job_id,
+        "template_id": request["template_id"],
+        "status": "queued",
+        "total": total,
+        "done": 0,
+        "failed": 0,
+        "cached": 0,
+        "resumed": 0,
+        "invalid": len(error_index),
+        "error_index": error_index,
+        "error": None,
+        "output": request["output"],
+        "output_dir": _job_dir(job_id),
+        "archive_path": archive_path,
+        "filename_pattern": request["filename_pattern"],
+        "profile": request["profile"],
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "lock": None,
+        "cancel": threading.Event()
+    }
+
+
+def _start_job(job, rows, workers, error_index, skip_rows=None):
+    with _lock:
+        _jobs[job["id"]] = job
+        _prune_finished()
+
+    thread = threading.Thread(
+        target=_run_job, args=(job, rows, workers, error_index, skip_rows), daemon=True
+    )
+    thread.start()
+
+
+# ---------------------------------------------------------
+# RESUME
+# ---------------------------------------------------------
+def resume_job(job_id, workers=None):
+    """
+    Continues a job whose server process stopped before it finished.
+    Rows recorded in results.jsonl are kept (per-row outputs) and the
+    job carries on from the first row missing there; archives and
+    multi-page PDFs are written again from the start.
+    A job cancelled before the restart is marked cancelled instead.
+    Returns False if the job is unknown, finished, or still running
+    in a live process (its lock is held).
+    """
+    stored = _read_snapshot(job_id)
+    request = _read_json(job_id, REQUEST_FILE)
+    if not stored or not request or stored["status"] in FINISHED_STATES:
+        return False
+
+    with _lock:
+        if job_id in _jobs:
+            return False
+
+    lock = _try_lock(job_id)
+    if lock is None:
+        return False
+
+    error_index = _read_errors(job_id) or {}
+    job = _new_job(job_id, request, stored["total"], error_index, stored["archive_path"])
+    job["lock"] = lock
+    job["created_at"] = stored.get("created_at") or job["created_at"]
+
+    rows = _load_rows(job_id, request)
+    if rows is None or os.path.exists(os.path.join(job["output_dir"], CANCEL_FILE)):
+        job["status"] = "failed" if rows is None else "cancelled"
+        job["error"] = "Dataset not found" if rows is None else None
+        job["finished_at"] = time.time()
+        _write_snapshot(job)
+        _release_lock(job)
+        return True
+
+    if job["output"] in PER_ROW_OUTPUTS:
+        finished = _load_checkpoint(job)
+    else:
+        finished = set()
+        open(os.path.join(job["output_dir"], RESULTS_FILE), "w").close()
+
+    job["resumed"] = len(finished)
+    _write_snapshot(job)
+
+    _start_job(job, rows, workers if workers is not None else request["workers"],
+               error_index, finished)
+    return True
+
+
+def resume_interrupted_jobs():
+    """
+    Resumes every job left unfinished by a stopped server process.
+    Safe to call from several processes at once: each job is taken by
+    whichever process gets its lock first.
+    Returns the ids of the jobs resumed here.
+    """
+    try:
+        job_ids = [name for name in os.listdir(JOBS_OUTPUT_DIR) if _ID_PATTERN.fullmatch(name)]
+    except OSError:
+        return []
+
+    resumed = []
+    for job_id in job_ids:
+        try:
+            if resume_job(job_id):
+                resumed.append(job_id)
+        except Exception as e:
+            print(f"[WARN] Could not resume job {job_id}: {e}")
+    return resumed
+
+
+def _load_rows(job_id, request):
+    """
+    The rows a job was submitted with, or None if its dataset is gone.
+    """
+    if request.get("dataset_id"):
+        dataset = get_dataset(request["dataset_id"])
+        if dataset is None:
+            return None
+        return dataset.mapped(request["mapping"]) if request.get("mapping") else dataset
+
+    with open(os.path.join(_job_dir(job_id), ROWS_FILE), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _load_checkpoint(job):
+    """
+    Reads results.jsonl back into the job counters and returns the set
+    of finished row numbers. A last line cut off mid-write is removed,
+    so appended results start on a clean line.
+    """
+    path = os.path.join(job["output_dir"], RESULTS_FILE)
+    finished = set()
+    valid_bytes = 0
+
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                result = json.loads(line)
+                valid_bytes += len(line)
+
+                finished.add(result["row"])
+                if "errors" in result:
+                    job["failed"] += 1
+                else:
+                    job["done"] += 1
+                    if result.get("cached"):
+                        job["cached"] += 1
+    except FileNotFoundError:
+        return finished
+
+    with open(path, "r+b") as f:
+        f.truncate(valid_bytes)
+    return finished
+
+
+def _run_job(job, rows, workers, error_index, skip_rows=None):
+    job["status"] = "running"
+    job["started_at"] = time.time()
+
+    archive_file = None
+    writer = None
+    encoded = None
+    results = None
+    results_file = None
+    output = job["output"]
+
+    # Output setup is inside the try: a missing template or a full disk
+    # fails the job (and releases its lock) instead of leaving it running
+    try:
+        if output in ARCHIVE_FORMATS:
+            os.makedirs(job["output_dir"], exist_ok=True)
+            archive_file = open(job["archive_path"], "wb")
+            writer = ArchiveWriter(archive_file, output)
+            encoded = iter_encode_bulk(
+                job["template_id"], rows, workers=workers, profile=job["profile"],
+                error_index=error_index
+            )
+            results = write_results(
+                writer, encoded, rows, job["filename_pattern"], profile_extension(job["profile"])
+            )
+        elif output == "pdf":
+            os.makedirs(job["output_dir"], exist_ok=True)
+            archive_file = open(job["archive_path"], "wb")
+            encoded = iter_overlay_bulk(
+                job["template_id"], rows, workers=workers, error_index=error_index
+            )
+            results = write_pdf(archive_file, encoded, load_template_image(job["template_id"]))
+        elif output == "pdf_vector":
+            os.makedirs(job["output_dir"], exist_ok=True)
+            archive_file = open(job["archive_path"], "wb")
+            results = write_vector_pdf(
+                archive_file, job["template_id"], rows, error_index=error_index
+            )
+        elif output == "pdf_per_row":
+            encoded = iter_overlay_bulk(
+                job["template_id"], rows, workers=workers, error_index=error_index,
+                skip_rows=skip_rows
+            )
+            results = write_pdf_per_row(
+                job["output_dir"], encoded, load_template_image(job["template_id"])
+            )
+        else:
+            results = iter_generate_bulk(
+                job["template_id"], rows, output_dir=job["output_dir"], workers=workers,
+                profile=job["profile"], error_index=error_index, skip_rows=skip_rows
+            )
+
+        results_file = open(os.path.join(job["output_dir"], RESULTS_FILE), "a", encoding="utf-8")
+        _write_snapshot(job)
+        snapshot_at = time.monotonic()
+
+        for result in results:
+            # Streamed to the checkpoint only; nothing is kept in memory
+            results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            results_file.flush()
+
+            with _lock:
+                if "errors" in result:
+                    job["failed"] += 1
+                else:
+                    job["done"] += 1
+                    if result.get("cached"):
+                        job["cached"] += 1
+
+            if time.monotonic() - snapshot_at >= SNAPSHOT_INTERVAL:
+                os.fsync(results_file.fileno())
+                if os.path.exists(os.path.join(job["output_dir"], CANCEL_FILE)):
+                    job["cancel"].set()
+                _write_snapshot(job)
+                snapshot_at = time.monotonic()
+
+            if job["cancel"].is_set():
+                break
+
+        job["status"] = "cancelled" if job["cancel"].is_set() else "completed"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        try:
+            if results_file is not None:
+                results_file.close()
+            # Stops the worker pool and drops rows that never started
+            if results is not None:
+                results.close()
+            if encoded is not None:
+                encoded.close()
+            if writer is not None:
+                writer.close()
+            if archive_file is not None:
+                archive_file.close()
+        except Exception as e:
+            # e.g. the archive's central directory did not fit on disk
+            job["status"] = "failed"
+            job["error"] = job.get("error") or str(e)
+        finally:
+            job["finished_at"] = time.time()
+            try:
+                _write_snapshot(job)
+            finally:
+                _release_lock(job)
+
+
+# ---------------------------------------------------------
+# QUERY
+# ---------------------------------------------------------
+def get_job(job_id):
+    """
+    Returns a progress snapshot for a job, or None if unknown:
+      status, done, failed, total, cached (render cache hits),
+      cache_hit_rate, rows_per_sec, eta_seconds, ...
+    Jobs running in another server process are read from job.json
+    (at most SNAPSHOT_INTERVAL old). An unfinished job no live process
+    is running reports status "interrupted" (see resume_job).
+    """
+    job = _jobs.get(job_id)
+    if not job:
+        stored = _read_snapshot(job_id)
+        if not stored:
+            return None
+        snapshot = {k: v for k, v in stored.items() if k in SNAPSHOT_FIELDS}
+        if snapshot["status"] not in FINISHED_STATES and not _is_locked(job_id):
+            snapshot["status"] = "interrupted"
+        return snapshot
+
+    return _snapshot(job)
+
+
+def _snapshot(job):
+    with _lock:
+        # Rows taken over from a checkpoint do not count towards the rate
+        processed = job["done"] + job["failed"]
+        rendered = processed - job["resumed"]
+        started = job["started_at"]
+        end = job["finished_at"] or time.time()
+
+        elapsed = (end - started) if started else 0.0
+        rate = rendered / elapsed if elapsed > 0 else 0.0
+
+        if job["status"] in FINISHED_STATES:
+            eta = 0.0
+        elif rate > 0:
+            eta = (job["total"] - processed) / rate
+        else:
+            eta = None
+
+        return {
+            "id": job["id"],
+            "template_id": job["template_id"],
+            "status": job["status"],
+            "total": job["total"],
+            "done": job["done"],
+            "failed": job["failed"],
+            "invalid": job["invalid"],
+            "cached": job["cached"],
+            "cache_hit_rate": round(job["cached"] / job["done"], 3) if job["done"] else 0.0,
+            "resumed": job["resumed"],
+            "rows_per_sec": round(rate, 2),
+            "elapsed_seconds": round(elapsed, 2),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "error": job["error"]
+        }
+
+
+def get_job_results(job_id, since=0):
+    """
+    Returns the row results produced so far, starting at index `since`.
+    Lets clients fetch results incrementally while the job runs.
+    Read from results.jsonl, which every job streams its results to.
+    """
+    return _read_results(job_id, since)
+
+
+def get_job_errors(job_id):
+    """
+    Returns the validation error index of a job
+    ({row_number: [errors]}, invalid rows only), known from submission on.
+    """
+    job = _jobs.get(job_id)
+    if not job:
+        return _read_errors(job_id)
+
+    return job["error_index"]
+
+
+def get_job_file(job_id, row):
+    """
+    Returns the output path for a finished row, or None if the row
+    has not been rendered (yet) or failed validation.
+    """
+    job = _jobs.get(job_id) or _read_snapshot(job_id)
+    if not job:
+        return None
+
+    # Archive / multi-page PDF jobs have no per-row files
+    if row < 1 or job["archive_path"]:
+        return None
+
+    # Results are appended in row order, so row i sits at index i-1
+    results = _read_results(job_id, row - 1, limit=1)
+    if not results:
+        return None
+
+    return results[0].get("file")
+
+
+def get_job_archive(job_id):
+    """
+    Returns the output path of a finished zip/tar/pdf job, or None.
+    """
+    job = _jobs.get(job_id) or _read_snapshot(job_id)
+    if not job or not job["archive_path"] or job["status"] not in FINISHED_STATES:
+        return None
+
+    return job["archive_path"]
+
+
+def is_finished(job_id):
+    """
+    True once a job will make no more progress: finished, unknown, or
+    interrupted (until resumed).
+    """
+    job = get_job(job_id)
+    return job is None or job["status"] in FINISHED_STATES or job["status"] == "interrupted"
+
+
+# ---------------------------------------------------------
+# CANCEL
+# ---------------------------------------------------------
+def cancel_job(job_id):
+    """
+    Requests cancellation. Rows already rendered are kept.
+    Jobs running in another server process see the request through
+    the cancel marker file within SNAPSHOT_INTERVAL.
+    Returns False if the job does not exist.
+    """
+    job = _jobs.get(job_id)
+    if job:
+        job["cancel"].set()
+        return True
+
+    stored = _read_snapshot(job_id)
+    if not stored:
+        return False
+
+    if stored["status"] not in FINISHED_STATES:
+        open(os.path.join(_job_dir(job_id), CANCEL_FILE), "w").close()
+        # Nobody is running it (interrupted): record the cancel directly
+        if not _is_locked(job_id):
+            stored["status"] = "cancelled"
+            _write_json(_job_dir(job_id), JOB_FILE, stored)
+    return True
+
+
+def _prune_finished():
+    """
+    Forgets the oldest finished jobs beyond MAX_FINISHED_JOBS.
+    Output files on disk are left in place.
+    """
+    finished = [jid for jid, j in _jobs.items() if j["status"] in FINISHED_STATES]
+    for job_id in finished[:-MAX_FINISHED_JOBS]:
+        del _jobs[job_id]
+
+
+# ---------------------------------------------------------
+# ON-DISK JOB RECORD (shared between server processes)
+# ---------------------------------------------------------
+# get_job fields, as stored in job.json
+SNAPSHOT_FIELDS = (
+    "id", "template_id", "status", "total", "done", "failed", "invalid",
+    "cached", "cache_hit_rate", "resumed", "rows_per_sec", "elapsed_seconds", "eta_seconds", "error"
+)
+
+
+def _write_snapshot(job):
+    record = _snapshot(job)
+    record["archive_path"] = job["archive_path"]
+    record["output"] = job["output"]
+    record["created_at"] = job["created_at"]
+    _write_json(job["output_dir"], JOB_FILE, record)
+
+
+def _write_json(folder, filename, data):
+    # Written aside and renamed, so readers never see half a file
+    path = os.path.join(folder, filename)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _job_dir(job_id):
+    return os.path.join(JOBS_OUTPUT_DIR, job_id)
+
+
+def _read_json(job_id, filename):
+    if not job_id or not _ID_PATTERN.fullmatch(job_id):
+        return None
+    try:
+        with open(os.path.join(_job_dir(job_id), filename), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_snapshot(job_id):
+    return _read_json(job_id, JOB_FILE)
+
+
+def _read_errors(job_id):
+    index = _read_json(job_id, ERRORS_FILE)
+    if index is None:
+        return None
+    return {int(row): errors for row, errors in index.items()}
+
+
+def _read_results(job_id, since=0, limit=None):
+    if _read_snapshot(job_id) is None:
+        return None
+
+    results = []
+    try:
+        with open(os.path.join(_job_dir(job_id), RESULTS_FILE), "r", encoding="utf-8") as f:
+            for n, line in enumerate(f):
+                # A line still being written has no newline yet
+                if n >= since and line.endswith("\n"):
+                    results.append(json.loads(line))
+                    if limit is not None and len(results) >= limit:
+                        break
+    except OSError:
+        pass
+    return results
+
+
+# ---------------------------------------------------------
+# JOB LOCK (which process runs a job)
+# ---------------------------------------------------------
+# The lock is released by the OS when its process dies, so a job whose
+# lock can be taken is not running anywhere.
+def _try_lock(job_id):
+    """
+    Takes the job lock. Returns the open lock file, or None if another
+    process (or job record in this one) holds it.
+    """
+    f = open(os.path.join(_job_dir(job_id), LOCK_FILE), "a+")
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _release_lock(job):
+    if job["lock"] is not None:
+        job["lock"].close()
+        job["lock"] = None
+
+
+def _is_locked(job_id):
+    try:
+        f = _try_lock(job_id)
+    except OSError:
+        return False
+    if f is None:
+        return True
+    f.close()
+    return False
@@ -0,0 +1,333 @@
+import os
+import zlib
+import threading
+from collections import OrderedDict
+
+from generator.config_loader import get_setting
+from generator.archive import ChunkBuffer
+
+
+PDF_MIMETYPE = "application/pdf"
+
+# Compression level for image streams (zlib 1-9)
+PDF_COMPRESS_LEVEL = 6
+
+
+# ---------------------------------------------------------
+# MINIMAL STREAMING PDF WRITER
+# ---------------------------------------------------------
+class PdfWriter:
+    """
+    Writes a PDF sequentially to any writable file object.
+    Objects go out as soon as they are added; only their byte offsets
+    are kept, so memory stays flat however many pages are written.
+    Never seeks, so it also works on chunked HTTP streams.
+    """
+
+    def __init__(self, fileobj):
+        self._out = fileobj
+        self._pos = 0
+        self._offsets = {}
+        self._pages = []
+
+        # 1 = catalog, 2 = page tree (both written on close)
+        self._next_id = 3
+
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self._out.write(data)
+        self._pos += len(data)
+
+    def _new_id(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def write_object(self, obj_id, body, stream=None):
+        """
+        Writes `obj_id 0 obj <body> [stream] endobj`.
+        `body` is the dictionary source as a str; /Length is added for streams.
+        """
+        self._offsets[obj_id] = self._pos
+        self._write(f"{obj_id} 0 obj\n".encode())
+
+        if stream is None:
+            self._write(body.encode("latin-1") + b"\nendobj\n")
+            return obj_id
+
+        body = body[:-2] + f" /Length {len(stream)} >>"
+        self._write(body.encode("latin-1") + b"\nstream\n")
+        self._write(stream)
+        self._write(b"\nendstream\nendobj\n")
+        return obj_id
+
+    def add_object(self, body, stream=None):
+        return self.write_object(self._new_id(), body, stream)
+
+    def reserve_id(self):
+        """
+        Reserves an object number for an object written later
+        (e.g. fonts, which are only complete once every page is known).
+        """
+        return self._new_id()
+
+    def add_image(self, width, height, data, alpha=None, gray=False):
+        """
+        Adds a Flate-compressed 8-bit image XObject and returns its id.
+        `data` / `alpha` are already zlib-compressed pixel bytes.
+        """
+        smask = ""
+        if alpha is not None:
+            mask_id = self.add_image(width, height, alpha, gray=True)
+            smask = f" /SMask {mask_id} 0 R"
+
+        colorspace = "/DeviceGray" if gray else "/DeviceRGB"
+        return self.add_object(
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height}"
+            f" /ColorSpace {colorspace} /BitsPerComponent 8"
+            f" /Filter /FlateDecode{smask} >>",
+            data
+        )
+
+    def add_page(self, width, height, content, xobjects=None, fonts=None):
+        """
+        Adds a page of width x height points.
+        `content` is the (uncompressed) content stream as bytes;
+        `xobjects` / `fonts` map resource names to object ids.
+        """
+        resources = ""
+        if xobjects:
+            refs = " ".join(f"/{name} {obj_id} 0 R" for name, obj_id in xobjects.items())
+            resources += f" /XObject << {refs} >>"
+        if fonts:
+            refs = " ".join(f"/{name} {obj_id} 0 R" for name, obj_id in fonts.items())
+            resources += f" /Font << {refs} >>"
+
+        content_id = self.add_object(
+            "<< /Filter /FlateDecode >>", zlib.compress(content, PDF_COMPRESS_LEVEL)
+        )
+        page_id = self.add_object(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {pdf_num(width)} {pdf_num(height)}]"
+            f" /Resources <<{resources} >> /Contents {content_id} 0 R >>"
+        )
+        self._pages.append(page_id)
+        return page_id
+
+    def close(self):
+        """
+        Writes the page tree, catalog, xref table and trailer.
+        """
+        kids = " ".join(f"{p} 0 R" for p in self._pages)
+        self.write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>")
+        self.write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_pos = self._pos
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            offset = self._offsets.get(obj_id)
+            if offset is None:
+                lines.append("0000000000 65535 f \n")
+            else:
+                lines.append(f"{offset:010d} 00000 n \n")
+
+        self._write("".join(lines).encode())
+        self._write(
+            f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF\n".encode()
+        )
+
+
+def pdf_num(value):
+    """
+    Formats a number for PDF (no exponent, trimmed decimals).
+    """
+    return f"{value:.3f}".rstrip("0").rstrip(".")
+
+
+# ---------------------------------------------------------
+# IMAGE ENCODING
+# ---------------------------------------------------------
+def encode_image(image):
+    """
+    Compresses an image for PdfWriter.add_image.
+    Returns {"size": (w, h), "data": ..., "alpha": ... or None}.
+    The alpha channel is dropped when fully opaque.
+    """
+    alpha = None
+    if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        mask = image.getchannel("A")
+        if mask.getextrema()[0] < 255:
+            alpha = zlib.compress(mask.tobytes(), PDF_COMPRESS_LEVEL)
+
+    rgb = image.convert("RGB")
+    return {
+        "size": rgb.size,
+        "data": zlib.compress(rgb.tobytes(), PDF_COMPRESS_LEVEL),
+        "alpha": alpha
+    }
+
+
+# id(base image) -> (base image, encoded); bases come from the template cache
+_encoded_backgrounds = OrderedDict()
+_MAX_ENCODED_BACKGROUNDS = 4
+_encoded_lock = threading.Lock()
+
+
+def encode_background(image):
+    """
+    encode_image for template bases, memoized per base image object
+    so single-page documents don't recompress the template every time.
+    The template cache hands out a new object when template.png changes.
+    """
+    key = id(image)
+    with _encoded_lock:
+        entry = _encoded_backgrounds.get(key)
+        if entry and entry[0] is image:
+            _encoded_backgrounds.move_to_end(key)
+            return entry[1]
+
+    encoded = encode_image(image)
+
+    with _encoded_lock:
+        _encoded_backgrounds[key] = (image, encoded)
+        while len(_encoded_backgrounds) > _MAX_ENCODED_BACKGROUNDS:
+            _encoded_backgrounds.popitem(last=False)
+
+    return encoded
+
+
+def encode_overlay(layer, offset=(0, 0)):
+    """
+    Crops a transparent text layer to its visible pixels and compresses it.
+    Returns {"box": (x0, y0, x1, y1), "size", "data", "alpha"},
+    or None if nothing was drawn.
+    `offset` is the layer's position on the page (region patches).
+    Runs inside the bulk workers, so the main process only writes bytes.
+    """
+    box = layer.getchannel("A").getbbox()
+    if not box:
+        return None
+
+    encoded = encode_image(layer.crop(box))
+    dx, dy = offset
+    encoded["box"] = (box[0] + dx, box[1] + dy, box[2] + dx, box[3] + dy)
+    return encoded
+
+
+def add_encoded_image(writer, encoded):
+    width, height = encoded["size"]
+    return writer.add_image(width, height, encoded["data"], encoded["alpha"])
+
+
+# ---------------------------------------------------------
+# CERTIFICATE PAGES
+# ---------------------------------------------------------
+def page_geometry(image_size, dpi=None):
+    """
+    Returns (page_width_pt, page_height_pt, points_per_pixel).
+    """
+    if dpi is None:
+        dpi = get_setting("pdf_dpi", 150)
+
+    scale = 72.0 / float(dpi)
+    width, height = image_size
+    return width * scale, height * scale, scale
+
+
+def overlay_content(overlay, page_height, scale, name="Ov"):
+    """
+    Content stream operators placing an overlay XObject at its pixel box.
+    """
+    x0, y0, x1, y1 = overlay["box"]
+    w = (x1 - x0) * scale
+    h = (y1 - y0) * scale
+    x = x0 * scale
+    y = page_height - y1 * scale
+    return f"q {pdf_num(w)} 0 0 {pdf_num(h)} {pdf_num(x)} {pdf_num(y)} cm /{name} Do Q\n"
+
+
+def _certificate_page(writer, background_id, overlay, page_width, page_height, scale):
+    content = f"q {pdf_num(page_width)} 0 0 {pdf_num(page_height)} 0 0 cm /Bg Do Q\n"
+    xobjects = {"Bg": background_id}
+
+    # One overlay, or a list of them from region rendering
+    overlays = overlay if isinstance(overlay, list) else [overlay]
+    for n, part in enumerate(o for o in overlays if o):
+        name = f"Ov{n}" if n else "Ov"
+        xobjects[name] = add_encoded_image(writer, part)
+        content += overlay_content(part, page_height, scale, name)
+
+    writer.add_page(page_width, page_height, content.encode(), xobjects)
+
+
+def write_pdf(fileobj, results, background, dpi=None):
+    """
+    Writes one multi-page PDF from overlay results
+    ({"row", "overlay"} / {"row", "errors"}).
+    The template background is embedded once and shared by every page;
+    each page only adds its own cropped text layer.
+    Yields a summary per row: {"row", "page"} or {"row", "errors"}.
+    """
+    page_width, page_height, scale = page_geometry(background.size, dpi)
+
+    writer = PdfWriter(fileobj)
+    background_id = add_encoded_image(writer, encode_background(background))
+
+    page = 0
+    try:
+        for result in results:
+            if "errors" in result:
+                yield result
+                continue
+
+            _certificate_page(writer, background_id, result["overlay"],
+                              page_width, page_height, scale)
+            page += 1
+            yield {"row": result["row"], "page": page}
+    finally:
+        # Also on early close, so cancelled jobs leave a valid PDF
+        writer.close()
+
+
+def write_pdf_per_row(output_dir, results, background, dpi=None):
+    """
+    Writes certificate_<row>.pdf for every successful row.
+    The background is compressed once and reused for every file.
+    Yields {"row", "file"} or {"row", "errors"}.
+    """
+    page_width, page_height, scale = page_geometry(background.size, dpi)
+    encoded_background = encode_background(background)
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    for result in results:
+        if "errors" in result:
+            yield result
+            continue
+
+        filename = os.path.join(output_dir, f"certificate_{result['row']}.pdf")
+        with open(filename, "wb") as f:
+            writer = PdfWriter(f)
+            background_id = add_encoded_image(writer, encoded_background)
+            _certificate_page(writer, background_id, result["overlay"],
+                              page_width, page_height, scale)
+            writer.close()
+
+        yield {"row": result["row"], "file": filename}
+
+
+def stream_pdf(results, background, dpi=None):
+    """
+    Generator of PDF bytes for a chunked HTTP response.
+    """
+    buffer = ChunkBuffer()
+
+    for _ in write_pdf(buffer, results, background, dpi):
+        chunk = buffer.drain()
+        if chunk:
+            yield chunk
+
+    yield buffer.drain()
+
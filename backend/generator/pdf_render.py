@@ -0,0 +1,362 @@
+import io
+import os
+import string
+import hashlib
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageColor
+from fontTools.ttLib import TTFont
+from fontTools import subset
+from fontTools.varLib import instancer
+
+from generator.render import (
+    load_template_image, field_texts, layout_field, text_runs, text_length
+)
+from generator.compiled_layout import get_compiled_layout
+from generator.font_cache import variation_key
+from generator.archive import ChunkBuffer
+from generator.pdf_output import (
+    PdfWriter, encode_background, add_encoded_image, page_geometry, pdf_num
+)
+
+
+# ---------------------------------------------------------
+# FONT PROGRAMS (parsed once per process)
+# ---------------------------------------------------------
+# Tables a PDF viewer needs from an embedded TrueType/OpenType font
+EMBED_TABLES = {
+    "GlyphOrder", "head", "hhea", "hmtx", "maxp", "cmap", "name", "OS/2", "post",
+    "glyf", "loca", "cvt ", "fpgm", "prep", "gasp", "CFF ", "CFF2", "VORG"
+}
+
+@lru_cache(maxsize=16)
+def _font_program(path, mtime_ns, variation):
+    """
+    Parses a font file for embedding.
+    Variable fonts are instanced at `variation` (defaults otherwise),
+    so widths and outlines match what Pillow draws.
+    Returns a dict with the static font bytes, cmap (codepoint → gid),
+    advance widths (1000 units/em) and descriptor metrics.
+    """
+    font = TTFont(path)
+
+    if "fvar" in font:
+        font = instancer.instantiateVariableFont(font, _axis_location(font, variation))
+
+    # Text is already shaped and mapped to glyphs, so layout tables
+    # (GSUB/GPOS/...) are dead weight for embedding and slow to subset
+    for tag in list(font.keys()):
+        if tag not in EMBED_TABLES:
+            del font[tag]
+
+    buffer = io.BytesIO()
+    font.save(buffer)
+    data = buffer.getvalue()
+
+    upem = font["head"].unitsPerEm
+
+    def scale(v):
+        return int(round(v * 1000 / upem))
+
+    hmtx = font["hmtx"].metrics
+    glyph_order = font.getGlyphOrder()
+    head = font["head"]
+    hhea = font["hhea"]
+    os2 = font["OS/2"] if "OS/2" in font else None
+
+    ps_name = font["name"].getDebugName(6) or os.path.splitext(os.path.basename(path))[0]
+
+    return {
+        "data": data,
+        "cff": "CFF " in font,
+        "cmap": {cp: font.getGlyphID(name) for cp, name in font.getBestCmap().items()},
+        "widths": [scale(hmtx[name][0]) for name in glyph_order],
+        "ps_name": "".join(c for c in ps_name if c.isalnum() or c in "-_") or "Font",
+        "ascent": scale(hhea.ascent),
+        "descent": scale(hhea.descent),
+        "cap_height": scale(getattr(os2, "sCapHeight", 0) or hhea.ascent),
+        "bbox": [scale(head.xMin), scale(head.yMin), scale(head.xMax), scale(head.yMax)]
+    }
+
+
+def _axis_location(font, variation):
+    """
+    Maps a variation setting (named instance or {axis name/tag: value})
+    to a full fvar location.
+    """
+    names = font["name"]
+    axes = font["fvar"].axes
+    location = {axis.axisTag: axis.defaultValue for axis in axes}
+
+    if isinstance(variation, tuple):
+        wanted = dict(variation)
+        for axis in axes:
+            label = names.getDebugName(axis.axisNameID)
+            for key in (label, axis.axisTag):
+                if key in wanted:
+                    location[axis.axisTag] = wanted[key]
+    elif isinstance(variation, str):
+        for instance in font["fvar"].instances:
+            if names.getDebugName(instance.subfamilyNameID) == variation:
+                location.update(instance.coordinates)
+                break
+
+    return location
+
+
+def _subset_program(program, gids):
+    """
+    Keeps only the used glyphs, with glyph ids unchanged
+    (so the page content can use gids as CIDs directly).
+    """
+    font = TTFont(io.BytesIO(program["data"]))
+
+    options = subset.Options()
+    options.retain_gids = True
+    options.notdef_outline = True
+    options.name_IDs = ["*"]
+
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(gids=sorted(gids))
+    subsetter.subset(font)
+
+    buffer = io.BytesIO()
+    font.save(buffer)
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------
+# VECTOR DOCUMENT
+# ---------------------------------------------------------
+class VectorDocument:
+    """
+    Builds a PDF where every page is the shared template background
+    (one image XObject for the whole document) plus real text set in
+    embedded font subsets.
+    Field layout (auto-scale, wrap, alignment, Arabic shaping) is the
+    same code the raster renderer uses, so positions match the PNG output.
+    """
+
+    def __init__(self, fileobj, template_id, dpi=None):
+        background = load_template_image(template_id)
+        self.page_width, self.page_height, self.scale = page_geometry(background.size, dpi)
+
+        self._writer = PdfWriter(fileobj)
+        self._background_id = add_encoded_image(self._writer, encode_background(background))
+
+        # Pillow measurements only; nothing is drawn on it
+        self._draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+
+        # (font path, variation) -> {"name", "id", "program", "used": {gid: char}}
+        self._fonts = {}
+
+    def add_certificate(self, layout, data):
+        scale = self.scale
+        content = [
+            f"q {pdf_num(self.page_width)} 0 0 {pdf_num(self.page_height)} 0 0 cm /Bg Do Q\n"
+        ]
+        page_fonts = {}
+
+        for _, field, shaped in field_texts(layout, data):
+            font, lines = layout_field(self._draw, field, shaped)
+
+            r, g, b = ImageColor.getrgb(field.color)[:3]
+            color = f"{pdf_num(r / 255)} {pdf_num(g / 255)} {pdf_num(b / 255)} rg"
+
+            # Pillow draws from the ascender line; PDF from the baseline
+            ascent = font.getmetrics()[0]
+
+            for line, x, y in lines:
+                ty = self.page_height - (y + ascent) * scale
+
+                # Characters the font lacks are set in a fallback font,
+                # as in the raster output (render.draw_line)
+                for run, run_font in text_runs(line, font):
+                    variation = field.variation if run_font is font else None
+                    resource = self._font_resource(run_font.path, variation)
+                    page_fonts[resource["name"]] = resource["id"]
+
+                    glyphs = self._encode(resource, run)
+                    content.append(
+                        f"BT /{resource['name']} {pdf_num(run_font.size * scale)} Tf {color}"
+                        f" {pdf_num(x * scale)} {pdf_num(ty)} Td <{glyphs}> Tj ET\n"
+                    )
+                    x += text_length(self._draw, run, run_font)
+
+        self._writer.add_page(
+            self.page_width, self.page_height,
+            "".join(content).encode("latin-1"),
+            {"Bg": self._background_id},
+            page_fonts
+        )
+
+    def close(self):
+        """
+        Embeds the font subsets (now that every glyph is known)
+        and finishes the file.
+        """
+        for resource in self._fonts.values():
+            self._write_font(resource)
+        self._writer.close()
+
+    # -----------------------------------------------------
+    # fonts
+    # -----------------------------------------------------
+    def _font_resource(self, path, variation):
+        key = (path, variation_key(variation))
+        resource = self._fonts.get(key)
+        if resource:
+            return resource
+
+        program = _font_program(path, os.stat(path).st_mtime_ns, key[1])
+        resource = {
+            "key": key,
+            "name": f"F{len(self._fonts) + 1}",
+            "id": self._writer.reserve_id(),
+            "program": program,
+            "used": {}
+        }
+        self._fonts[key] = resource
+        return resource
+
+    def _encode(self, resource, text):
+        """
+        Maps text to 2-byte glyph ids (hex) and records glyph usage.
+        Missing characters map to .notdef, as in the raster output.
+        """
+        cmap = resource["program"]["cmap"]
+        used = resource["used"]
+        out = []
+        for char in text:
+            gid = cmap.get(ord(char), 0)
+            used.setdefault(gid, char)
+            out.append(f"{gid:04X}")
+        return "".join(out)
+
+    def _write_font(self, resource):
+        writer = self._writer
+        program = resource["program"]
+        used = resource["used"]
+
+        base_font = f"{_subset_tag(resource['key'], used)}+{program['ps_name']}"
+
+        font_data = _subset_program(program, set(used) | {0})
+        if program["cff"]:
+            file_id = writer.add_object("<< /Subtype /OpenType >>", font_data)
+            file_key, cid_subtype, gid_map = "FontFile3", "CIDFontType0", ""
+        else:
+            file_id = writer.add_object(f"<< /Length1 {len(font_data)} >>", font_data)
+            file_key, cid_subtype, gid_map = "FontFile2", "CIDFontType2", " /CIDToGIDMap /Identity"
+
+        bbox = " ".join(str(v) for v in program["bbox"])
+        descriptor_id = writer.add_object(
+            f"<< /Type /FontDescriptor /FontName /{base_font} /Flags 4"
+            f" /FontBBox [{bbox}] /ItalicAngle 0 /Ascent {program['ascent']}"
+            f" /Descent {program['descent']} /CapHeight {program['cap_height']}"
+            f" /StemV 80 /{file_key} {file_id} 0 R >>"
+        )
+
+        widths = program["widths"]
+        w_entries = " ".join(f"{gid} [{widths[gid]}]" for gid in sorted(used) if gid < len(widths))
+        cid_font_id = writer.add_object(
+            f"<< /Type /Font /Subtype /{cid_subtype} /BaseFont /{base_font}"
+            f" /CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >>"
+            f" /FontDescriptor {descriptor_id} 0 R /W [{w_entries}]{gid_map} >>"
+        )
+
+        to_unicode_id = writer.add_object("<< >>", _to_unicode_cmap(used))
+
+        writer.write_object(
+            resource["id"],
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /{base_font}"
+            f" /Encoding /Identity-H /DescendantFonts [{cid_font_id} 0 R]"
+            f" /ToUnicode {to_unicode_id} 0 R >>"
+        )
+
+
+def _subset_tag(key, used):
+    """
+    The six capital letters before "+" in a subset font's name.
+    Derived from the font (path, variation) and its glyph set, so the
+    same rows give the same PDF bytes, and different subsets of one
+    font get different tags.
+    """
+    digest = hashlib.sha1(repr((key, sorted(used))).encode("utf-8")).digest()
+    return "".join(string.ascii_uppercase[b % 26] for b in digest[:6])
+
+
+def _to_unicode_cmap(used):
+    """
+    ToUnicode CMap so text can be searched and copied from the PDF.
+    """
+    entries = []
+    for gid, char in sorted(used.items()):
+        if gid == 0:
+            continue
+        entries.append(f"<{gid:04X}> <{char.encode('utf-16-be').hex().upper()}>")
+
+    blocks = []
+    for start in range(0, len(entries), 100):
+        chunk = entries[start:start + 100]
+        blocks.append(f"{len(chunk)} beginbfchar\n" + "\n".join(chunk) + "\nendbfchar\n")
+
+    return (
+        "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+        "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+        "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+        + "".join(blocks) +
+        "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n"
+    ).encode("latin-1")
+
+
+# ---------------------------------------------------------
+# ENTRY POINTS
+# ---------------------------------------------------------
+def render_certificate_pdf(template_id, layout, data, dpi=None):
+    """
+    Vector counterpart of render_certificate: returns one PDF page as bytes.
+    """
+    buffer = io.BytesIO()
+    document = VectorDocument(buffer, template_id, dpi)
+    document.add_certificate(layout, data)
+    document.close()
+    return buffer.getvalue()
+
+
+def write_vector_pdf(fileobj, template_id, rows, dpi=None, error_index=None):
+    """
+    Writes one multi-page vector PDF for a list of rows.
+    A list of rows is validated as a whole before the first page is set
+    (or `error_index` from generate.validate_bulk is used).
+    Yields a summary per row: {"row", "page"} or {"row", "errors"}.
+    """
+    layout = get_compiled_layout(template_id)
+    document = VectorDocument(fileobj, template_id, dpi)
+
+    page = 0
+    try:
+        for i, row, errors in layout.check_rows(rows, error_index):
+            if errors:
+                yield {"row": i, "errors": errors}
+                continue
+
+            document.add_certificate(layout, row)
+            page += 1
+            yield {"row": i, "page": page}
+    finally:
+        # Also on early close, so cancelled jobs leave a valid PDF
+        document.close()
+
+
+def stream_vector_pdf(template_id, rows, dpi=None):
+    """
+    Generator of vector PDF bytes for a chunked HTTP response.
+    """
+    buffer = ChunkBuffer()
+
+    for _ in write_vector_pdf(buffer, template_id, rows, dpi):
+        chunk = buffer.drain()
+        if chunk:
+            yield chunk
+
+    yield buffer.drain()
@@ -0,0 +1,349 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from PIL import ImageDraw
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+from generator.compiled_layout import compile_layout
+from generator.path_utils import BACKEND_DIR
+from generator.render import (
+    load_template_image, field_texts, layout_field, field_box, union_box,
+    boxes_intersect, clip_box, draw_line
+)
+
+
+# Every session is recorded in cache/preview_sessions/, so any server
+# process can answer for it (serve.py runs several):
+#   <session_id>.json   template, layout, data and, per field, what was
+#                       drawn and where
+#   <session_id>.lock   held (flock) while a request uses the session
+# The image itself is only kept in memory, by the processes that
+# rendered it, and redrawn from the record where it is missing or stale.
+SESSIONS_DIR = os.path.join(BACKEND_DIR, "cache", "preview_sessions")
+
+# Open editor sessions kept (least recently used dropped first)
+MAX_SESSIONS = 16
+
+# Sessions untouched for this long are dropped
+SESSION_TTL_SECONDS = 30 * 60
+
+_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+# session_id -> (version, image) rendered by this process
+_images = OrderedDict()
+_lock = threading.Lock()
+
+
+class PreviewSession:
+    """
+    Incremental preview for the layout editor.
+    Draws exactly what /generate/single would for the same data (empty
+    fields stay blank; the editor sends its own sample text).
+    Remembers, per field, what was drawn and where. On update only the
+    region covered by changed fields (before and after the change) is
+    restored from the template base and redrawn, so the cost follows
+    the size of the edited fields rather than the size of the template.
+    Use through open_session, which loads and saves the record.
+    """
+
+    def __init__(self, session_id, state):
+        self.session_id = session_id
+        self.template_id = state["template_id"]
+        self.version = state["version"]
+        self.fields = {name: (signature, tuple(box) if box else None)
+                       for name, (signature, box) in state["fields"].items()}
+
+        self._layout = state["layout"]
+        self.layout = compile_layout(self._layout)
+        self.data = state["data"]
+
+        self._base = load_template_image(self.template_id)
+        # Measures text only; nothing is drawn on the shared base
+        self._measure = ImageDraw.Draw(self._base)
+        self._drawn = None   # _plan() of the current layout and data
+
+    @property
+    def size(self):
+        return self._base.size
+
+    @property
+    def image(self):
+        """
+        The current preview, from this process' memory when up to date.
+        """
+        with _lock:
+            entry = _images.get(self.session_id)
+            if entry and entry[0] == self.version:
+                _images.move_to_end(self.session_id)
+                return entry[1]
+
+        image = self._render((0, 0, *self.size), self._current_plan())
+        _keep_image(self.session_id, self.version, image)
+        return image
+
+    def update(self, layout=None, data=None):
+        """
+        Applies a new layout and/or data.
+        Returns the dirty box (x0, y0, x1, y1), or None if nothing
+        visible changed.
+        """
+        if layout is not None:
+            self._layout = layout
+            self.layout = compile_layout(layout)
+        if data is not None:
+            self.data = dict(data)
+
+        drawn = self._drawn = self._plan()
+
+        dirty = None
+        for name in self.fields.keys() | drawn.keys():
+            old = self.fields.get(name)
+            new = drawn.get(name)
+            if old and new and old[0] == new[0]:
+                continue
+            for entry in (old, new):
+                if entry and entry[1]:
+                    dirty = union_box(dirty, entry[1])
+
+        self.fields = {name: (entry[0], entry[1]) for name, entry in drawn.items()}
+
+        if dirty:
+            dirty = clip_box(dirty, self.size)
+        if not dirty:
+            return None
+
+        # Bring this process' image along if it was current; other
+        # processes see the new version and redraw theirs on demand
+        with _lock:
+            entry = _images.get(self.session_id)
+        if entry and entry[0] == self.version:
+            entry[1].paste(self._render(dirty, drawn), dirty)
+            _keep_image(self.session_id, self.version + 1, entry[1])
+        self.version += 1
+
+        return dirty
+
+    def tile(self, box):
+        with _lock:
+            entry = _images.get(self.session_id)
+        if entry and entry[0] == self.version:
+            return entry[1].crop(box)
+        return self._render(box, self._current_plan())
+
+    def state(self):
+        return {
+            "template_id": self.template_id,
+            "version": self.version,
+            "layout": self._layout,
+            "data": self.data,
+            "fields": self.fields,
+        }
+
+    # -----------------------------------------------------
+    # internals
+    # -----------------------------------------------------
+    def _current_plan(self):
+        if self._drawn is None:
+            self._drawn = self._plan()
+        return self._drawn
+
+    def _plan(self):
+        """
+        Lays out every field that has text.
+        Returns {name: (signature, box, font, lines, color)} in draw order;
+        the signature is a digest, comparable across processes.
+        """
+        drawn = {}
+        for name, field, shaped in field_texts(self.layout, self.data):
+            font, lines = layout_field(self._measure, field, shaped)
+
+            box = field_box(self._measure, font, lines)
+
+            font_key = getattr(font, "cache_key", None) or (font.path, font.size)
+            signature = hashlib.sha1(
+                repr((font_key, tuple(lines), field.color)).encode("utf-8")
+            ).hexdigest()
+            drawn[name] = (signature, box, font, lines, field.color)
+
+        return drawn
+
+    def _render(self, box, drawn):
+        """
+        Returns `box` of the preview: the template base with every field
+        touching it drawn, in layout order, clipped to the box.
+        """
+        x0, y0 = box[0], box[1]
+        region = self._base.crop(box)
+        draw = ImageDraw.Draw(region)
+
+        for _, field_region, font, lines, color in drawn.values():
+            if not field_region or not boxes_intersect(field_region, box):
+                continue
+            for line, x, y in lines:
+                draw_line(draw, (x - x0, y - y0), line, font, color)
+
+        return region
+
+
+# ---------------------------------------------------------
+# SESSION REGISTRY
+# ---------------------------------------------------------
+def create_session(template_id, layout, data=None):
+    """
+    Records a new session and returns (session_id, session).
+    Later requests, in any process, open it with open_session.
+    """
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
+    _expire()
+
+    session_id = uuid.uuid4().hex
+    session = PreviewSession(session_id, {
+        "template_id": template_id,
+        "version": 0,
+        "layout": layout,
+        "data": {},
+        "fields": {},
+    })
+    session.update(data=data or {})
+    _write_state(session_id, session.state())
+
+    return session_id, session
+
+
+@contextmanager
+def open_session(session_id):
+    """
+    Yields the session, or None if it does not exist or has expired.
+    Requests on one session, in any process, take turns; changes are
+    saved when the block exits without an error.
+    """
+    lock = _lock_session(session_id)
+    if lock is None:
+        yield None
+        return
+
+    try:
+        state = _read_state(session_id)
+        session = PreviewSession(session_id, state) if state else None
+        yield session
+        if session:
+            _write_state(session_id, session.state())
+    finally:
+        lock.close()
+
+
+def close_session(session_id):
+    lock = _lock_session(session_id)
+    if lock is None:
+        return False
+
+    try:
+        found = _read_state(session_id) is not None
+        _remove(session_id)
+        return found
+    finally:
+        lock.close()
+
+
+def _keep_image(session_id, version, image):
+    with _lock:
+        _images[session_id] = (version, image)
+        _images.move_to_end(session_id)
+        while len(_images) > MAX_SESSIONS:
+            _images.popitem(last=False)
+
+
+def _state_path(session_id):
+    return os.path.join(SESSIONS_DIR, f"{session_id}.json")
+
+
+def _lock_session(session_id):
+    """
+    Waits for the session lock. Returns the open lock file, or None
+    for an unknown session.
+    """
+    if not session_id or not _ID_PATTERN.fullmatch(session_id):
+        return None
+    if not os.path.exists(_state_path(session_id)):
+        return None
+
+    f = open(os.path.join(SESSIONS_DIR, f"{session_id}.lock"), "a+")
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    except OSError:
+        f.close()
+        raise
+    return f
+
+
+def _read_state(session_id):
+    """
+    The session record, or None if it is gone or has expired.
+    """
+    path = _state_path(session_id)
+    try:
+        if time.time() - os.path.getmtime(path) > SESSION_TTL_SECONDS:
+            _remove(session_id)
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(session_id, state):
+    # Written aside and renamed, so readers never see half a file
+    path = _state_path(session_id)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _remove(session_id):
+    with _lock:
+        _images.pop(session_id, None)
+    for ext in ("json", "lock"):
+        try:
+            os.remove(os.path.join(SESSIONS_DIR, f"{session_id}.{ext}"))
+        except OSError:
+            pass
+
+
+def _expire():
+    """
+    Drops expired sessions and, past MAX_SESSIONS, the least recently
+    used ones.
+    """
+    sessions = []
+    try:
+        with os.scandir(SESSIONS_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json"):
+                    try:
+                        sessions.append((entry.stat().st_mtime, entry.name[:-5]))
+                    except OSError:
+                        pass
+    except OSError:
+        return
+
+    sessions.sort(reverse=True)
+    now = time.time()
+    for n, (mtime, session_id) in enumerate(sessions):
+        if n >= MAX_SESSIONS - 1 or now - mtime > SESSION_TTL_SECONDS:
+            _remove(session_id)
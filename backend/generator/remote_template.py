@@ -1,9 +1,9 @@
 import os
 import requests
-from PIL import Image
 from generator.path_utils import BACKEND_DIR
 from generator.metadata_loader import save_metadata
 from generator.layout_loader import create_blank_layout
+from generator.template_pyramid import build_pyramid
 
 
 def download_template(url, template_id):
@@ -13,13 +13,12 @@ def download_template(url, template_id):
     Also generates:
     - metadata.json
     - default_layout.json
-    - thumb.jpg
+    - thumb.jpg / preview.webp (template_pyramid)
     """
     folder = os.path.join(BACKEND_DIR, "uploads", "templates", template_id)
     os.makedirs(folder, exist_ok=True)
 
     template_path = os.path.join(folder, "template.png")
-    thumb_path = os.path.join(folder, "thumb.jpg")
     layout_path = os.path.join(folder, "default_layout.json")
 
     # -------------------------
@@ -35,12 +34,10 @@ def download_template(url, template_id):
         f.write(response.content)
 
     # -------------------------
-    # GENERATE THUMBNAIL
+    # GENERATE THUMBNAIL + PREVIEW
     # -------------------------
     try:
-        img = Image.open(template_path)
-        img.thumbnail((300, 300))
-        img.save(thumb_path, "JPEG")
+        build_pyramid(folder)
     except Exception as e:
         return {"error": f"Template downloaded but thumbnail failed: {e}"}
 
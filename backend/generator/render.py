@@ -1,10 +1,16 @@
-import os
-from PIL import Image, ImageDraw, ImageFont
+import math
+from functools import lru_cache
+from PIL import Image, ImageDraw
 import arabic_reshaper
 from bidi.algorithm import get_display
 
 from generator.font_loader import get_font_path
-from generator.path_utils import get_template_folder, BACKEND_DIR
+from generator.font_registry import default_font_path, split_runs
+from generator.template_cache import get_template_base
+from generator.font_cache import get_font, variation_key
+from generator.compiled_layout import compile_layout
+from generator.text_cache import get_shaped, put_shaped, measure
+from generator.config_loader import get_setting
 
 
 # ---------------------------------------------------------
@@ -14,7 +20,17 @@ def shape_text(text):
     """
     Applies Arabic shaping + bidi support.
     Works for both Arabic and non-Arabic text.
+    Results are memoized (text_cache), so values repeated across a
+    dataset are shaped once.
     """
+    shaped = get_shaped(text)
+    if shaped is None:
+        shaped = _shape(text)
+        put_shaped(text, shaped)
+    return shaped
+
+
+def _shape(text):
     try:
         reshaped = arabic_reshaper.reshape(text)
         return get_display(reshaped)
@@ -25,39 +41,199 @@ def shape_text(text):
 # ---------------------------------------------------------
 # FONT LOADING (built-in + user + fallback)
 # ---------------------------------------------------------
-def load_font(font_name, size):
+def load_font(font_name, size, variation=None):
     """
     Loads a font from built-in or user fonts.
-    Falls back to DejaVuSans if missing.
+    Falls back to "default_font" (config.json), or the closest
+    installed font, if missing.
+    Font objects come from the shared font cache.
     """
-    path = get_font_path(font_name)
+    return load_font_file(get_font_path(font_name), size, variation)
 
-    if path and os.path.exists(path):
+
+def load_font_file(path, size, variation=None):
+    """
+    load_font for an already resolved font path (None = fallback).
+    """
+    if path:
         try:
-            return ImageFont.truetype(path, size)
+            return get_font(path, size, variation)
         except Exception:
             pass
 
     # fallback
-    fallback = os.path.join(BACKEND_DIR, "fonts", "DejaVuSans.ttf")
-    return ImageFont.truetype(fallback, size)
+    fallback = default_font_path(get_setting("default_font", "DejaVuSans.ttf"))
+    return get_font(fallback, size)
 
 
 # ---------------------------------------------------------
 # AUTO FONT SCALING
 # ---------------------------------------------------------
-def fit_text_to_width(draw, text, font_name, size, max_width):
+MIN_FONT_SIZE = 10
+FONT_SIZE_STEP = 2
+FIT_CACHE_SIZE = 4096
+
+
+def fit_text_to_width(draw, text, font_name, size, max_width, variation=None):
     """
     Reduces font size until text fits within max_width.
+    Picks the same size as stepping down 2pt at a time from `size`
+    (floor 10pt), but with a handful of measurements — see _fit_size.
     """
-    while size > 10:
-        font = load_font(font_name, size)
-        w = draw.textlength(text, font=font)
-        if w <= max_width:
-            return font
-        size -= 2
+    return fit_font_file(draw, text, get_font_path(font_name), size, max_width, variation)
+
+
+def fit_font_file(draw, text, path, size, max_width, variation=None):
+    """
+    fit_text_to_width for an already resolved font path.
+    """
+    fitted = _fit_size(path, variation_key(variation), size, text, max_width, draw.fontmode)
+    return load_font_file(path, fitted, variation)
+
+
+@lru_cache(maxsize=FIT_CACHE_SIZE)
+def _fit_size(path, variation, size, text, max_width, mode):
+    """
+    Returns the largest size in (size, size-2, ...) above 10pt whose
+    text width is <= max_width, or 10 if none fits.
+
+    Text width grows roughly linearly with size, so after measuring the
+    full size the next probe is the estimate size * max_width / width
+    snapped to the 2pt grid, then its neighbour; bisection finishes any
+    remaining bracket. Typically 2-3 measurements instead of one per step.
+
+    Tolerance: identical to the linear descent whenever width is
+    monotonic in size. Hinting can make widths non-monotonic by a
+    pixel right at the boundary; the result may then differ by one
+    2pt step.
+    """
+    if isinstance(variation, tuple):
+        variation = dict(variation)
+
+    def fits(s):
+        return _length(load_font_file(path, s, variation), text, mode) <= max_width
+
+    if size <= MIN_FONT_SIZE:
+        return MIN_FONT_SIZE
+
+    full_width = _length(load_font_file(path, size, variation), text, mode)
+    if full_width <= max_width:
+        return size
+
+    # Candidate sizes below the full size, largest first
+    sizes = []
+    s = size - FONT_SIZE_STEP
+    while s > MIN_FONT_SIZE:
+        sizes.append(s)
+        s -= FONT_SIZE_STEP
+
+    # Invariant: sizes[lo] does not fit (-1 = full size),
+    #            sizes[hi] fits (len(sizes) = only the 10pt floor fits)
+    lo, hi = -1, len(sizes)
+    if not sizes:
+        return MIN_FONT_SIZE
+
+    estimate = size * max_width / full_width
+    guess = int(math.ceil((size - estimate) / FONT_SIZE_STEP)) - 1
+    guess = min(max(guess, 0), len(sizes) - 1)
+
+    if fits(sizes[guess]):
+        hi = guess
+        neighbour = guess - 1
+    else:
+        lo = guess
+        neighbour = guess + 1
+
+    if lo < neighbour < hi:
+        if fits(sizes[neighbour]):
+            hi = neighbour
+        else:
+            lo = neighbour
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if fits(sizes[mid]):
+            hi = mid
+        else:
+            lo = mid
+
+    return sizes[hi] if hi < len(sizes) else MIN_FONT_SIZE
+
+
+# ---------------------------------------------------------
+# TEXT MEASUREMENT (memoized per font + text, see text_cache)
+# ---------------------------------------------------------
+def _length(font, text, mode):
+    return measure(font, text, mode, "length", lambda: sum(
+        f.getlength(t, mode) for t, f in text_runs(text, font)
+    ))
+
+
+def text_length(draw, text, font):
+    """
+    Cached draw.textlength(text, font=font).
+    """
+    return _length(font, text, draw.fontmode)
+
+
+def text_bbox(draw, text, font):
+    """
+    Cached draw.textbbox((0, 0), text, font=font), covering all runs
+    when the text needs fallback fonts (see draw_line).
+    """
+    return measure(font, text, draw.fontmode, "bbox", lambda: _runs_bbox(draw, text, font))
+
+
+def _runs_bbox(draw, text, font):
+    runs = text_runs(text, font)
+    if len(runs) == 1:
+        return draw.textbbox((0, 0), text, font=font)
+
+    # Runs share the primary font's baseline (see draw_line)
+    baseline = font.getmetrics()[0]
+    box = None
+    x = 0
+    for run, run_font in runs:
+        box = union_box(box, draw.textbbox((x, baseline), run, font=run_font, anchor="ls"))
+        x += _length(run_font, run, draw.fontmode)
+    return box
+
+
+# ---------------------------------------------------------
+# FALLBACK FONT RUNS
+# ---------------------------------------------------------
+def text_runs(text, font):
+    """
+    Splits text into ((run, font), ...) so that every character is
+    drawn with a font that has it: `font` where it can, a covering
+    fallback font (same size, default instance) elsewhere.
+    Chosen by font_registry from the indexed cmap coverage, without
+    rendering anything. Text `font` covers is a single run.
+    """
+    runs = split_runs(font.path, text)
+    if len(runs) == 1 and runs[0][1] is None:
+        return ((text, font),)
+    return tuple(
+        (run, font if path is None else load_font_file(path, font.size))
+        for run, path in runs
+    )
 
-    return load_font(font_name, 10)  # minimum size
+
+def draw_line(draw, xy, text, font, fill):
+    """
+    draw.text(xy, text, font=font, fill=fill), one run at a time when
+    the text needs fallback fonts. Runs sit on the baseline of `font`.
+    """
+    runs = text_runs(text, font)
+    if len(runs) == 1:
+        draw.text(xy, text, font=font, fill=fill)
+        return
+
+    x, y = xy
+    baseline = y + font.getmetrics()[0]
+    for run, run_font in runs:
+        draw.text((x, baseline), run, font=run_font, fill=fill, anchor="ls")
+        x += _length(run_font, run, draw.fontmode)
 
 
 # ---------------------------------------------------------
@@ -73,7 +249,7 @@ def wrap_text(draw, text, font, max_width):
 
     for word in words:
         test = current + " " + word if current else word
-        w = draw.textlength(test, font=font)
+        w = text_length(draw, test, font)
 
         if w <= max_width:
             current = test
@@ -90,11 +266,11 @@ def wrap_text(draw, text, font, max_width):
 # ---------------------------------------------------------
 # DRAW TEXT WITH ALIGNMENT
 # ---------------------------------------------------------
-def draw_text(draw, text, x, y, font, color, align, image_width):
+def align_x(draw, text, x, font, align):
     """
-    Draws text with alignment support.
+    Returns the left edge for text anchored at x with the given alignment.
     """
-    bbox = draw.textbbox((0, 0), text, font=font)
+    bbox = text_bbox(draw, text, font)
     w = bbox[2] - bbox[0]
 
     if align == "center":
@@ -102,65 +278,216 @@ def draw_text(draw, text, x, y, font, color, align, image_width):
     elif align == "right":
         x = x - w
 
-    draw.text((x, y), text, font=font, fill=color)
+    return x
+
+
+def draw_text(draw, text, x, y, font, color, align, image_width):
+    """
+    Draws text with alignment support.
+    """
+    x = align_x(draw, text, x, font, align)
+    draw_line(draw, (x, y), text, font, color)
+
+
+# ---------------------------------------------------------
+# FIELD LAYOUT (shared by raster + vector engines)
+# ---------------------------------------------------------
+def field_texts(layout, data):
+    """
+    Yields (field_name, field, shaped_text) for every layout field
+    that has a non-empty value in data.
+    `layout` is a layout dict or a CompiledLayout; fields are CompiledField.
+    """
+    for field in compile_layout(layout).fields:
+        if field.name not in data:
+            continue
+
+        text = str(data[field.name]).strip()
+        if not text:
+            continue
+
+        yield field.name, field, shape_text(text)
+
+
+def layout_field(draw, field, shaped):
+    """
+    Resolves font size (auto-scale), wrapping and alignment for one field.
+    Returns (font, [(line, x, y), ...]) with x already aligned.
+    """
+    # Layout settings (defaults already filled in by CompiledField)
+    variation = field.variation
+    align = field.align
+    x = field.x
+    y = field.y
+    max_width = field.max_width
+
+    # Auto-scale if max_width is defined
+    if max_width and field.auto_scale:
+        font = fit_font_file(draw, shaped, field.font_path, field.size, max_width, variation)
+    else:
+        font = load_font_file(field.font_path, field.size, variation)
+
+    # Wrapping
+    if field.wrap and max_width:
+        lines = wrap_text(draw, shaped, font, max_width)
+        line_height = measure(font, "Ay", None, "bbox", lambda: font.getbbox("Ay"))[3] + 5
+    else:
+        lines = [shaped]
+        line_height = 0
+
+    # Drawn on a smaller pyramid level: size and line breaks were
+    # resolved at full resolution above, so only the result is scaled
+    if field.scale != 1:
+        font = load_font_file(field.font_path, font.size * field.scale, variation)
+        x, y, line_height = x * field.scale, y * field.scale, line_height * field.scale
+
+    return font, [
+        (line, align_x(draw, line, x, font, align), y + i * line_height)
+        for i, line in enumerate(lines)
+    ]
+
+
+# ---------------------------------------------------------
+# TEMPLATE IMAGE LOADING
+# ---------------------------------------------------------
+def load_template_image(template_id):
+    """
+    Returns the cached, decoded base for a template (RGB, or RGBA
+    for templates with transparency).
+    Shared between renders — copy before drawing on it.
+    """
+    return get_template_base(template_id)
 
 
 # ---------------------------------------------------------
 # MAIN RENDER FUNCTION
 # ---------------------------------------------------------
-def render_certificate(template_id, layout, data):
+def render_certificate(template_id, layout, data, base=None):
     """
     Renders a certificate using:
-    - template.png
-    - layout.json
+    - template.png (or a preloaded base image)
+    - layout.json (dict or CompiledLayout)
     - data fields
     Returns a Pillow Image object.
     """
-    folder = get_template_folder(template_id)
-    if not folder:
-        raise FileNotFoundError(f"Template '{template_id}' not found")
+    if base is None:
+        base = load_template_image(template_id)
 
-    template_path = os.path.join(folder, "template.png")
-    image = Image.open(template_path).convert("RGBA")
+    # Draw on a copy so the cached base stays clean
+    image = base.copy()
     draw = ImageDraw.Draw(image)
-    image_width, _ = image.size
 
-    for field_name, field in layout["fields"].items():
-        if field_name not in data:
-            continue
+    for _, field, shaped in field_texts(layout, data):
+        font, lines = layout_field(draw, field, shaped)
 
-        text = str(data[field_name]).strip()
-        if not text:
-            continue
+        for line, x, y in lines:
+            draw_line(draw, (x, y), line, font, field.color)
 
-        shaped = shape_text(text)
+    return image
 
-        # Layout settings
-        font_name = field.get("font", "DejaVuSans.ttf")
-        size = field.get("size", 48)
-        color = field.get("color", "#000000")
-        align = field.get("align", "left")
-        x = field.get("x", 0)
-        y = field.get("y", 0)
 
-        max_width = field.get("max_width", None)
-        auto_scale = field.get("auto_scale", True)
-        wrap = field.get("wrap", False)
+# ---------------------------------------------------------
+# REGION RENDERING (very large templates)
+# ---------------------------------------------------------
+def use_region_rendering(size):
+    """
+    True when a template of `size` pixels is over "region_render_megapixels"
+    (config.json, 0 = never) and should be rendered with render_regions.
+    """
+    limit = float(get_setting("region_render_megapixels", 16))
+    return limit > 0 and size[0] * size[1] > limit * 1_000_000
 
-        # Auto-scale if max_width is defined
-        if max_width and auto_scale:
-            font = fit_text_to_width(draw, shaped, font_name, size, max_width)
-        else:
-            font = load_font(font_name, size)
 
-        # Wrapping
-        if wrap and max_width:
-            lines = wrap_text(draw, shaped, font, max_width)
-            line_height = font.getbbox("Ay")[3] + 5
+def field_box(draw, font, lines):
+    """
+    Ink bounding box (x0, y0, x1, y1) of laid-out lines, or None.
+    """
+    box = None
+    for line, x, y in lines:
+        x0, y0, x1, y1 = text_bbox(draw, line, font)
+        box = union_box(box, (x + x0, y + y0, x + x1, y + y1))
+    return box
 
-            for i, line in enumerate(lines):
-                draw_text(draw, line, x, y + i * line_height, font, color, align, image_width)
+
+def union_box(a, b):
+    if a is None:
+        return tuple(b)
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def boxes_intersect(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def clip_box(box, size):
+    """
+    Rounds a box outwards to whole pixels inside an image of `size`.
+    Returns None if nothing is left.
+    """
+    x0 = max(0, int(box[0]))
+    y0 = max(0, int(box[1]))
+    x1 = min(size[0], int(box[2]) + 1)
+    y1 = min(size[1], int(box[3]) + 1)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1, y1)
+
+
+def render_regions(layout, data, size, background=None):
+    """
+    Renders only the regions covered by text.
+    Returns [(box, patch), ...]: `background` (the template base) cropped
+    to each box with the fields inside it drawn, or transparent RGBA
+    patches without a background (PDF overlays).
+    Pasting the patches onto the background gives the same pixels as
+    render_certificate, but memory follows the size of the fields, not
+    of the template: the base is never copied or converted.
+    Overlapping fields share one region so they stack as usual.
+    """
+    mode = background.mode if background is not None else "RGBA"
+    draw = ImageDraw.Draw(Image.new(mode, (1, 1)))
+
+    planned = []
+    for _, field, shaped in field_texts(layout, data):
+        font, lines = layout_field(draw, field, shaped)
+        box = field_box(draw, font, lines)
+        box = clip_box(box, size) if box else None
+        if box:
+            planned.append((box, font, lines, field.color))
+
+    patches = []
+    for box in _merge_boxes([p[0] for p in planned]):
+        if background is not None:
+            patch = background.crop(box)
         else:
-            draw_text(draw, shaped, x, y, font, color, align, image_width)
+            patch = Image.new("RGBA", (box[2] - box[0], box[3] - box[1]), (0, 0, 0, 0))
 
-    return image
+        patch_draw = ImageDraw.Draw(patch)
+        for field_region, font, lines, color in planned:
+            if not boxes_intersect(field_region, box):
+                continue
+            for line, x, y in lines:
+                draw_line(patch_draw, (x - box[0], y - box[1]), line, font, color)
+
+        patches.append((box, patch))
+
+    return patches
+
+
+def _merge_boxes(boxes):
+    """
+    Unions intersecting boxes until none overlap.
+    """
+    regions = []
+    for box in boxes:
+        merged = True
+        while merged:
+            merged = False
+            for region in regions:
+                if boxes_intersect(region, box):
+                    regions.remove(region)
+                    box = union_box(region, box)
+                    merged = True
+                    break
+        regions.append(box)
+    return regions
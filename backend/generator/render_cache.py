@@ -0,0 +1,405 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+from generator.template_pyramid import get_template_pyramid
+from generator.encoder import profile_extension
+from generator.config_loader import get_setting
+from generator.font_registry import font_registry_version
+from generator.path_utils import BACKEND_DIR
+
+
+# Encoded certificates, stored by content key:
+#   cache/renders/<key[:2]>/<key>.<ext>
+RENDER_CACHE_DIR = os.path.join(BACKEND_DIR, "cache", "renders")
+
+# Index of the entries, shared by every process (pool workers included):
+#   index.log    one line per event, appended in order: "+ <size> <name>"
+#                stored, "* <name>" hit, "- <name>" evicted. Replayed, it
+#                gives the entries in LRU order and their total size.
+#   index.lock   flock: shared while appending, exclusive while trimming
+#                or compacting the log
+# Each process replays only what was appended since it last looked.
+# Deleting index.log rebuilds it from a scan of the directory.
+INDEX_FILE = os.path.join(RENDER_CACHE_DIR, "index.log")
+INDEX_LOCK_FILE = os.path.join(RENDER_CACHE_DIR, "index.lock")
+
+# The log is rewritten (one line per entry) when it holds this many
+# lines per entry
+COMPACT_RATIO = 4
+
+# Bump when a renderer or encoder change alters output for the same inputs
+RENDER_CACHE_VERSION = 1
+
+# Eviction keeps the cache at this fraction of "render_cache_mb"
+TRIM_TARGET = 0.9
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+# This process' replay of index.log: name -> size, least recently used first
+_index = OrderedDict()
+_index_state = {"total": 0, "offset": 0, "lines": 0, "file": None}
+
+
+# ---------------------------------------------------------
+# KEYS
+# ---------------------------------------------------------
+def render_fingerprint(template_id, layout, profile, **variant):
+    """
+    Everything except the row data that decides a certificate's bytes:
+    template image version (pyramid source hash), compiled layout,
+    font file versions, the installed fonts (fallback runs), output
+    profile and any `variant` (preview size, constant fields drawn on
+    the job base, ...).
+    Returns {"digest", "fields", "extension"} for row_cache_key, or
+    None when caching is off or the template has no local image.
+    Computed once per job; small and picklable for pool workers.
+    """
+    if _budget_bytes() <= 0:
+        return None
+
+    manifest = get_template_pyramid(template_id)
+    if not manifest:
+        return None
+
+    parts = {
+        "version": RENDER_CACHE_VERSION,
+        "template": manifest["source"],
+        "layout": layout.source,
+        "fonts": sorted({_font_version(field.font_path) for field in layout.fields}),
+        "font_registry": font_registry_version(),
+        "profile": profile,
+        "variant": variant
+    }
+    digest = hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+    return {
+        "digest": digest,
+        "fields": [field.name for field in layout.fields],
+        "extension": profile_extension(profile)
+    }
+
+
+def row_cache_key(fingerprint, row):
+    """
+    Content key for one row: the fingerprint plus the text each layout
+    field would draw (see render.field_texts). Columns the layout does
+    not use are ignored, so they never cause a miss.
+    """
+    texts = [
+        str(row[name]).strip() if name in row else None
+        for name in fingerprint["fields"]
+    ]
+    data = json.dumps([fingerprint["digest"], texts], ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------
+# LOOKUP / STORE
+# ---------------------------------------------------------
+def cache_read(key, extension):
+    """
+    The cached bytes for `key`, or None.
+    """
+    path = _entry_path(key, extension)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        _count("misses")
+        return None
+
+    _log(f"* {key}.{extension}\n")
+    _count("hits")
+    return data
+
+
+def cache_copy(key, extension, dest):
+    """
+    Copies the cached file for `key` to `dest`.
+    Returns False (and leaves `dest` alone) on a miss.
+    """
+    path = _entry_path(key, extension)
+    try:
+        shutil.copyfile(path, dest)
+    except FileNotFoundError:
+        _count("misses")
+        return False
+
+    _log(f"* {key}.{extension}\n")
+    _count("hits")
+    return True
+
+
+def cache_store(key, extension, data=None, source=None):
+    """
+    Stores encoded output under `key`, from bytes (`data`) or a copy
+    of an existing file (`source`). Failures are ignored: the cache
+    only ever saves work.
+    """
+    path = _entry_path(key, extension)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if source is not None:
+            shutil.copyfile(source, tmp_path)
+        else:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[WARN] Render cache store failed: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+
+    _log(f"+ {size} {key}.{extension}\n")
+
+    budget = _budget_bytes()
+    with _lock:
+        _stats["stores"] += 1
+        _sync_index()
+        due = _index_state["total"] > budget
+
+    if due:
+        trim_render_cache(budget)
+
+
+# ---------------------------------------------------------
+# EVICTION
+# ---------------------------------------------------------
+def trim_render_cache(budget=None):
+    """
+    Deletes least recently used entries until the cache is under
+    TRIM_TARGET of its budget, going by the index (no directory scan).
+    Returns the number of entries removed.
+    """
+    if budget is None:
+        budget = _budget_bytes()
+
+    with _index_lock(exclusive=True):
+        with _lock:
+            _sync_index()
+            if _index_state["total"] <= budget:
+                return 0
+
+            evicted = []
+            target = budget * TRIM_TARGET
+            while _index and _index_state["total"] > target:
+                name, size = _index.popitem(last=False)
+                _index_state["total"] -= size
+                evicted.append(name)
+
+        for name in evicted:
+            try:
+                os.remove(_name_path(name))
+            except OSError:
+                pass
+
+        _append_index("".join(f"- {name}\n" for name in evicted))
+
+        with _lock:
+            _sync_index()
+            if _index_state["lines"] > COMPACT_RATIO * max(len(_index), 64):
+                _write_index()
+
+    _count("evicted", len(evicted))
+    return len(evicted)
+
+
+def render_cache_stats():
+    """
+    Hit/miss counts for this process, and the size of the whole cache.
+    """
+    with _lock:
+        _sync_index()
+        stats = dict(_stats)
+        stats["entries"] = len(_index)
+        stats["size_bytes"] = _index_state["total"]
+    stats["budget_bytes"] = _budget_bytes()
+    return stats
+
+
+# ---------------------------------------------------------
+# INDEX
+# ---------------------------------------------------------
+def _log(line):
+    """
+    Appends an event to index.log. The first event builds the log from
+    the files already in the cache (which include this one).
+    """
+    with _index_lock(exclusive=False):
+        if os.path.exists(INDEX_FILE):
+            _append_index(line)
+            return
+
+    with _index_lock(exclusive=True):
+        if os.path.exists(INDEX_FILE):
+            _append_index(line)
+            return
+        with _lock:
+            _index.clear()
+            _index_state.update(total=0, offset=0, lines=0, file=None)
+            for _, size, name in sorted(_scan_entries()):
+                _index[name] = size
+                _index_state["total"] += size
+            _write_index()
+
+
+def _append_index(text):
+    if not text:
+        return
+    try:
+        with open(INDEX_FILE, "a", encoding="utf-8") as f:
+            f.write(text)
+    except OSError as e:
+        print(f"[WARN] Render cache index write failed: {e}")
+
+
+def _write_index():
+    """
+    Rewrites index.log as one "+" line per entry, in LRU order.
+    Caller holds _lock and the exclusive index lock.
+    """
+    text = "".join(f"+ {size} {name}\n" for name, size in _index.items())
+    tmp_path = f"{INDEX_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, INDEX_FILE)
+        st = os.stat(INDEX_FILE)
+    except OSError as e:
+        print(f"[WARN] Render cache index write failed: {e}")
+        return
+    _index_state.update(offset=st.st_size, lines=len(_index),
+                        file=(st.st_dev, st.st_ino))
+
+
+def _sync_index():
+    """
+    Replays what other processes appended to index.log since the last
+    call (all of it after the log was rewritten). Caller holds _lock.
+    """
+    try:
+        st = os.stat(INDEX_FILE)
+    except OSError:
+        st = None
+
+    file = (st.st_dev, st.st_ino) if st else None
+    if file != _index_state["file"]:
+        _index.clear()
+        _index_state.update(total=0, offset=0, lines=0, file=file)
+    if not st or st.st_size <= _index_state["offset"]:
+        return
+
+    try:
+        with open(INDEX_FILE, "rb") as f:
+            f.seek(_index_state["offset"])
+            chunk = f.read()
+    except OSError:
+        return
+
+    # A line still being written has no newline yet
+    end = chunk.rfind(b"\n") + 1
+    _index_state["offset"] += end
+    for line in chunk[:end].decode("utf-8").splitlines():
+        _index_state["lines"] += 1
+        op, _, rest = line.partition(" ")
+        if op == "+":
+            size, _, name = rest.partition(" ")
+            _index_state["total"] += int(size) - _index.pop(name, 0)
+            _index[name] = int(size)
+        elif op == "*":
+            if rest in _index:
+                _index.move_to_end(rest)
+        elif op == "-":
+            _index_state["total"] -= _index.pop(rest, 0)
+
+
+@contextmanager
+def _index_lock(exclusive):
+    """
+    flock on index.lock (always exclusive on Windows, which has no
+    shared locks).
+    """
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    with open(INDEX_LOCK_FILE, "a+") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        yield
+
+
+def _scan_entries():
+    """
+    (mtime_ns, size, name) for every file in the cache. Only used to
+    build a missing index.
+    """
+    entries = []
+    for folder in _scan(RENDER_CACHE_DIR):
+        if not folder.is_dir():
+            continue
+        for entry in _scan(folder.path):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry.name))
+    return entries
+
+
+# ---------------------------------------------------------
+# INTERNALS
+# ---------------------------------------------------------
+def _budget_bytes():
+    return int(float(get_setting("render_cache_mb", 1024)) * 1024 * 1024)
+
+
+def _entry_path(key, extension):
+    return _name_path(f"{key}.{extension}")
+
+
+def _name_path(name):
+    return os.path.join(RENDER_CACHE_DIR, name[:2], name)
+
+
+def _font_version(path):
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return (str(path), None)
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def _scan(path):
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except OSError:
+        return []
+
+
+def _count(name, n=1):
+    with _lock:
+        _stats[name] += n
@@ -0,0 +1,116 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+from generator.path_utils import get_template_folder
+from generator.config_loader import get_setting
+from generator.template_pyramid import (
+    PRINT_FILE, decode_template_image, get_template_pyramid, get_level
+)
+
+
+# (template_id, level) -> {"signature": (path, mtime_ns, size), "image": Image, "bytes": int}
+_cache = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def get_template_base(template_id, level="print"):
+    """
+    Returns the decoded base image for a template (see
+    template_pyramid.decode_template_image for its mode), at full
+    resolution or at a smaller pyramid `level` ("preview", "thumb").
+    The image is shared: callers must .copy() it before drawing.
+    Entries are invalidated when the file changes (mtime/size)
+    and evicted least-recently-used once "template_cache_mb" is exceeded.
+    """
+    folder = get_template_folder(template_id)
+    if not folder:
+        raise FileNotFoundError(f"Template '{template_id}' not found")
+
+    if level == "print":
+        template_path = os.path.join(folder, PRINT_FILE)
+    else:
+        manifest = get_template_pyramid(template_id)
+        if not manifest:
+            raise FileNotFoundError(f"Template '{template_id}' has no image")
+        template_path = os.path.join(folder, get_level(manifest, level)["file"])
+
+    st = os.stat(template_path)
+    signature = (template_path, st.st_mtime_ns, st.st_size)
+    key = (template_id, level)
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry["signature"] == signature:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return entry["image"]
+
+    # Decode outside the lock so other templates are not blocked
+    image = decode_template_image(template_path)
+    size_bytes = image.width * image.height * len(image.getbands())
+
+    with _lock:
+        _stats["misses"] += 1
+        _cache.pop(key, None)
+        _cache[key] = {"signature": signature, "image": image, "bytes": size_bytes}
+        _evict(_budget_bytes())
+
+    return image
+
+
+def template_size(template_id):
+    """
+    (width, height) of template.png, read from the file header only.
+    """
+    folder = get_template_folder(template_id)
+    if not folder:
+        raise FileNotFoundError(f"Template '{template_id}' not found")
+
+    with Image.open(os.path.join(folder, PRINT_FILE)) as src:
+        return src.size
+
+
+def invalidate_template(template_id):
+    """
+    Drops a single template (every level) from the cache.
+    """
+    with _lock:
+        for key in [k for k in _cache if k[0] == template_id]:
+            del _cache[key]
+
+
+def clear_template_cache():
+    with _lock:
+        _cache.clear()
+
+
+def template_cache_stats():
+    """
+    Returns hit/miss/eviction counters and current memory use.
+    """
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_cache),
+            "bytes": sum(e["bytes"] for e in _cache.values()),
+            "budget_bytes": _budget_bytes()
+        }
+
+
+def _budget_bytes():
+    return int(get_setting("template_cache_mb", 256)) * 1024 * 1024
+
+
+def _evict(budget):
+    """
+    Removes least-recently-used entries until the cache fits the budget.
+    The most recent entry is always kept, even if it alone is over budget.
+    """
+    total = sum(e["bytes"] for e in _cache.values())
+    while total > budget and len(_cache) > 1:
+        _, entry = _cache.popitem(last=False)
+        total -= entry["bytes"]
+        _stats["evictions"] += 1
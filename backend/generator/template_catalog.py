@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from generator.template_loader import (
+    BUILTIN_TEMPLATES_DIR, USER_TEMPLATES_DIR, REMOTE_TEMPLATES_FILE,
+    describe_local_template, describe_remote_template
+)
+from generator.config_loader import get_setting
+
+
+# Local template sources, in listing order
+LOCAL_SOURCES = (
+    (BUILTIN_TEMPLATES_DIR, "built_in"),
+    (USER_TEMPLATES_DIR, "user")
+)
+
+# Files whose changes make a template entry stale
+WATCHED_FILES = ("template.png", "thumb.jpg", "metadata.json", "default_layout.json")
+
+# The catalog: entries are built once and then only rebuilt for
+# templates whose files changed on disk.
+#   "local":   source dir -> {"signature", "ids": [template_id, ...]}
+#   "entries": (source, template_id) -> {"signature", "template": {...}}
+#   "remote":  {"signature", "templates": [...]}
+_catalog = {"local": {}, "entries": {}, "remote": None, "checked_at": 0.0}
+_index = OrderedDict()
+_lock = threading.Lock()
+_stats = {"refreshes": 0, "rebuilt": 0}
+
+
+def list_templates():
+    """
+    Returns every template (built-in, user, remote) in listing order.
+    Same entries as template_loader.load_templates, without rescanning
+    or rewriting anything on disk when nothing has changed.
+    """
+    _refresh_if_due()
+    with _lock:
+        return [dict(t) for t in _index.values()]
+
+
+def get_template_entry(template_id):
+    """
+    Returns the listing entry for one template, or None.
+    """
+    _refresh_if_due()
+    with _lock:
+        entry = _index.get(template_id)
+        return dict(entry) if entry else None
+
+
+def refresh_catalog(force=False):
+    """
+    Brings the catalog up to date with the filesystem.
+    A source directory is only listed again when its mtime changes
+    (a folder was added or removed); a template is only described
+    again when one of its WATCHED_FILES changed.
+    force=True rebuilds every entry.
+    """
+    with _lock:
+        if force:
+            _catalog["local"].clear()
+            _catalog["entries"].clear()
+            _catalog["remote"] = None
+
+        ordered = []
+        for base_dir, source in LOCAL_SOURCES:
+            ordered += _refresh_local(base_dir, source)
+        ordered += _refresh_remote()
+
+        _index.clear()
+        for template in ordered:
+            # Same id in two sources: the first one wins, as in get_template_folder
+            _index.setdefault(template["id"], template)
+
+        _catalog["checked_at"] = time.monotonic()
+        _stats["refreshes"] += 1
+
+
+def invalidate_catalog(template_id=None):
+    """
+    Forces the next read to re-check the filesystem.
+    With a template_id, that template is also described again.
+    """
+    with _lock:
+        if template_id is not None:
+            for _, source in LOCAL_SOURCES:
+                _catalog["entries"].pop((source, template_id), None)
+            # Remote entries read the metadata of downloaded templates
+            _catalog["remote"] = None
+        _catalog["checked_at"] = 0.0
+
+
+def catalog_stats():
+    with _lock:
+        return {**_stats, "templates": len(_index)}
+
+
+def _refresh_if_due():
+    """
+    Filesystem checks are throttled to one per "catalog_check_interval"
+    seconds; between checks reads are served straight from memory.
+    """
+    interval = float(get_setting("catalog_check_interval", 1.0))
+    if time.monotonic() - _catalog["checked_at"] >= interval:
+        refresh_catalog()
+
+
+# ---------------------------------------------------------
+# INTERNALS (called with _lock held)
+# ---------------------------------------------------------
+def _refresh_local(base_dir, source):
+    signature = _stat_signature(base_dir)
+    if signature is None:
+        _catalog["local"].pop(base_dir, None)
+        return []
+
+    listing = _catalog["local"].get(base_dir)
+    if not listing or listing["signature"] != signature:
+        ids = [
+            folder for folder in os.listdir(base_dir)
+            if os.path.isdir(os.path.join(base_dir, folder))
+        ]
+        listing = {"signature": signature, "ids": ids}
+        _catalog["local"][base_dir] = listing
+
+    templates = []
+    for template_id in listing["ids"]:
+        folder_path = os.path.join(base_dir, template_id)
+        template = _refresh_entry(folder_path, template_id, source)
+        if template:
+            templates.append(template)
+
+    return templates
+
+
+def _refresh_entry(folder_path, template_id, source):
+    key = (source, template_id)
+    signature = _folder_signature(folder_path)
+    if signature is None:
+        _catalog["entries"].pop(key, None)
+        return None
+
+    entry = _catalog["entries"].get(key)
+    if entry and entry["signature"] == signature:
+        return entry["template"]
+
+    # New or changed: describe it (may create missing files),
+    # then sign what is on disk afterwards
+    template = describe_local_template(folder_path, template_id, source)
+    _catalog["entries"][key] = {
+        "signature": _folder_signature(folder_path),
+        "template": template
+    }
+    _stats["rebuilt"] += 1
+    return template
+
+
+def _refresh_remote():
+    signature = _stat_signature(REMOTE_TEMPLATES_FILE)
+    if signature is None:
+        _catalog["remote"] = None
+        return []
+
+    remote = _catalog["remote"]
+    if remote and remote["signature"] == signature:
+        return remote["templates"]
+
+    with open(REMOTE_TEMPLATES_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    templates = [describe_remote_template(entry) for entry in data]
+    _catalog["remote"] = {"signature": signature, "templates": templates}
+    return templates
+
+
+def _stat_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _folder_signature(folder_path):
+    folder = _stat_signature(folder_path)
+    if folder is None:
+        return None
+    return (folder,) + tuple(
+        _stat_signature(os.path.join(folder_path, name)) for name in WATCHED_FILES
+    )
@@ -1,9 +1,7 @@
 import os
 import json
-from PIL import Image
-
 from generator.metadata_loader import load_metadata, save_metadata
-from generator.metadata_loader import load_metadata
+from generator.template_pyramid import ensure_pyramid, pyramid_version
 from generator.path_utils import BACKEND_DIR
 
 
@@ -50,44 +48,57 @@ def load_local_templates(base_dir, source):
         if not os.path.isdir(folder_path):
             continue
 
-        template_id = folder
-
-        # Ensure thumbnail exists
-        template_path = os.path.join(folder_path, "template.png")
-        thumb_path = os.path.join(folder_path, "thumb.jpg")
-
-        if os.path.exists(template_path) and not os.path.exists(thumb_path):
-            generate_thumbnail(template_path, thumb_path)
-
-        # Ensure layout exists and is valid
-        layout_path = os.path.join(folder_path, "default_layout.json")
-        if not os.path.exists(layout_path):
-            create_blank_layout(layout_path)
-        else:
-            _auto_repair_layout(layout_path)
-
-        # Load metadata (auto‑creates if missing)
-        meta = load_metadata(template_id)
-
-        # AUTO‑REPAIR: fix missing or invalid name
-        if not meta.get("name") or meta.get("name") == "Untitled Template":
-            meta["name"] = template_id.replace("_", " ").title()
-            save_metadata(template_id, meta)
-
-        template_list.append({
-            "id": template_id,
-            "name": meta.get("name", template_id.replace("_", " ").title()),
-            "source": source,
-            "thumb": f"/templates/{template_id}/thumb",
-            "preview": f"/templates/{template_id}/preview",
-            "tags": meta.get("tags", []),
-            "category": meta.get("category", "general"),
-            "orientation": meta.get("orientation", "landscape")
-        })
+        template_list.append(describe_local_template(folder_path, folder, source))
 
     return template_list
 
 
+def describe_local_template(folder_path, template_id, source):
+    """
+    Builds the listing entry for one template folder.
+    Creates the image pyramid (thumbnail, preview), layout and metadata
+    if they are missing or stale.
+    """
+    # Ensure thumbnail / preview levels exist for the current template image
+    manifest = None
+    try:
+        manifest = ensure_pyramid(folder_path)
+    except Exception as e:
+        print(f"[ERROR] Image pyramid failed for {folder_path}: {e}")
+
+    # Image URLs carry the content version, so browsers can keep them
+    # until the template image changes
+    version = pyramid_version(manifest)
+    query = f"?v={version}" if version else ""
+
+    # Ensure layout exists and is valid
+    layout_path = os.path.join(folder_path, "default_layout.json")
+    if not os.path.exists(layout_path):
+        create_blank_layout(layout_path)
+    else:
+        _auto_repair_layout(layout_path)
+
+    # Load metadata (auto‑creates if missing)
+    meta = load_metadata(template_id)
+
+    # AUTO‑REPAIR: fix missing or invalid name
+    if not meta.get("name") or meta.get("name") == "Untitled Template":
+        meta["name"] = template_id.replace("_", " ").title()
+        save_metadata(template_id, meta)
+
+    return {
+        "id": template_id,
+        "name": meta.get("name", template_id.replace("_", " ").title()),
+        "source": source,
+        "thumb": f"/templates/{template_id}/thumb{query}",
+        "preview": f"/templates/{template_id}/preview{query}",
+        "version": version,
+        "tags": meta.get("tags", []),
+        "category": meta.get("category", "general"),
+        "orientation": meta.get("orientation", "landscape")
+    }
+
+
 def load_remote_templates():
     """
     Loads remote templates from remote_templates.json.
@@ -98,53 +109,34 @@ def load_remote_templates():
     with open(REMOTE_TEMPLATES_FILE, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    templates = []
-    for entry in data:
-        template_id = entry["id"]
-
-        # Load metadata (auto‑creates if missing)
-        meta = load_metadata(template_id)
+    return [describe_remote_template(entry) for entry in data]
 
-        # AUTO‑REPAIR: fix missing or invalid name
-        if not meta.get("name") or meta.get("name") == "Untitled Template":
-            meta["name"] = entry.get("name", template_id.replace("_", " ").title())
-            save_metadata(template_id, meta)
 
-
-        templates.append({
-            "id": template_id,
-            "name": meta.get("name", entry.get("name", template_id)),
-            "source": "remote",
-            "thumb": entry.get("thumb"),
-            "preview": entry.get("preview"),
-            "tags": meta.get("tags", []),
-            "category": meta.get("category", "general"),
-            "orientation": meta.get("orientation", "landscape")
-        })
-
-    return templates
-
-
-def generate_thumbnail(template_path, thumb_path):
+def describe_remote_template(entry):
     """
-    Creates a 300px-wide thumbnail for the template.
-    Guaranteed to work unless the image is unreadable.
+    Builds the listing entry for one remote_templates.json entry.
     """
-    try:
-        print(f"Generating thumbnail for: {template_path}")  # debug
-
-        img = Image.open(template_path).convert("RGB")
-        img.thumbnail((300, 300))
+    template_id = entry["id"]
 
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    # Load metadata (auto‑creates if missing; None until downloaded)
+    meta = load_metadata(template_id) or {}
 
-        img.save(thumb_path, "JPEG", quality=85)
+    # AUTO‑REPAIR: fix missing or invalid name
+    if meta and (not meta.get("name") or meta.get("name") == "Untitled Template"):
+        meta["name"] = entry.get("name", template_id.replace("_", " ").title())
+        save_metadata(template_id, meta)
 
-        print(f"Thumbnail saved to: {thumb_path}")  # debug
-
-    except Exception as e:
-        print(f"[ERROR] Thumbnail generation failed for {template_path}: {e}")
+    return {
+        "id": template_id,
+        "name": meta.get("name", entry.get("name", template_id)),
+        "source": "remote",
+        "thumb": entry.get("thumb"),
+        "preview": entry.get("preview"),
+        "version": None,
+        "tags": meta.get("tags", []),
+        "category": meta.get("category", "general"),
+        "orientation": meta.get("orientation", "landscape")
+    }
 
 
 def create_blank_layout(layout_path):
@@ -157,7 +149,10 @@ def create_blank_layout(layout_path):
 
 
 def _auto_repair_layout(layout_path):
-     """Ensures layout JSON has a valid structure."""
+     """
+     Ensures layout JSON has a valid structure.
+     Only writes when something actually had to be fixed.
+     """
      try:
          with open(layout_path, "r", encoding="utf-8") as f:
              layout = json.load(f)
@@ -168,8 +163,8 @@ def _auto_repair_layout(layout_path):
          if "fields" not in layout or not isinstance(layout["fields"], dict):
              layout["fields"] = {}
 
-         with open(layout_path, "w", encoding="utf-8") as f:
-             json.dump(layout, f, indent=4)
+             with open(layout_path, "w", encoding="utf-8") as f:
+                 json.dump(layout, f, indent=4)
 
      except Exception:
          create_blank_layout(layout_path)
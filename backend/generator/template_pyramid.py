@@ -0,0 +1,266 @@
+import os
+import json
+import hashlib
+import threading
+from PIL import Image
+
+from generator.path_utils import get_template_folder
+
+
+# Derived levels, largest first; each is resized from the one above it.
+# The "print" level is template.png itself (full resolution, lossless).
+#   max_size: longest edge in pixels
+PYRAMID_LEVELS = (
+    {"name": "preview", "file": "preview.webp", "max_size": 1600, "format": "WEBP", "quality": 90},
+    {"name": "thumb", "file": "thumb.jpg", "max_size": 400, "format": "JPEG", "quality": 85}
+)
+
+PRINT_FILE = "template.png"
+MANIFEST_FILE = "pyramid.json"
+
+# Accepted template images, in order of preference
+SOURCE_FILES = ("template.png", "template.jpg", "template.jpeg")
+
+MIMETYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# folder -> ((path, mtime_ns, size) of template.png, manifest)
+_manifests = {}
+_lock = threading.Lock()
+
+
+# ---------------------------------------------------------
+# DECODING
+# ---------------------------------------------------------
+def decode_template_image(path):
+    """
+    Decodes a template image into the mode renders draw on:
+    - RGB for opaque templates (most imports are scans or photos)
+    - RGBA only when the template really has transparency
+    Skipping an unused alpha channel saves a quarter of the memory, and
+    encoders no longer convert every rendered page back to RGB.
+    """
+    with Image.open(path) as src:
+        if src.mode not in ("RGBA", "LA", "PA") and "transparency" not in src.info:
+            return src.convert("RGB")
+
+        image = src.convert("RGBA")
+
+    if image.getchannel("A").getextrema()[0] == 255:
+        image = image.convert("RGB")
+    return image
+
+
+# ---------------------------------------------------------
+# BUILDING
+# ---------------------------------------------------------
+def build_pyramid(folder):
+    """
+    (Re)builds every level for a template folder and writes pyramid.json:
+    {"source": sha1 of template.png,
+     "levels": [{"name", "file", "width", "height", "format"}, ...]}
+    Levels are listed largest first. A level is skipped when the
+    template is not bigger than it (the thumbnail is always made).
+    A template.jpg/jpeg without template.png is converted first, since
+    the renderers only read template.png.
+    Raises FileNotFoundError when the folder has no template image.
+    """
+    source = _source_path(folder)
+    if source is None:
+        raise FileNotFoundError(f"No template image in {folder}")
+
+    print_path = os.path.join(folder, PRINT_FILE)
+    if source != print_path:
+        with Image.open(source) as src:
+            _save_atomic(src, print_path, "PNG")
+
+    image = decode_template_image(print_path)
+    width, height = image.size
+
+    levels = [_level_entry({"name": "print", "file": PRINT_FILE, "format": "PNG"}, image)]
+
+    for n, level in enumerate(PYRAMID_LEVELS):
+        is_smallest = n == len(PYRAMID_LEVELS) - 1
+        if max(width, height) <= level["max_size"] and not is_smallest:
+            continue
+
+        image = _downscale(image, level["max_size"])
+        _save_level(image, os.path.join(folder, level["file"]), level)
+        levels.append(_level_entry(level, image))
+
+    manifest = {"source": _digest(print_path), "levels": levels}
+
+    manifest_path = os.path.join(folder, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return manifest
+
+
+def ensure_pyramid(folder):
+    """
+    Returns the manifest for a template folder, rebuilding the levels
+    when template.png changed since they were made (or one is missing).
+    Costs one stat once the folder has been checked in this process;
+    the first check hashes template.png, so fresh checkouts and copies
+    reuse levels that are still valid.
+    Returns None when the folder has no template image.
+    """
+    print_path = os.path.join(folder, PRINT_FILE)
+    signature = _stat_signature(print_path)
+
+    with _lock:
+        entry = _manifests.get(folder)
+        if entry and signature and entry[0] == signature:
+            return entry[1]
+
+    if _source_path(folder) is None:
+        return None
+
+    manifest = _read_manifest(folder)
+    if not _is_current(folder, manifest):
+        print(f"Building image pyramid for: {folder}")
+        manifest = build_pyramid(folder)
+
+    with _lock:
+        _manifests[folder] = (_stat_signature(print_path), manifest)
+
+    return manifest
+
+
+def get_template_pyramid(template_id):
+    """
+    ensure_pyramid by template id (None if the template or its image is missing).
+    """
+    folder = get_template_folder(template_id)
+    return ensure_pyramid(folder) if folder else None
+
+
+# ---------------------------------------------------------
+# LEVEL SELECTION
+# ---------------------------------------------------------
+def get_level(manifest, name):
+    """
+    The level called `name`, or the smallest larger one when that
+    level was skipped for a small template.
+    """
+    levels = manifest["levels"]
+    order = ["print"] + [level["name"] for level in PYRAMID_LEVELS]
+    wanted = order.index(name) if name in order else 0
+
+    for candidate in reversed(order[:wanted + 1]):
+        for level in levels:
+            if level["name"] == candidate:
+                return level
+    return levels[0]
+
+
+def pick_level(manifest, max_width=None, max_height=None):
+    """
+    The smallest level that still covers the template scaled to fit
+    max_width x max_height (either may be None; neither = "print").
+    """
+    full = manifest["levels"][0]
+    ratio = 1.0
+    if max_width:
+        ratio = min(ratio, max_width / full["width"])
+    if max_height:
+        ratio = min(ratio, max_height / full["height"])
+
+    need_width = round(full["width"] * ratio)
+    need_height = round(full["height"] * ratio)
+
+    for level in reversed(manifest["levels"]):
+        if level["width"] >= need_width and level["height"] >= need_height:
+            return level
+    return full
+
+
+def level_mimetype(level):
+    return MIMETYPES[level["format"]]
+
+
+def pyramid_version(manifest):
+    """
+    Short content version of a template image (for ?v= in URLs), or None.
+    """
+    return manifest["source"][:12] if manifest else None
+
+
+# ---------------------------------------------------------
+# INTERNALS
+# ---------------------------------------------------------
+def _source_path(folder):
+    for name in SOURCE_FILES:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _stat_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def _digest(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _read_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_current(folder, manifest):
+    print_path = os.path.join(folder, PRINT_FILE)
+    if not manifest or not os.path.exists(print_path):
+        return False
+    if any(not os.path.exists(os.path.join(folder, level["file"]))
+           for level in manifest.get("levels", [])):
+        return False
+    return manifest.get("source") == _digest(print_path)
+
+
+def _downscale(image, max_size):
+    ratio = min(1.0, max_size / max(image.size))
+    size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+    if size == image.size:
+        return image
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _save_level(image, path, level):
+    if level["format"] == "JPEG" and image.mode == "RGBA":
+        flat = Image.new("RGB", image.size, (255, 255, 255))
+        flat.paste(image, mask=image.getchannel("A"))
+        image = flat
+
+    _save_atomic(image, path, level["format"], quality=level.get("quality", 85))
+
+
+def _save_atomic(image, path, fmt, **options):
+    # Written aside and renamed, so readers never see a half-written level
+    tmp_path = path + ".tmp"
+    image.save(tmp_path, fmt, **options)
+    os.replace(tmp_path, path)
+
+
+def _level_entry(level, image):
+    return {
+        "name": level["name"],
+        "file": level["file"],
+        "width": image.width,
+        "height": image.height,
+        "format": level["format"]
+    }
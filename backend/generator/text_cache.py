@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+from generator.config_loader import get_setting
+
+
+class _LruCache:
+    """
+    Thread-safe LRU map with hit/miss/eviction counters.
+    The size limit is read from config.json (`setting`) on insert.
+    """
+
+    def __init__(self, setting, default_size):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._setting = setting
+        self._default_size = default_size
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            limit = self.max_entries()
+            while len(self._data) > limit:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def max_entries(self):
+        return max(1, int(get_setting(self._setting, self._default_size)))
+
+    def snapshot(self):
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / total, 3) if total else 0.0,
+                "entries": len(self._data),
+                "max_entries": self.max_entries()
+            }
+
+
+# raw text -> shaped (reshaped + bidi) text
+_shaped = _LruCache("shape_cache_size", 4096)
+
+# (font key, text, font mode, kind) -> width or bbox
+_measures = _LruCache("measure_cache_size", 16384)
+
+
+def get_shaped(text):
+    return _shaped.get(text)
+
+
+def put_shaped(text, shaped):
+    _shaped.put(text, shaped)
+
+
+def measure(font, text, mode, kind, compute):
+    """
+    Returns a cached measurement of `text` in `font`, computing it
+    with `compute()` on a miss. `kind` names the measurement
+    ("length", "bbox", ...); `mode` is the ImageDraw font mode, which
+    changes the result.
+    Fonts from font_cache carry a stable `cache_key`; other fonts are
+    not cached.
+    """
+    font_key = getattr(font, "cache_key", None)
+    if font_key is None:
+        return compute()
+
+    key = (font_key, text, mode, kind)
+    value = _measures.get(key)
+    if value is None:
+        value = compute()
+        _measures.put(key, value)
+    return value
+
+
+def clear_text_cache():
+    _shaped.clear()
+    _measures.clear()
+
+
+def text_cache_stats():
+    """
+    Counters for both caches (this process only; bulk pool workers
+    keep their own).
+    """
+    return {"shaped": _shaped.snapshot(), "measures": _measures.snapshot()}
@@ -68,6 +68,96 @@ def validate_data_row(row, layout):
     return errors
 
 
+# ---------------------------------------------------------
+# VALIDATE A WHOLE DATASET (columnar)
+# ---------------------------------------------------------
+# Placeholder for a cell whose key is absent from its row
+MISSING = object()
+
+
+def rows_to_columns(rows, names):
+    """
+    Turns a list of row dicts into {name: [value per row]}.
+    Absent keys become MISSING.
+    """
+    return {name: [row.get(name, MISSING) for row in rows] for name in names}
+
+
+def validate_columns(columns, row_count, layout):
+    """
+    Batch counterpart of validate_data_row.
+    `columns` maps field names to one value per row (a column that is
+    not there at all counts as missing in every row).
+    Each layout field is checked with one pass over its column (see
+    _blank_cells); a missing column is handled once. This is not
+    vectorized: only columns without any invalid cell take a C-level
+    fast path.
+    Returns a compact error index containing only the invalid rows:
+      { row_number (1-based): [errors...] }
+    Errors per row are the same, in the same order, as validate_data_row.
+    """
+    index = {}
+
+    for field in layout.get("fields", {}):
+        column = columns.get(field)
+        missing_msg = f"Missing field '{field}' in data row"
+
+        if column is None:
+            for i in range(1, row_count + 1):
+                index.setdefault(i, []).append(missing_msg)
+            continue
+
+        empty_msg = f"Field '{field}' is empty"
+        for i, missing in _blank_cells(column):
+            index.setdefault(i, []).append(missing_msg if missing else empty_msg)
+
+    return index
+
+
+def _blank_cells(column):
+    """
+    (row, is_missing) for the MISSING, None and blank cells of a
+    column, in row order.
+    Fast path for all-valid columns: a column of non-blank strings is
+    cleared by one all(map(str.strip, ...)) pass, which runs in C.
+    Any other column (one blank cell is enough) is scanned cell by
+    cell in Python, skipping non-blank strings without further work.
+    Picking out the blank rows with map/compress instead was measured
+    no faster than this scan.
+    """
+    try:
+        if all(map(str.strip, column)):
+            return []
+    except TypeError:
+        # Not all strings (numbers, None, MISSING)
+        pass
+
+    cells = []
+    for i, value in enumerate(column, start=1):
+        if value.__class__ is str and value.strip():
+            continue
+        if value is MISSING:
+            cells.append((i, True))
+        elif value is None or str(value).strip() == "":
+            cells.append((i, False))
+    return cells
+
+
+def validate_data_rows(rows, layout):
+    """
+    validate_columns for a list of row dicts, or for a stored
+    dataset (datasets.Dataset), which hands over its columns directly.
+    """
+    names = list(layout.get("fields", {}))
+
+    if hasattr(rows, "load_columns"):
+        columns = rows.load_columns(names)
+    else:
+        columns = rows_to_columns(rows, names)
+
+    return validate_columns(columns, len(rows), layout)
+
+
 # ---------------------------------------------------------
 # VALIDATE BEFORE RENDERING
 # ---------------------------------------------------------
@@ -0,0 +1,48 @@
+from generator.template_catalog import refresh_catalog, list_templates
+from generator.compiled_layout import get_compiled_layout
+from generator.template_cache import get_template_base, template_cache_stats
+from generator.render import load_font_file
+from generator.font_registry import refresh_font_registry
+
+
+def warm_caches():
+    """
+    Fills the per-process caches every request needs: the template
+    catalog, the font registry, compiled layouts, the fonts each layout
+    uses and the decoded template bases (up to "template_cache_mb").
+    serve.py runs this in the master process before forking, so the
+    workers start warm and share the loaded data copy-on-write.
+    Returns counts of what was loaded.
+    """
+    refresh_catalog()
+    refresh_font_registry()
+
+    loaded = {"templates": 0, "fonts": 0, "bases": 0}
+    budget = template_cache_stats()["budget_bytes"]
+
+    for template in list_templates():
+        # Remote templates are only usable once downloaded
+        if template["source"] == "remote":
+            continue
+
+        template_id = template["id"]
+        try:
+            layout = get_compiled_layout(template_id)
+        except Exception as e:
+            print(f"[WARN] Could not compile layout for {template_id}: {e}")
+            continue
+        loaded["templates"] += 1
+
+        for field in layout.fields:
+            load_font_file(field.font_path, field.size, field.variation)
+            loaded["fonts"] += 1
+
+        # Stop decoding bases once the cache would start evicting them
+        if template_cache_stats()["bytes"] < budget:
+            try:
+                get_template_base(template_id)
+                loaded["bases"] += 1
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Could not load template image for {template_id}: {e}")
+
+    return loaded
@@ -0,0 +1,124 @@
+"""
+Production server.
+
+Runs the same Flask app as app.py, but under a multi-process WSGI
+server (gunicorn, gthread workers) instead of the debug server: no
+reloader, no debugger, no browser window.
+
+The app is loaded and its caches warmed (template catalog, layouts,
+fonts, template images; see generator/warmup.py) in the master
+process before the workers are forked, so every worker starts warm
+and shares that memory copy-on-write.
+
+Tuning lives in config.json (command line flags override it):
+    server_host, server_port
+    server_workers   processes (0 = one per CPU core)
+    server_threads   threads per process
+    server_timeout   seconds before a silent worker is restarted
+    server_preload   load + warm the app before forking
+
+Bulk jobs left unfinished by the previous run are resumed once the
+workers are up ("resume_jobs_on_start"); each job is taken by one
+worker.
+
+On Windows, where gunicorn does not run, waitress is used instead
+(one process, server_threads threads).
+
+Usage (from backend/):
+    python serve.py [--host 0.0.0.0] [--port 8000] [--workers 4] [--threads 8]
+"""
+import os
+import sys
+import argparse
+
+from generator.config_loader import get_setting
+
+
+def load_app():
+    """
+    Imports the Flask app and fills its caches.
+    """
+    from app import app
+    from generator.warmup import warm_caches
+
+    loaded = warm_caches()
+    print(
+        f"Preloaded {loaded['templates']} templates, {loaded['fonts']} fonts, "
+        f"{loaded['bases']} template images"
+    )
+    return app
+
+
+def server_options(args):
+    workers = args.workers if args.workers is not None else int(get_setting("server_workers", 0))
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+
+    return {
+        "host": args.host or get_setting("server_host", "127.0.0.1"),
+        "port": args.port or int(get_setting("server_port", 5000)),
+        "workers": workers,
+        "threads": max(1, args.threads or int(get_setting("server_threads", 4))),
+        "timeout": int(get_setting("server_timeout", 120)),
+        "preload": bool(get_setting("server_preload", True))
+    }
+
+
+def resume_jobs(worker=None):
+    """
+    Resumes interrupted bulk jobs (in each worker, after forking:
+    job threads must not start in the gunicorn master).
+    """
+    from app import resume_jobs as resume
+
+    resume()
+
+
+def run_gunicorn(options):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{options['host']}:{options['port']}")
+            self.cfg.set("workers", options["workers"])
+            self.cfg.set("threads", options["threads"])
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("timeout", options["timeout"])
+            self.cfg.set("preload_app", options["preload"])
+            self.cfg.set("post_worker_init", resume_jobs)
+
+        def load(self):
+            return load_app()
+
+    Server().run()
+
+
+def run_waitress(options):
+    from waitress import serve
+
+    app = load_app()
+    resume_jobs()
+    serve(app, host=options["host"], port=options["port"], threads=options["threads"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run CertiForge Studio in production mode")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--threads", type=int)
+    options = server_options(parser.parse_args())
+
+    print(
+        f"Serving on http://{options['host']}:{options['port']}/ "
+        f"({options['workers']} workers x {options['threads']} threads)"
+    )
+
+    if sys.platform == "win32":
+        run_waitress(options)
+    else:
+        run_gunicorn(options)
+
+
+if __name__ == "__main__":
+    main()
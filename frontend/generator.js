@@ -5,7 +5,7 @@
 let templateId = null;
 let templateMeta = null;
 let fieldNames = [];
-let csvData = [];
+let datasetId = null;
 let csvHeaders = [];
 
 /* DOM ELEMENTS */
@@ -42,7 +42,9 @@ async function loadTemplateInfo() {
     document.getElementById("templateSize").innerText =
         `${templateMeta.width} × ${templateMeta.height}`;
 
-    previewImage.src = `/templates/${templateId}/preview?ts=${Date.now()}`;
+    previewImage.src = templateMeta.version
+        ? `/templates/${templateId}/preview?v=${templateMeta.version}`
+        : `/templates/${templateId}/preview`;
 
     // Load layout fields
     const layoutRes = await fetch(`/templates/${templateId}/layout`);
@@ -119,28 +121,36 @@ function switchTab(tab) {
 }
 
 /* ============================================================
-   CSV UPLOAD + PARSE
+   CSV / XLSX UPLOAD (parsed and stored server-side)
 ============================================================ */
 
 document.getElementById("csvFile").addEventListener("change", async (e) => {
     const file = e.target.files[0];
     if (!file) return;
 
-    const text = await file.text();
-    parseCSV(text);
+    await uploadDataset(file);
     buildMappingUI();
 });
 
-function parseCSV(text) {
-    const rows = text.split("\n").map(r => r.trim()).filter(r => r.length);
+async function uploadDataset(file) {
+    datasetId = null;
+    csvHeaders = [];
+    bulkProgress.innerText = "Uploading...";
 
-    csvHeaders = rows[0].split(",");
-    csvData = rows.slice(1).map(row => {
-        const values = row.split(",");
-        const obj = {};
-        csvHeaders.forEach((h, i) => obj[h] = values[i] || "");
-        return obj;
-    });
+    const form = new FormData();
+    form.append("file", file);
+
+    const res = await fetch("/datasets", { method: "POST", body: form });
+    const dataset = await res.json();
+
+    if (!res.ok) {
+        bulkProgress.innerText = dataset.error || "Upload failed";
+        return;
+    }
+
+    datasetId = dataset.dataset_id;
+    csvHeaders = dataset.columns;
+    bulkProgress.innerText = `${dataset.rows} rows loaded`;
 }
 
 /* ============================================================
@@ -178,40 +188,84 @@ function buildMappingUI() {
    BULK GENERATION
 ============================================================ */
 
+let currentJobId = null;
+
 async function generateBulk() {
-    if (csvData.length === 0) {
+    if (!datasetId) {
         alert("Upload a CSV first");
         return;
     }
 
-    bulkProgress.innerText = "Generating...";
+    bulkProgress.innerText = "Submitting...";
 
     const mapping = {};
     fieldNames.forEach(name => {
         mapping[name] = document.getElementById("map_" + name).value;
     });
 
-    const res = await fetch("/generate/bulk", {
+    // The server renames dataset columns to layout field names
+    const res = await fetch("/jobs", {
         method: "POST",
         headers: {"Content-Type": "application/json"},
         body: JSON.stringify({
             template_id: templateId,
+            dataset_id: datasetId,
             mapping,
-            rows: csvData
+            output: "zip"
         })
     });
 
-    const blob = await res.blob();
-    const url = URL.createObjectURL(blob);
+    const job = await res.json();
+    if (!res.ok) {
+        bulkProgress.innerText = job.error || "Failed to start job";
+        return;
+    }
 
-    bulkProgress.innerText = "Done! Downloading ZIP...";
+    currentJobId = job.job_id;
+    watchJob(currentJobId);
+}
 
+/* ============================================================
+   JOB PROGRESS (Server-Sent Events)
+============================================================ */
+
+function watchJob(jobId) {
+    const events = new EventSource(`/jobs/${jobId}/events`);
+
+    events.onmessage = (e) => {
+        const job = JSON.parse(e.data);
+        if (!job) {
+            events.close();
+            return;
+        }
+
+        const processed = job.done + job.failed;
+        const eta = job.eta_seconds !== null ? `, ETA ${Math.ceil(job.eta_seconds)}s` : "";
+
+        bulkProgress.innerText =
+            `${job.status}: ${processed}/${job.total} ` +
+            `(${job.failed} failed, ${job.rows_per_sec} rows/s${eta})`;
+
+        if (["completed", "cancelled", "failed"].includes(job.status)) {
+            events.close();
+            if (job.error) bulkProgress.innerText += ` - ${job.error}`;
+            if (job.status !== "failed") downloadArchive(jobId);
+        }
+    };
+
+    events.onerror = () => events.close();
+}
+
+function downloadArchive(jobId) {
     const a = document.createElement("a");
-    a.href = url;
+    a.href = `/jobs/${jobId}/archive`;
     a.download = "certificates.zip";
     a.click();
+}
 
-    bulkProgress.innerText = "Completed.";
+async function cancelBulk() {
+    if (!currentJobId) return;
+    await fetch(`/jobs/${currentJobId}/cancel`, { method: "POST" });
 }
 
 /* ============================================================
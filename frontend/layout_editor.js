@@ -6,6 +6,7 @@ console.log("Editor booting...");
 let currentTemplate = null;
 let layout = {}; 
 let selectedField = null;
+let templateImageUrl = null;   // object URL of the loaded template preview
 
 const canvasWrapper = document.getElementById("canvasWrapper");
 const canvasInner = document.getElementById("canvasInner");
@@ -73,25 +74,35 @@ async function loadTemplateFromServer(id) {
   selectedField = null;
   canvas.innerHTML = "";
 
-  const img = new Image();
-  img.src = `/templates/${encodeURIComponent(id)}/preview?ts=${Date.now()}`;
-
+  // The editor-sized pyramid level is shown, stretched over a canvas
+  // at the template's full resolution (X-Template-Size), so field
+  // coordinates stay in template pixels
+  let width, height, src;
   try {
-    await img.decode();
+    const res = await fetch(`/templates/${encodeURIComponent(id)}/preview`, { cache: "no-cache" });
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+
+    src = URL.createObjectURL(await res.blob());
+    const img = await loadImage(src);
+    [width, height] = (res.headers.get("X-Template-Size") || `${img.width}x${img.height}`)
+      .split("x").map(Number);
   } catch (e) {
     alert("Failed to load template image");
     return;
   }
 
-  canvas.style.width = img.width + "px";
-  canvas.style.height = img.height + "px";
-  canvas.style.backgroundImage = `url(${img.src})`;
+  if (templateImageUrl) URL.revokeObjectURL(templateImageUrl);
+  templateImageUrl = src;
+
+  canvas.style.width = width + "px";
+  canvas.style.height = height + "px";
+  canvas.style.backgroundImage = `url(${src})`;
 
   canvasInner.style.width = canvas.style.width;
   canvasInner.style.height = canvas.style.height;
 
   try {
-    const res = await fetch(`/templates/${encodeURIComponent(id)}/layout?ts=${Date.now()}`);
+    const res = await fetch(`/templates/${encodeURIComponent(id)}/layout`, { cache: "no-cache" });
     const data = await res.json();
     layout = data.layout?.fields || {};
   } catch (e) {
@@ -446,31 +457,19 @@ function generatePreview() {
   const modal = document.getElementById("previewModal");
   const imgEl = document.getElementById("previewImage");
 
-  // Hide editor UI
-  setEditorVisuals(false);
-
-  const clone = canvasInner.cloneNode(true);
-  clone.style.transform = "scale(1)";
-  clone.style.position = "absolute";
-  clone.style.left = "0";
-  clone.style.top = "0";
-
-  const temp = document.createElement("div");
-  temp.style.position = "fixed";
-  temp.style.left = "-9999px";
-  temp.style.top = "0";
-  temp.appendChild(clone);
-  document.body.appendChild(temp);
-
-  html2canvas(clone, { backgroundColor: null }).then(canvasOutput => {
-    imgEl.src = canvasOutput.toDataURL("image/png");
-    modal.classList.remove("hidden");
+  // Server templates: rendered by the backend, only changed regions re-sent
+  if (currentTemplate && currentTemplate !== "local" && currentTemplate !== "blank") {
+    renderServerPreview(imgEl)
+      .then(() => modal.classList.remove("hidden"))
+      .catch(err => {
+        console.warn("server preview failed, using local render", err);
+        previewSession = null;
+        renderLocalPreview(imgEl, modal);
+      });
+  } else {
+    renderLocalPreview(imgEl, modal);
+  }
 
-    // Restore editor UI
-    setEditorVisuals(true);
-
-    document.body.removeChild(temp);
-  });
 
   document.getElementById("btnDownload").onclick = () => {
     const img = document.getElementById("previewImage").src;
@@ -512,6 +511,99 @@ function generatePreview() {
 };
 
 
+}
+
+// ===============================
+// Preview renderers
+// ===============================
+// Incremental backend preview: { id, template, canvas }.
+// The session is kept server-side; each update returns
+// only the tile that changed (X-Dirty-Box), drawn onto this canvas.
+let previewSession = null;
+
+async function renderServerPreview(imgEl) {
+  // Each field is previewed with its name, as labelled in the editor
+  const data = Object.fromEntries(Object.keys(layout).map(name => [name, name]));
+  const body = { layout: { fields: layout }, data };
+
+  if (!previewSession || previewSession.template !== currentTemplate) {
+    const res = await fetch("/preview/sessions", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ template_id: currentTemplate, ...body })
+    });
+    if (!res.ok) throw new Error(`preview session failed (${res.status})`);
+    const info = await res.json();
+
+    const out = document.createElement("canvas");
+    out.width = info.width;
+    out.height = info.height;
+    previewSession = { id: info.session_id, template: currentTemplate, canvas: out };
+
+    const full = await loadImage(info.image);
+    out.getContext("2d").drawImage(full, 0, 0);
+  } else {
+    const res = await fetch(`/preview/sessions/${previewSession.id}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body)
+    });
+    // Idle sessions expire on the server (after 30 minutes, or when
+    // newer ones push them out); start a fresh one
+    if (res.status === 404) {
+      previewSession = null;
+      return renderServerPreview(imgEl);
+    }
+    if (!res.ok) throw new Error(`preview update failed (${res.status})`);
+
+    if (res.status !== 204) {
+      const [x0, y0] = res.headers.get("X-Dirty-Box").split(",").map(Number);
+      const url = URL.createObjectURL(await res.blob());
+      try {
+        const tile = await loadImage(url);
+        previewSession.canvas.getContext("2d").drawImage(tile, x0, y0);
+      } finally {
+        URL.revokeObjectURL(url);
+      }
+    }
+  }
+
+  imgEl.src = previewSession.canvas.toDataURL("image/png");
+}
+
+function loadImage(src) {
+  const img = new Image();
+  img.src = src;
+  return img.decode().then(() => img);
+}
+
+// Client-side render of the editor canvas (local / blank templates)
+function renderLocalPreview(imgEl, modal) {
+  // Hide editor UI
+  setEditorVisuals(false);
+
+  const clone = canvasInner.cloneNode(true);
+  clone.style.transform = "scale(1)";
+  clone.style.position = "absolute";
+  clone.style.left = "0";
+  clone.style.top = "0";
+
+  const temp = document.createElement("div");
+  temp.style.position = "fixed";
+  temp.style.left = "-9999px";
+  temp.style.top = "0";
+  temp.appendChild(clone);
+  document.body.appendChild(temp);
+
+  html2canvas(clone, { backgroundColor: null }).then(canvasOutput => {
+    imgEl.src = canvasOutput.toDataURL("image/png");
+    modal.classList.remove("hidden");
+
+    // Restore editor UI
+    setEditorVisuals(true);
+
+    document.body.removeChild(temp);
+  });
 }
 
   // Shows final resutls in preview
@@ -42,6 +42,13 @@ async function loadTemplates() {
    RENDER GRID
 ============================================================ */
 
+// Image URLs carry the template's content version, so the browser
+// keeps thumbnails and previews until the template image changes
+function templateImageUrl(tpl, level) {
+    const url = `/templates/${tpl.id}/${level}`;
+    return tpl.version ? `${url}?v=${tpl.version}` : url;
+}
+
 function renderGrid(list) {
     grid.innerHTML = "";
 
@@ -52,7 +59,7 @@ function renderGrid(list) {
 
         const thumb = document.createElement("div");
         thumb.className = "templateThumb";
-        thumb.style.backgroundImage = `url(/templates/${tpl.id}/thumb?ts=${Date.now()})`;
+        thumb.style.backgroundImage = `url(${templateImageUrl(tpl, "thumb")})`;
 
         const info = document.createElement("div");
         info.className = "templateInfo";
@@ -98,7 +105,7 @@ function openDetails(tpl) {
     selectedTemplate = tpl;
 
     detailsName.innerText = tpl.name;
-    detailsPreview.src = `/templates/${tpl.id}/preview?ts=${Date.now()}`;
+    detailsPreview.src = templateImageUrl(tpl, "preview");
 
     metaId.innerText = tpl.id;
     metaSize.innerText = `${tpl.width} × ${tpl.height}`;